@@ -0,0 +1,136 @@
+import os
+import time
+import shutil
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 默认并发线程数（data目录在网络共享上时，每次stat/读取都是一次网络往返）
+IO_WORKERS = 8
+
+
+def _copy(pair):
+    src_path, dest_path = pair
+    shutil.copy2(src_path, dest_path)
+    return dest_path
+
+
+class AsyncFileIO:
+    """
+    使用 asyncio 和有界线程池并发执行 stat、读取、复制等阻塞文件操作
+
+    同步代码通过 map()/stat_many()/copy_many() 调用；已在事件循环中的代码可直接 await gather()。
+    结果顺序与输入顺序一致，单项失败时对应位置返回异常对象而不是抛出
+    """
+
+    def __init__(self, workers=IO_WORKERS):
+        self.workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='file_io')
+        self._loop = None
+
+    def _call(self, func, item):
+        return func(item)
+
+    def _call_safe(self, func, item):
+        try:
+            return self._call(func, item)
+        except Exception as e:
+            return e
+
+    async def gather(self, func, items):
+        """
+        在线程池中并发执行 func(item)，返回结果列表
+        """
+        loop = asyncio.get_running_loop()
+        futures = [loop.run_in_executor(self._executor, self._call_safe, func, item) for item in items]
+        return await asyncio.gather(*futures)
+
+    def map(self, func, items):
+        """
+        同步接口：并发执行 func(item)，返回结果列表（失败项为异常对象）
+        """
+        items = list(items)
+        # 单个操作或单线程时直接执行，省去事件循环调度
+        if len(items) <= 1 or self.workers == 1:
+            return [self._call_safe(func, item) for item in items]
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(self.gather(func, items))
+
+    def stat_many(self, paths):
+        """
+        并发获取文件状态，失败的位置返回None
+        """
+        return [None if isinstance(result, Exception) else result for result in self.map(os.stat, paths)]
+
+    def copy_many(self, pairs, copier=None):
+        """
+        并发复制 [(源路径, 目标路径)]，返回目标路径或异常对象
+
+        copier(源路径, 目标路径) 可替换默认的 shutil.copy2
+        """
+        # 相同的复制只执行一次，避免多个线程同时写同一个目标文件
+        unique_pairs = list(dict.fromkeys(pairs))
+        func = _copy if copier is None else (lambda pair: copier(*pair))
+        results = dict(zip(unique_pairs, self.map(func, unique_pairs)))
+        return [results[pair] for pair in pairs]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._loop is not None:
+            self._loop.close()
+            self._loop = None
+
+
+class LatencyFileIO(AsyncFileIO):
+    """
+    每次文件操作前等待固定延迟，在本地目录上模拟网络共享，用于测试和基准测试
+    """
+
+    def __init__(self, latency=0.01, workers=IO_WORKERS):
+        super().__init__(workers)
+        self.latency = latency
+
+    def _call(self, func, item):
+        time.sleep(self.latency)
+        return func(item)
+
+
+_file_io = None
+
+
+def get_file_io():
+    """
+    返回当前使用的文件操作层（首次调用时按默认配置创建）
+    """
+    global _file_io
+    if _file_io is None:
+        _file_io = AsyncFileIO()
+    return _file_io
+
+
+def configure_file_io(workers=IO_WORKERS, latency=0.0):
+    """
+    重新配置文件操作层；latency 大于0时使用 LatencyFileIO 模拟网络延迟
+    """
+    global _file_io
+    if _file_io is not None:
+        _file_io.close()
+    if latency > 0:
+        _file_io = LatencyFileIO(latency, workers)
+        logger.info("文件操作模拟延迟: %.1f 毫秒", latency * 1000)
+    else:
+        _file_io = AsyncFileIO(workers)
+    return _file_io
+
+
+def add_io_arguments(parser):
+    """
+    为命令行解析器添加 --io-workers 和 --io-latency 参数
+    """
+    parser.add_argument('--io-workers', type=int, default=IO_WORKERS,
+                        help=f'并发文件操作线程数，默认{IO_WORKERS}（设为1则顺序执行）')
+    parser.add_argument('--io-latency', type=float, default=0.0,
+                        help='每次文件操作前注入的延迟（秒），用于在本地目录模拟网络共享')
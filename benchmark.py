@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+from contextlib import contextmanager
+
+from openpyxl import Workbook
+
+from synthetic_data import generate_batch
+from extract_zip_files import start_extract_zip
+from run_metrics import METRICS
+from log_utils import setup_logging
+from async_io import configure_file_io, add_io_arguments
+import process_NG
+import image_selection
+
+
+# 默认测试规模：(SN数量, 每个SN的图片数量)
+DEFAULT_SCALES = [(20, 20), (100, 20), (300, 40)]
+
+# 与基准结果对比时允许的最大变慢比例
+DEFAULT_TOLERANCE = 0.25
+
+
+@contextmanager
+def working_directory(path):
+    """
+    临时切换工作目录（各脚本均使用相对路径 zip/ data/ result/）
+    """
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def _timed(func, *args, repeat=1):
+    """
+    执行函数并返回 (最短耗时, 最后一次返回值)
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def _bench_format_excel(rows):
+    """
+    构造与报表相同列结构的工作表，单独测量 format_excel
+    """
+    wb = Workbook()
+    sheet = wb.active
+    sheet.append(['SN', 'QPL-Station Name', 'Gantry', 'Time(end)',
+                  'Locate picture', 'NG picture', 'NG picture1', 'Remark'])
+    for index in range(rows):
+        sheet.append([f"SN{index:06d}", 'STATION', None, '2025-08-17 04:32:03', None, None, None, ''])
+    start = time.perf_counter()
+    process_NG.format_excel(sheet)
+    return time.perf_counter() - start
+
+
+def run_scale(n_sns, images_per_sn, device_type='660', repeat=3, seed=0):
+    """
+    在临时目录中生成一批数据并测量各函数耗时，返回 {名称: 秒}
+    """
+    results = {}
+    root = tempfile.mkdtemp(prefix='ng_bench_')
+    try:
+        input_file, sns = generate_batch(root, n_sns, images_per_sn, seed=seed)
+        with working_directory(root):
+            results['start_extract_zip'], _ = _timed(start_extract_zip)
+
+            # find_sn_folders：逐个SN查找文件夹
+            start = time.perf_counter()
+            folders = [process_NG.find_sn_folders(sn) for sn in sns]
+            results['find_sn_folders'] = time.perf_counter() - start
+
+            # find_all_images_in_folder：遍历所有找到的文件夹
+            folder_paths = [found[0] for found in folders if len(found) == 1]
+            results['find_all_images_in_folder'], _ = _timed(
+                lambda: [image_selection.find_all_images_in_folder(folder) for folder in folder_paths],
+                repeat=repeat)
+
+            results['extract_columns'], _ = _timed(process_NG.extract_columns, device_type, input_file)
+            results['format_excel'] = min(_bench_format_excel(n_sns) for _ in range(repeat))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def parse_scales(text):
+    """
+    解析规模参数，例如 "20x20,100x20"
+    """
+    scales = []
+    for item in text.split(','):
+        n_sns, images = item.lower().split('x')
+        scales.append((int(n_sns), int(images)))
+    return scales
+
+
+def compare_with_baseline(report, baseline, tolerance):
+    """
+    与基准结果比较，返回变慢超过容忍度的项目列表
+    """
+    regressions = []
+    for scale, timings in report['results'].items():
+        for name, seconds in timings.items():
+            old = baseline.get('results', {}).get(scale, {}).get(name)
+            # 太短的耗时波动大，不参与比较
+            if old and old > 0.01 and seconds > old * (1 + tolerance):
+                regressions.append((scale, name, old, seconds))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='合成数据性能基准测试')
+    parser.add_argument('--scales', default=None, help='测试规模，例如 20x20,100x20（SN数量x每个SN图片数）')
+    parser.add_argument('--device-type', default='660', choices=process_NG.DEVICE_TYPES, help='设备类型')
+    parser.add_argument('--repeat', type=int, default=3, help='可重复测量项目的重复次数（取最短）')
+    parser.add_argument('--output', default=None, help='结果JSON输出路径')
+    parser.add_argument('--baseline', default=None, help='基准结果JSON，用于检测性能退化')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='允许的变慢比例，默认0.25')
+    add_io_arguments(parser)
+    args = parser.parse_args()
+
+    # 基准测试期间只输出警告
+    setup_logging(quiet=True)
+    configure_file_io(args.io_workers, args.io_latency)
+
+    scales = parse_scales(args.scales) if args.scales else DEFAULT_SCALES
+    report = {'device_type': args.device_type, 'python': sys.version.split()[0],
+              'io_workers': args.io_workers, 'io_latency': args.io_latency, 'results': {}}
+
+    for n_sns, images_per_sn in scales:
+        METRICS.reset()
+        key = f"{n_sns}x{images_per_sn}"
+        timings = run_scale(n_sns, images_per_sn, args.device_type, args.repeat)
+        report['results'][key] = {name: round(seconds, 6) for name, seconds in timings.items()}
+
+        print(f"\n规模 {key}（{n_sns} 个SN，每个 {images_per_sn} 张图片）")
+        for name, seconds in timings.items():
+            print(f"  {name:<28} {seconds:>9.3f} 秒")
+        per_sn = timings['extract_columns'] / max(n_sns, 1)
+        print(f"  {'extract_columns / SN':<28} {per_sn * 1000:>9.2f} 毫秒")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print("\n检测到性能退化:")
+            for scale, name, old, new in regressions:
+                print(f"  [{scale}] {name}: {old:.3f} 秒 -> {new:.3f} 秒")
+            sys.exit(1)
+        print("\n未检测到性能退化")
@@ -0,0 +1,381 @@
+import os
+import re
+import sqlite3
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 目录数据库放在result目录中，不随data目录一起清空，重新解压后更新并删除已不存在的文件夹和图片
+CATALOG_DIR = 'result'
+CATALOG_NAME = 'catalog.sqlite3'
+
+# 文件夹名称子串查找使用的 n-gram 长度
+NGRAM = 3
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# 图片文件名规则，例如:
+# RH660-J5QHKC003GK0000UHY-Recheck-20250817043203-Station115-NG-CAP_20250817043235174_e4a8f645.jpg
+IMAGE_NAME_PATTERN = re.compile(
+    r'^(?P<model>[A-Za-z0-9]+)-(?P<sn>[A-Za-z0-9]+)-(?P<phase>Original|Recheck)-(?P<capture_ts>\d{14})'
+    r'-Station(?P<station>\d+)-(?P<verdict>OK|NG)-(?P<kind>CAP|SRC)'
+    r'(?:_(?P<burst_ts>\d{17})_(?P<burst_id>[0-9A-Fa-f]+))?\.(?:jpg|jpeg|png)$',
+    re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    id INTEGER PRIMARY KEY,
+    zip_path TEXT NOT NULL,
+    extract_dir TEXT NOT NULL,
+    depth INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS folders (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    sn TEXT,
+    archive_id INTEGER REFERENCES archives(id)
+);
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    folder_id INTEGER NOT NULL REFERENCES folders(id),
+    path TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    ext_order INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    sn TEXT,
+    model TEXT,
+    phase TEXT,
+    capture_ts TEXT,
+    station INTEGER,
+    verdict TEXT,
+    kind TEXT,
+    burst_ts TEXT
+);
+CREATE TABLE IF NOT EXISTS folder_grams (
+    gram TEXT NOT NULL,
+    folder_id INTEGER NOT NULL REFERENCES folders(id)
+);
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_folders_sn ON folders(sn);
+CREATE INDEX IF NOT EXISTS idx_folder_grams ON folder_grams(gram, folder_id);
+CREATE INDEX IF NOT EXISTS idx_images_folder ON images(folder_id);
+CREATE INDEX IF NOT EXISTS idx_images_sn ON images(sn);
+CREATE INDEX IF NOT EXISTS idx_images_station ON images(station);
+"""
+
+# 已打开的目录连接，以及建立完成时对应的data目录（绝对路径）
+_catalog = {'conn': None, 'data_root': None}
+
+
+def parse_image_name(name):
+    """
+    解析图片文件名中的字段，不符合命名规则时返回空字典
+    """
+    match = IMAGE_NAME_PATTERN.match(name)
+    if not match:
+        return {}
+    fields = match.groupdict()
+    fields['station'] = int(fields['station'])
+    fields['verdict'] = fields['verdict'].upper()
+    fields['kind'] = fields['kind'].upper()
+    return fields
+
+
+def _folder_sn(folder_name):
+    """
+    文件夹名的第一个字段为SN，例如 J5QHKC003GK0000UHY_B788_GTBN_A03-4FT-02A_RH660_2_20250817043203
+    """
+    return folder_name.split('_', 1)[0] or None
+
+
+def _ext_order(name):
+    """
+    与 find_all_images_in_folder 的扩展名查找顺序保持一致（jpg, jpeg, png）
+    """
+    lower_name = name.lower()
+    for index, ext in enumerate(IMAGE_EXTENSIONS):
+        if lower_name.endswith(ext):
+            return index
+    return len(IMAGE_EXTENSIONS)
+
+
+def catalog_path():
+    return os.path.join(CATALOG_DIR, CATALOG_NAME)
+
+
+def _connect():
+    """
+    打开（必要时新建）目录数据库，连接在本次运行中复用
+    """
+    conn = _catalog['conn']
+    if conn is None:
+        os.makedirs(CATALOG_DIR, exist_ok=True)
+        conn = sqlite3.connect(catalog_path())
+        conn.executescript(SCHEMA)
+        row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'data_root'").fetchone()
+        _catalog['conn'] = conn
+        _catalog['data_root'] = row[0] if row else None
+    return conn
+
+
+def _set_data_root(conn, data_root):
+    """
+    记录目录对应的data目录，None 表示data目录正在重建、目录尚不可用
+    """
+    if data_root is None:
+        conn.execute("DELETE FROM catalog_meta WHERE key = 'data_root'")
+    else:
+        conn.execute("INSERT OR REPLACE INTO catalog_meta (key, value) VALUES ('data_root', ?)", (data_root,))
+    _catalog['data_root'] = data_root
+
+
+def close_catalog():
+    """
+    关闭已缓存的目录连接
+    """
+    conn = _catalog['conn']
+    if conn is not None:
+        conn.close()
+    _catalog['conn'] = None
+    _catalog['data_root'] = None
+
+
+def open_catalog(data_dir='data'):
+    """
+    打开data目录的目录数据库；不存在、尚未建立完成或记录的是其他data目录时返回None
+    """
+    if _catalog['conn'] is None and not os.path.exists(catalog_path()):
+        return None
+    if not os.path.isdir(data_dir):
+        return None
+    conn = _connect()
+    if _catalog['data_root'] != os.path.abspath(data_dir):
+        return None
+    return conn
+
+
+def invalidate_catalog():
+    """
+    清空data目录之前调用：目录在重新建立完成之前不再使用（中断后不会用到已删除的文件夹）
+    """
+    if _catalog['conn'] is None and not os.path.exists(catalog_path()):
+        return
+    conn = _connect()
+    with conn:
+        _set_data_root(conn, None)
+
+
+def _name_grams(name):
+    lower = name.lower()
+    return {lower[i:i + NGRAM] for i in range(len(lower) - NGRAM + 1)}
+
+
+class _CatalogWriter:
+    """
+    更新目录数据库：登记本次解压（或遍历）得到的文件夹和图片，已登记的文件夹保留原来的ID，
+    结束时删除本次没有出现的文件夹和图片（已不存在于data目录中）
+    """
+
+    def __init__(self, data_dir):
+        self.conn = _connect()
+        self.data_dir = data_dir
+        self.data_root = os.path.normpath(data_dir)
+        self.existing_folders = dict(self.conn.execute("SELECT path, id FROM folders"))
+        self.existing_images = {row[0] for row in self.conn.execute("SELECT path FROM images")}
+        self.folder_ids = {}
+        self.archive_ids = {}
+        self.image_paths = set()
+        self.conn.execute("DELETE FROM archives")
+
+    def add_archive(self, zip_path, extract_dir, depth):
+        cursor = self.conn.execute("INSERT INTO archives (zip_path, extract_dir, depth) VALUES (?, ?, ?)",
+                                   (os.path.normpath(zip_path), os.path.normpath(extract_dir), depth))
+        self.archive_ids[os.path.normpath(extract_dir)] = cursor.lastrowid
+        self.add_folder(extract_dir, cursor.lastrowid)
+
+    def add_folder(self, folder_path, archive_id):
+        """
+        登记文件夹，返回文件夹ID
+        """
+        folder_path = os.path.normpath(folder_path)
+        if folder_path in self.folder_ids:
+            return self.folder_ids[folder_path]
+
+        folder_id = self.existing_folders.get(folder_path)
+        if folder_id is not None:
+            self.conn.execute("UPDATE folders SET archive_id = ? WHERE id = ?", (archive_id, folder_id))
+        else:
+            name = os.path.basename(folder_path)
+            cursor = self.conn.execute("INSERT INTO folders (path, name, sn, archive_id) VALUES (?, ?, ?, ?)",
+                                       (folder_path, name, _folder_sn(name), archive_id))
+            folder_id = cursor.lastrowid
+            self.conn.executemany("INSERT INTO folder_grams (gram, folder_id) VALUES (?, ?)",
+                                  [(gram, folder_id) for gram in _name_grams(name)])
+        self.folder_ids[folder_path] = folder_id
+        return folder_id
+
+    def add_folder_chain(self, folder):
+        """
+        登记文件夹及其上级目录（直到压缩包解压目录或data目录），返回文件夹ID
+        """
+        folder = os.path.normpath(folder)
+        chain = []
+        current = folder
+        while current not in self.folder_ids and current != self.data_root and current not in ('', os.sep):
+            chain.append(current)
+            current = os.path.dirname(current)
+        archive_id = self.archive_ids.get(current)
+        for path in reversed(chain):
+            self.add_folder(path, archive_id)
+        return self.folder_ids.get(folder)
+
+    def add_image(self, folder_id, img_path, stat):
+        name = os.path.basename(img_path)
+        fields = parse_image_name(name)
+        img_path = os.path.normpath(img_path)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO images (folder_id, path, name, ext_order, size, mtime, sn, model, phase, "
+            "capture_ts, station, verdict, kind, burst_ts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (folder_id, img_path, name, _ext_order(name), stat.st_size, stat.st_mtime,
+             fields.get('sn'), fields.get('model'),
+             fields.get('phase'), fields.get('capture_ts'), fields.get('station'), fields.get('verdict'),
+             fields.get('kind'), fields.get('burst_ts')))
+        self.image_paths.add(img_path)
+
+    def finish(self):
+        """
+        删除本次没有出现的文件夹和图片，并记录目录对应的data目录
+        """
+        stale_images = self.existing_images - self.image_paths
+        self.conn.executemany("DELETE FROM images WHERE path = ?", [(path,) for path in stale_images])
+        stale_folders = [(folder_id,) for path, folder_id in self.existing_folders.items()
+                         if path not in self.folder_ids]
+        self.conn.executemany("DELETE FROM folder_grams WHERE folder_id = ?", stale_folders)
+        self.conn.executemany("DELETE FROM folders WHERE id = ?", stale_folders)
+        _set_data_root(self.conn, os.path.abspath(self.data_dir))
+        if stale_folders or stale_images:
+            logger.info("已从图片目录中删除不存在的 %d 个文件夹, %d 张图片", len(stale_folders), len(stale_images))
+
+
+def build_catalog_from_state(state, data_dir='data'):
+    """
+    根据解压记录（ExtractionState）更新目录，不需要遍历data目录
+    """
+    writer = _CatalogWriter(data_dir)
+    with writer.conn:
+        for zip_path, extract_dir, depth in state.archives:
+            writer.add_archive(zip_path, extract_dir, depth)
+
+        # 解压时创建的所有目录（包括没有图片的目录，查找SN时与遍历data目录的结果一致）
+        for directory in state.directories:
+            writer.add_folder_chain(directory)
+
+        for img_path in state.images:
+            # 登记图片所在目录及其上级目录（直到压缩包解压目录或data目录）
+            folder_id = writer.add_folder_chain(os.path.dirname(img_path))
+
+            try:
+                stat = os.stat(img_path)
+            except OSError:
+                continue
+            writer.add_image(folder_id, img_path, stat)
+        writer.finish()
+
+    logger.info("已建立图片目录: %d 个文件夹, %d 张图片", len(writer.folder_ids), len(writer.image_paths))
+    return writer.conn
+
+
+def build_catalog_from_disk(data_dir='data'):
+    """
+    遍历一次data目录更新目录（用于未经过解压流程的data目录）
+    """
+    writer = _CatalogWriter(data_dir)
+    with writer.conn:
+        for root, dirs, files in os.walk(data_dir):
+            root = os.path.normpath(root)
+            if root == writer.data_root:
+                continue
+            folder_id = writer.add_folder(root, None)
+            for file in files:
+                if not file.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                img_path = os.path.join(root, file)
+                try:
+                    stat = os.stat(img_path)
+                except OSError:
+                    continue
+                writer.add_image(folder_id, img_path, stat)
+        writer.finish()
+
+    logger.info("已建立图片目录: %d 个文件夹, %d 张图片", len(writer.folder_ids), len(writer.image_paths))
+    return writer.conn
+
+
+def lookup_sn_folders(conn, sn):
+    """
+    查找名称中包含SN的文件夹（子串匹配，与遍历data目录的结果一致），按登记顺序返回
+
+    先按SN字段精确查找（走索引）；名称中其他位置包含SN的文件夹（例如SN ABC123 与 ABC1234_y）
+    通过名称的 n-gram 索引查找，这样多个文件夹匹配的错误不会被漏掉。
+    SN比 n-gram 短时才逐个检查文件夹名称
+    """
+    folders = dict(conn.execute("SELECT id, path FROM folders WHERE sn = ?", (sn,)))
+
+    if len(sn) >= NGRAM:
+        # 每隔 NGRAM 个字符取一个 n-gram（加上最后一个）即可覆盖整个SN，候选文件夹再按名称确认
+        lower = sn.lower()
+        grams = sorted({lower[i:i + NGRAM] for i in range(0, len(lower) - NGRAM + 1, NGRAM)} |
+                       {lower[-NGRAM:]})
+        marks = ", ".join("?" * len(grams))
+        rows = conn.execute(
+            f"SELECT id, path, name FROM folders WHERE id IN (SELECT folder_id FROM folder_grams "
+            f"WHERE gram IN ({marks}) GROUP BY folder_id HAVING COUNT(*) = ?)", grams + [len(grams)])
+    else:
+        like = '%' + sn.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        rows = conn.execute("SELECT id, path, name FROM folders WHERE name LIKE ? ESCAPE '\\'", (like,))
+    # n-gram 和 LIKE 都不区分大小写，与 os.walk 的子串匹配保持一致
+    for folder_id, path, name in rows:
+        if sn in name:
+            folders[folder_id] = path
+    return [folders[folder_id] for folder_id in sorted(folders)]
+
+
+def lookup_folder_images(conn, folder_path):
+    """
+    返回文件夹中直接包含的图片 [(路径, 大小, 修改时间)]，文件夹未登记时返回None
+    """
+    row = conn.execute("SELECT id FROM folders WHERE path = ?", (os.path.normpath(folder_path),)).fetchone()
+    if row is None:
+        return None
+    return conn.execute("SELECT path, size, mtime FROM images WHERE folder_id = ? ORDER BY ext_order, name",
+                        (row[0],)).fetchall()
+
+
+def lookup_folder_listing(conn, folder_path):
+    """
+    返回文件夹中直接包含的图片 [(文件名, 大小, 修改时间)]，文件夹未登记时返回None
+    """
+    row = conn.execute("SELECT id FROM folders WHERE path = ?", (os.path.normpath(folder_path),)).fetchone()
+    if row is None:
+        return None
+    return conn.execute("SELECT name, size, mtime FROM images WHERE folder_id = ? ORDER BY name",
+                        (row[0],)).fetchall()
+
+
+def lookup_images(conn, sn=None, station=None, verdict=None):
+    """
+    按SN/站位/判定结果查询图片路径，用于临时查询和多日报表
+    """
+    clauses = []
+    params = []
+    for column, value in (('sn', sn), ('station', station), ('verdict', verdict)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return [row[0] for row in conn.execute(f"SELECT path FROM images{where} ORDER BY path", params)]
@@ -0,0 +1,89 @@
+import csv
+import logging
+from datetime import datetime
+
+from run_metrics import METRICS
+
+# pyarrow 为可选依赖：未安装时只能输出CSV
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# 输出列（与xlsx报表对应，图片列为复制到result目录后的路径）
+COLUMNS = ['SN', 'Station Name', 'Time End', 'Folder', 'Locate picture', 'NG picture', 'NG picture1', 'Remark']
+
+# 支持的列式格式及文件扩展名
+COLUMNAR_FORMATS = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+
+
+def format_value(value):
+    """
+    单元格值转换为文本（日期统一为 "%Y-%m-%d %H:%M:%S"）
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return str(value)
+
+
+def row_values(result):
+    """
+    将 RowResult 转换为一行输出值（均为字符串或None）
+    """
+    ng_images = result.ng_images[:2] + [None, None]
+    return [format_value(result.sn), format_value(result.station), format_value(result.time_end), result.folder,
+            result.locate_image, ng_images[0], ng_images[1], result.remark or None]
+
+
+def write_csv(results, path):
+    """
+    写出CSV（UTF-8 BOM，Excel可直接打开）
+    """
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for result in results:
+            writer.writerow(row_values(result))
+    return path
+
+
+def _arrow_table(results):
+    rows = [row_values(result) for result in results]
+    columns = {name: [row[index] for row in rows] for index, name in enumerate(COLUMNS)}
+    return pa.table({name: pa.array(values, type=pa.string()) for name, values in columns.items()})
+
+
+def write_parquet(results, path):
+    pq.write_table(_arrow_table(results), path)
+    return path
+
+
+def write_arrow(results, path):
+    """
+    写出 Arrow IPC（Feather v2）文件
+    """
+    feather.write_feather(_arrow_table(results), path)
+    return path
+
+
+WRITERS = {'csv': write_csv, 'parquet': write_parquet, 'arrow': write_arrow}
+
+
+def export_rows(results, output_base, fmt):
+    """
+    按指定格式写出行结果，返回文件路径；需要pyarrow但未安装时返回None
+    """
+    if fmt != 'csv' and pa is None:
+        logger.warning("未安装pyarrow，无法输出%s格式（pip install pyarrow）", fmt)
+        return None
+    path = output_base + COLUMNAR_FORMATS[fmt]
+    with METRICS.stage('export'):
+        WRITERS[fmt](results, path)
+    logger.info("已输出%s文件: %s", fmt, path)
+    return path
@@ -3,6 +3,43 @@ import zipfile
 import shutil
 from pathlib import Path
 import time
+import logging
+
+from run_metrics import METRICS
+from catalog import build_catalog_from_state, invalidate_catalog
+
+logger = logging.getLogger(__name__)
+
+# 解压时保留的文件类型（其余成员直接跳过，不写入磁盘）
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# 解压限制，防止超大或恶意嵌套的压缩包占满内存和磁盘
+MAX_MEMBER_SIZE = 256 * 1024 * 1024  # 单个成员解压后最大字节数
+MAX_TOTAL_SIZE = 50 * 1024 ** 3  # 单次运行解压总字节数上限
+MAX_COMPRESSION_RATIO = 100  # 单个成员最大压缩比（解压后/压缩后）
+MAX_NESTING_DEPTH = 5  # 嵌套ZIP最大层数（最外层为1）
+COPY_BUFFER_SIZE = 1024 * 1024  # 成员数据复制缓冲区大小
+
+
+class ExtractionState:
+    """
+    记录一次解压运行中写入的字节数以及创建的文件和目录，供后续清理和统计使用
+    """
+
+    def __init__(self):
+        self.bytes = 0
+        self.archives = []  # [(ZIP路径, 解压目录, 嵌套层数)]
+        self.nested_zips = []  # 解压出来的嵌套ZIP文件路径
+        self.images = []  # 解压出来的图片路径
+        self.image_counts = {}  # 最外层压缩包解压目录 -> 图片数量
+        self.directories = {}  # 解压时创建的目录（按创建顺序，值无意义）
+
+    def makedirs(self, path):
+        """
+        创建目录并记录下来，没有图片的目录也会登记到目录中
+        """
+        os.makedirs(path, exist_ok=True)
+        self.directories.setdefault(os.path.normpath(path), None)
 
 
 def move_current_dir_zips_to_zip_dir():
@@ -21,38 +58,137 @@ def move_current_dir_zips_to_zip_dir():
 
             # 移动文件
             shutil.move(src_path, dest_path)
-            print(f"已将 {file} 移动到 zip 目录")
+            logger.debug("已将 %s 移动到 zip 目录", file)
             moved_count += 1
+            METRICS.incr('zip_files_moved')
 
     return moved_count
 
 
-def remove__MACOSX_directories(directory):
+def _member_target(extract_dir, member_name):
     """
-    递归删除目录中的所有__MACOSX目录
+    计算成员的目标路径，拒绝绝对路径和包含..的路径（防止写到解压目录之外）
     """
-    removed_count = 0
-    for root, dirs, _ in os.walk(directory):
-        # 注意：我们需要在遍历过程中修改dirs列表
-        if '__MACOSX' in dirs:
-            macosx_dir = os.path.join(root, '__MACOSX')
+    parts = [part for part in member_name.replace('\\', '/').split('/') if part not in ('', '.')]
+    if not parts or '..' in parts or ':' in parts[0]:
+        return None
+    return os.path.join(extract_dir, *parts)
+
+
+def _skip_reason(info, depth, state):
+    """
+    判断成员是否需要跳过，返回跳过原因（None表示需要解压）
+    """
+    name = info.filename.replace('\\', '/')
+    parts = name.split('/')
+    if '__MACOSX' in parts or parts[-1].startswith('._'):
+        return 'macosx'
+
+    lower_name = name.lower()
+    is_zip = lower_name.endswith('.zip')
+    if not is_zip and not lower_name.endswith(IMAGE_EXTENSIONS):
+        return 'non_image'
+    if is_zip and depth >= MAX_NESTING_DEPTH:
+        return 'too_deep'
+
+    if info.file_size > MAX_MEMBER_SIZE:
+        return 'too_large'
+    if info.compress_size > 0 and info.file_size / info.compress_size > MAX_COMPRESSION_RATIO:
+        return 'ratio'
+    if state.bytes + info.file_size > MAX_TOTAL_SIZE:
+        return 'total_size'
+    return None
+
+
+def extract_zip_streaming(zip_path, extract_dir, depth=1, state=None, top_dir=None):
+    """
+    逐个成员流式解压ZIP文件：跳过__MACOSX和非图片成员，限制大小与嵌套层数
+
+    嵌套的ZIP写入磁盘后立即解压到同名目录中，不再重新遍历已解压的目录。
+    创建的文件记录在state中。返回解压的ZIP文件数量（包含嵌套的ZIP）
+    """
+    if state is None:
+        state = ExtractionState()
+    if top_dir is None:
+        top_dir = extract_dir
+
+    state.archives.append((zip_path, extract_dir, depth))
+    total_extracted = 1
+    nested_zips = []
+
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for info in zip_ref.infolist():
+            if info.is_dir():
+                # 与整体解压一样创建压缩包中的目录（包括空目录）
+                target_path = _member_target(extract_dir, info.filename)
+                if target_path is not None and _skip_reason(info, depth, state) != 'macosx':
+                    state.makedirs(target_path)
+                continue
+
+            reason = _skip_reason(info, depth, state)
+            if reason == 'macosx':
+                METRICS.incr('zip_members_skipped_macosx')
+                continue
+
+            target_path = _member_target(extract_dir, info.filename)
+            if reason:
+                # 成员被跳过时仍创建其所在目录，使目录结构与整体解压时相同
+                if target_path is not None:
+                    state.makedirs(os.path.dirname(target_path))
+                METRICS.incr(f'zip_members_skipped_{reason}')
+                if reason != 'non_image':
+                    logger.warning("跳过 %s 中的 %s: %s", os.path.basename(zip_path), info.filename, reason)
+                continue
+
+            if target_path is None:
+                METRICS.incr('zip_members_skipped_unsafe_path')
+                logger.warning("跳过不安全的路径 %s: %s", os.path.basename(zip_path), info.filename)
+                continue
+
+            state.makedirs(os.path.dirname(target_path))
+
+            # 使用固定大小的缓冲区复制，内存占用与成员大小无关
+            with zip_ref.open(info) as src, open(target_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+
+            # 保留压缩包中记录的修改时间，使重新解压后的文件属性保持不变
             try:
-                shutil.rmtree(macosx_dir)
-                print(f"已删除: {os.path.relpath(macosx_dir, directory)}")
-                removed_count += 1
-                # 从当前遍历中移除这个目录，避免后续遍历
-                dirs.remove('__MACOSX')
-            except Exception as e:
-                print(f"删除失败 {macosx_dir}: {str(e)}")
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+                os.utime(target_path, (mtime, mtime))
+            except (OverflowError, ValueError, OSError):
+                pass
+
+            state.bytes += info.file_size
+            METRICS.incr('zip_members_extracted')
+            METRICS.incr('zip_bytes_extracted', info.file_size)
+
+            if target_path.lower().endswith('.zip'):
+                nested_zips.append(target_path)
+                state.nested_zips.append(target_path)
+            else:
+                state.images.append(target_path)
+                state.image_counts[top_dir] = state.image_counts.get(top_dir, 0) + 1
+
+    # 嵌套ZIP解压到与其同名的目录中
+    for nested_path in nested_zips:
+        nested_dir = os.path.join(os.path.dirname(nested_path), Path(nested_path).stem)
+        state.makedirs(nested_dir)
+        logger.debug("解压嵌套ZIP: %s", os.path.relpath(nested_path, 'data'))
+        try:
+            total_extracted += extract_zip_streaming(nested_path, nested_dir, depth + 1, state, top_dir)
+        except Exception as e:
+            logger.error("处理嵌套ZIP %s 时出错: %s", nested_path, e)
 
-    return removed_count
+    return total_extracted
 
 
-def recursive_unzip(source_dir, target_dir):
+def recursive_unzip(source_dir, target_dir, state=None):
     """
     递归解压source_dir中的所有ZIP文件到target_dir对应位置
     """
     total_extracted = 0
+    if state is None:
+        state = ExtractionState()
 
     # 遍历源目录中的所有项目
     for item in os.listdir(source_dir):
@@ -65,78 +201,93 @@ def recursive_unzip(source_dir, target_dir):
             # 创建目标目录（使用ZIP文件名作为目录名）
             folder_name = Path(item).stem
             extract_dir = os.path.join(target_dir, folder_name)
-            os.makedirs(extract_dir, exist_ok=True)
+            state.makedirs(extract_dir)
 
-            print(f"解压: {relative_path} -> {os.path.relpath(extract_dir, 'data')}")
+            logger.debug("解压: %s -> %s", relative_path, os.path.relpath(extract_dir, 'data'))
 
             try:
-                # 解压ZIP文件
-                with zipfile.ZipFile(source_path, 'r') as zip_ref:
-                    zip_ref.extractall(extract_dir)
-
-                total_extracted += 1
-
-                removed = remove__MACOSX_directories(extract_dir)
-                if removed > 0:
-                    print(f"已删除 {removed} 个__MACOSX目录")
-
-                # 递归处理新解压的目录
-                total_extracted += recursive_unzip(extract_dir, extract_dir)
+                # 流式解压ZIP文件（包含嵌套的ZIP）
+                total_extracted += extract_zip_streaming(source_path, extract_dir, 1, state)
 
             except Exception as e:
-                print(f"处理 {relative_path} 时出错: {str(e)}")
+                logger.error("处理 %s 时出错: %s", relative_path, e)
 
         # 如果是目录，递归处理
         elif os.path.isdir(source_path):
             # 在目标目录中创建对应的子目录
-            os.makedirs(target_path, exist_ok=True)
-            total_extracted += recursive_unzip(source_path, target_path)
+            state.makedirs(target_path)
+            total_extracted += recursive_unzip(source_path, target_path, state)
 
     return total_extracted
 
 
-def remove_zip_files(directory):
+def remove_extracted_zips(state):
     """
-    递归删除目录中的所有ZIP文件
+    删除解压过程中写出的嵌套ZIP文件（只删除记录过的路径，不遍历目录）
     """
     removed_count = 0
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if file.lower().endswith('.zip'):
-                zip_path = os.path.join(root, file)
-                try:
-                    os.remove(zip_path)
-                    print(f"已删除: {os.path.relpath(zip_path, directory)}")
-                    removed_count += 1
-                except Exception as e:
-                    print(f"删除失败 {zip_path}: {str(e)}")
+    for zip_path in state.nested_zips:
+        try:
+            os.remove(zip_path)
+            logger.debug("已删除: %s", os.path.relpath(zip_path, 'data'))
+            removed_count += 1
+            METRICS.incr('zip_files_removed')
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning("删除失败 %s: %s", zip_path, e)
 
     return removed_count
 
 
+def log_extraction_report(state, zip_files, detail=False):
+    """
+    输出解压结果摘要：每个压缩包解压出的图片数量，detail为True时列出每个文件
+    """
+    logger.info("\n解压结果:")
+    logger.info("zip/  %d 个ZIP文件", len(zip_files))
+    logger.info("data/ %d 个压缩包（含嵌套）, %d 张图片, %.1f MB",
+                len(state.archives), len(state.images), state.bytes / 1024 / 1024)
+
+    for _, extract_dir, depth in state.archives:
+        if depth != 1:
+            continue
+        logger.info("├── %s/  (%d 张图片)", os.path.relpath(extract_dir, 'data'), state.image_counts.get(extract_dir, 0))
+
+    if detail:
+        for img_path in sorted(state.images):
+            logger.info("│   ├── %s", os.path.relpath(img_path, 'data'))
+
+
 def clear_data_directory():
     """
-    清空data目录
+    清空data目录（result目录中的图片目录在重新建立之前标记为不可用）
     """
+    invalidate_catalog()
     if os.path.exists("data"):
-        print("正在清空data目录...")
+        logger.info("正在清空data目录...")
         try:
             shutil.rmtree("data")
-            print("已清空data目录")
+            logger.info("已清空data目录")
         except Exception as e:
-            print(f"清空data目录时出错: {str(e)}")
+            logger.error("清空data目录时出错: %s", e)
     # 重新创建data目录
     os.makedirs("data", exist_ok=True)
 
 
-def start_extract_zip():
+def start_extract_zip(show_tree=False, tree_detail=False):
+    """
+    解压zip目录中的所有ZIP文件到data目录，返回记录解压结果的ExtractionState
+
+    show_tree 为 True 时输出解压结果摘要，tree_detail 为 True 时同时列出每个文件
+    """
     start_time = time.time()
 
-    print("=" * 50)
-    print("ZIP文件递归解压工具")
-    print("=" * 50)
-    print("将解压zip目录中的所有ZIP文件到data目录")
-    print("保持相同的目录结构，并删除data目录中的ZIP文件")
+    logger.info("=" * 50)
+    logger.info("ZIP文件递归解压工具")
+    logger.info("=" * 50)
+    logger.info("将解压zip目录中的所有ZIP文件到data目录")
+    logger.info("保持相同的目录结构，并删除data目录中的ZIP文件")
 
     # 确保目录存在
     os.makedirs("zip", exist_ok=True)
@@ -144,9 +295,9 @@ def start_extract_zip():
     # 清空并重新创建data目录
     clear_data_directory()
 
-    print("\n移动当前目录的ZIP文件到zip目录...")
+    logger.info("\n移动当前目录的ZIP文件到zip目录...")
     moved_count = move_current_dir_zips_to_zip_dir()
-    print(f"已移动 {moved_count} 个ZIP文件到zip目录")
+    logger.info("已移动 %d 个ZIP文件到zip目录", moved_count)
 
     # 检查是否有ZIP文件
     zip_files = []
@@ -156,55 +307,61 @@ def start_extract_zip():
                 zip_files.append(os.path.join(root, file))
 
     if not zip_files:
-        print("\n错误: zip目录中没有找到任何ZIP文件")
-        print("请将ZIP文件放入zip目录中")
-        return
+        logger.error("\n错误: zip目录中没有找到任何ZIP文件")
+        logger.error("请将ZIP文件放入zip目录中")
+        return None
 
-    print(f"\n在zip目录中找到 {len(zip_files)} 个ZIP文件")
+    logger.info("\n在zip目录中找到 %d 个ZIP文件", len(zip_files))
 
-    # 递归解压所有文件
-    total_extracted = recursive_unzip("zip", "data")
+    state = ExtractionState()
+    with METRICS.stage('extract'):
+        # 递归解压所有文件（__MACOSX和非图片文件在解压时已跳过）
+        total_extracted = recursive_unzip("zip", "data", state)
 
-    print("\n最终清理所有__MACOSX目录...")
-    total_removed = remove__MACOSX_directories("data")
-    print(f"已删除 {total_removed} 个__MACOSX目录")
+        # 删除解压过程中写出的嵌套ZIP文件
+        logger.info("\n删除data目录中的ZIP文件...")
+        removed_count = remove_extracted_zips(state)
 
-    # 删除data目录中的所有ZIP文件
-    print("\n删除data目录中的ZIP文件...")
-    removed_count = remove_zip_files("data")
+    # 根据解压记录建立SN/图片目录，后续查找无需遍历data目录
+    with METRICS.stage('index'):
+        build_catalog_from_state(state, "data")
+
+    METRICS.incr('zip_files_found', len(zip_files))
+    METRICS.incr('zip_files_extracted', total_extracted)
 
     # 计算耗时
     end_time = time.time()
     elapsed = end_time - start_time
 
-    print("\n" + "=" * 50)
-    print(f"处理完成! 共解压 {total_extracted} 个ZIP文件")
-    print(f"删除 {removed_count} 个ZIP文件")
-    print(f"总耗时: {elapsed:.2f} 秒")
-    print("=" * 50)
-
-    # 显示目录结构
-    print("\n最终目录结构:")
-    print("zip/")
-    for root, dirs, files in os.walk("zip"):
-        level = root.replace("zip", '').count(os.sep)
-        indent = '│   ' * level
-        print(f"{indent}├── {os.path.basename(root)}/")
-        for f in files:
-            print(f"{indent}│   ├── {f}")
-
-    print("\ndata/")
-    for root, dirs, files in os.walk("data"):
-        # 跳过根目录
-        if root == "data":
-            continue
+    logger.info("\n" + "=" * 50)
+    logger.info("处理完成! 共解压 %d 个ZIP文件", total_extracted)
+    logger.info("删除 %d 个ZIP文件", removed_count)
+    logger.info("总耗时: %.2f 秒", elapsed)
+    logger.info("=" * 50)
+
+    # 输出解压结果摘要（可选）
+    if show_tree:
+        log_extraction_report(state, zip_files, tree_detail)
 
-        level = root.replace("data", '').count(os.sep)
-        indent = '│   ' * level
-        print(f"{indent}├── {os.path.basename(root)}/")
-        for f in files:
-            print(f"{indent}│   ├── {f}")
+    return state
+
+
+def add_tree_arguments(parser):
+    """
+    为命令行解析器添加解压结果摘要参数
+    """
+    parser.add_argument('--tree', action='store_true', help='输出解压结果摘要（每个压缩包的图片数量）')
+    parser.add_argument('--tree-detail', action='store_true', help='输出解压结果时列出每个文件')
 
 
 if __name__ == "__main__":
-    start_extract_zip()
\ No newline at end of file
+    import argparse
+    from log_utils import setup_logging, add_logging_arguments
+
+    parser = argparse.ArgumentParser(description='递归解压zip目录中的ZIP文件到data目录')
+    add_tree_arguments(parser)
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging(args.log_level, args.quiet, args.log_json)
+
+    start_extract_zip(show_tree=args.tree or args.tree_detail, tree_detail=args.tree_detail)
\ No newline at end of file
@@ -0,0 +1,231 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+
+from PIL import Image as PILImage
+
+from run_metrics import METRICS
+from async_io import get_file_io
+from columnar_export import format_value
+
+logger = logging.getLogger(__name__)
+
+# 缩略图最大尺寸（宽, 高），与xlsx中插入图片的高度一致
+THUMB_SIZE = (480, 120)
+THUMB_QUALITY = 80
+
+# 缩略图目录（result目录下，多份报表共用）
+THUMBS_DIR = 'thumbs'
+
+# 每页显示的行数
+PAGE_SIZE = 200
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>__TITLE__</title>
+<style>
+body { font-family: "Microsoft YaHei", Arial, sans-serif; margin: 16px; }
+table { border-collapse: collapse; width: 100%; }
+th, td { border: 1px solid #999; padding: 4px; text-align: center; vertical-align: middle; font-size: 13px; }
+th { background: #D9D9D9; position: sticky; top: 0; }
+td.remark { white-space: pre-wrap; text-align: left; }
+img { height: 120px; }
+.pager { margin: 8px 0; }
+.pager button { margin-right: 4px; }
+</style>
+</head>
+<body>
+<h2>__TITLE__</h2>
+<div class="pager"><input id="filter" placeholder="筛选 SN / Station / 备注"> <span id="info"></span></div>
+<div class="pager" id="pages"></div>
+<table>
+<thead><tr><th>SN</th><th>QPL-Station Name</th><th>Time(end)</th><th>Locate picture</th>
+<th>NG picture</th><th>NG picture1</th><th>Remark</th></tr></thead>
+<tbody id="rows"></tbody>
+</table>
+<script id="report-data" type="application/json">__DATA__</script>
+<script>
+var report = JSON.parse(document.getElementById('report-data').textContent);
+var pageSize = report.page_size, page = 0, rows = report.rows;
+
+function cell(text, className) {
+  var td = document.createElement('td');
+  if (className) td.className = className;
+  td.textContent = text == null ? '' : text;
+  return td;
+}
+
+function imageCell(image) {
+  var td = document.createElement('td');
+  if (image) {
+    var link = document.createElement('a');
+    link.href = image.src;
+    link.target = '_blank';
+    var img = document.createElement('img');
+    img.loading = 'lazy';
+    img.src = image.thumb || image.src;
+    img.alt = image.name;
+    img.title = image.name;
+    link.appendChild(img);
+    td.appendChild(link);
+  }
+  return td;
+}
+
+function render() {
+  var body = document.getElementById('rows');
+  body.innerHTML = '';
+  var pages = Math.max(1, Math.ceil(rows.length / pageSize));
+  page = Math.min(page, pages - 1);
+  rows.slice(page * pageSize, (page + 1) * pageSize).forEach(function (row) {
+    var tr = document.createElement('tr');
+    tr.appendChild(cell(row.sn));
+    tr.appendChild(cell(row.station));
+    tr.appendChild(cell(row.time_end));
+    tr.appendChild(imageCell(row.locate_image));
+    tr.appendChild(imageCell(row.ng_images[0]));
+    tr.appendChild(imageCell(row.ng_images[1]));
+    tr.appendChild(cell(row.remark, 'remark'));
+    body.appendChild(tr);
+  });
+  document.getElementById('info').textContent = '共 ' + rows.length + ' 条记录，第 ' + (page + 1) + ' / ' + pages + ' 页';
+  var pager = document.getElementById('pages');
+  pager.innerHTML = '';
+  for (var i = 0; i < pages; i++) {
+    var button = document.createElement('button');
+    button.textContent = i + 1;
+    button.disabled = i === page;
+    button.onclick = (function (target) { return function () { page = target; render(); window.scrollTo(0, 0); }; })(i);
+    pager.appendChild(button);
+  }
+}
+
+document.getElementById('filter').oninput = function () {
+  var keyword = this.value.toLowerCase();
+  rows = report.rows.filter(function (row) {
+    return [row.sn, row.station, row.remark].join(' ').toLowerCase().indexOf(keyword) >= 0;
+  });
+  page = 0;
+  render();
+};
+
+render();
+</script>
+</body>
+</html>
+"""
+
+
+def make_thumbnail(args):
+    """
+    生成缩略图（已存在且不旧于原图时直接复用），返回缩略图路径
+    """
+    img_path, thumb_path = args
+    try:
+        if os.path.getmtime(thumb_path) >= os.path.getmtime(img_path):
+            return thumb_path
+    except OSError:
+        pass
+    with PILImage.open(img_path) as img:
+        # JPEG按缩小比例解码，大图生成缩略图时只解码需要的像素
+        img.draft('RGB', THUMB_SIZE)
+        img = img.convert('RGB')
+        img.thumbnail(THUMB_SIZE)
+        img.save(thumb_path, 'JPEG', quality=THUMB_QUALITY)
+    METRICS.incr('thumbnails_created')
+    return thumb_path
+
+
+def thumbnail_name(img_path):
+    """
+    缩略图文件名：完整的原图文件名加上原图路径的短哈希，
+    x.jpg 与 x.png、不同文件夹中的同名图片不会互相覆盖
+    """
+    digest = hashlib.sha1(os.path.abspath(img_path).encode('utf-8')).hexdigest()[:10]
+    return f"{os.path.basename(img_path)}_{digest}.jpg"
+
+
+def build_thumbnails(row_results, thumbs_dir):
+    """
+    为报表中的所有图片并发生成缩略图，返回 {原图路径: 缩略图路径}（失败的图片不在其中）
+    """
+    os.makedirs(thumbs_dir, exist_ok=True)
+    sources = []
+    for result in row_results:
+        sources.extend(result.ng_images[:2])
+        if result.locate_image:
+            sources.append(result.locate_image)
+    sources = list(dict.fromkeys(sources))
+    pairs = [(path, os.path.join(thumbs_dir, thumbnail_name(path))) for path in sources]
+
+    with METRICS.stage('thumbnail'):
+        thumbs = get_file_io().map(make_thumbnail, pairs)
+
+    thumb_map = {}
+    for (img_path, _), thumb_path in zip(pairs, thumbs):
+        if isinstance(thumb_path, Exception):
+            logger.warning("生成缩略图失败: %s - %s", img_path, thumb_path)
+            continue
+        thumb_map[img_path] = thumb_path
+    return thumb_map
+
+
+def _url(path, base_dir):
+    return os.path.relpath(path, base_dir).replace(os.sep, '/')
+
+
+def report_data(row_results, thumb_map, base_dir, title):
+    """
+    生成报表数据（JSON可序列化），图片路径相对于报表所在目录
+    """
+    def image_entry(path):
+        if not path:
+            return None
+        thumb = thumb_map.get(path)
+        return {'name': os.path.basename(path), 'src': _url(path, base_dir),
+                'thumb': _url(thumb, base_dir) if thumb else None}
+
+    rows = []
+    for result in row_results:
+        rows.append({
+            'sn': format_value(result.sn),
+            'station': format_value(result.station),
+            'time_end': format_value(result.time_end),
+            'folder': result.folder,
+            'locate_image': image_entry(result.locate_image),
+            'ng_images': [image_entry(path) for path in result.ng_images[:2]],
+            'remark': result.remark,
+        })
+    return {'title': title, 'generated_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'page_size': PAGE_SIZE, 'rows': rows}
+
+
+def write_html_report(row_results, output_base):
+    """
+    输出静态HTML报表（<output_base>.html）和数据文件（<output_base>.json），返回HTML路径
+
+    图片以预先缩放的缩略图懒加载显示，点击打开原图；表格分页显示
+    """
+    base_dir = os.path.dirname(os.path.abspath(output_base))
+    thumb_map = build_thumbnails(row_results, os.path.join(base_dir, THUMBS_DIR))
+
+    with METRICS.stage('export'):
+        title = os.path.basename(output_base)
+        data = report_data(row_results, thumb_map, base_dir, title)
+
+        json_path = output_base + '.json'
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+        # 数据同时内嵌到页面中，直接双击打开（file://）时浏览器不允许读取本地JSON文件
+        embedded = json.dumps(data, ensure_ascii=False).replace('</', '<\\/')
+        html_path = output_base + '.html'
+        with open(html_path, 'w', encoding='utf-8') as f:
+            f.write(PAGE_TEMPLATE.replace('__TITLE__', title).replace('__DATA__', embedded))
+
+    logger.info("已输出HTML报表: %s（数据文件: %s）", html_path, json_path)
+    return html_path
@@ -0,0 +1,288 @@
+import io
+import os
+import mmap
+import shutil
+import struct
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from PIL import Image as PILImage
+
+from run_metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# 同时保持映射的图片文件数量上限（每个映射占用一个文件句柄）
+MAX_OPEN_IMAGES = 64
+
+# 已复制到result目录、等待保存工作簿时写入的图片，保持映射的数量上限
+MAX_PINNED_IMAGES = 512
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# JPEG 中带有图片尺寸的帧头标记（SOF0-SOF15，不包括 DHT/JPG/DAC）
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def read_dimensions(buffer):
+    """
+    从PNG/JPEG文件头解析图片尺寸 (宽, 高)，无法解析时返回None
+    """
+    if buffer[:8] == PNG_SIGNATURE and buffer[12:16] == b'IHDR':
+        return struct.unpack('>II', buffer[16:24])
+
+    if buffer[:2] != b'\xff\xd8':
+        return None
+    pos = 2
+    length = len(buffer)
+    while pos + 4 <= length:
+        if buffer[pos] != 0xFF:
+            return None
+        marker = buffer[pos + 1]
+        # 填充字节和不带长度的标记
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            pos += 2
+            continue
+        segment_length = struct.unpack('>H', buffer[pos + 2:pos + 4])[0]
+        if marker in JPEG_SOF_MARKERS:
+            if pos + 9 > length:
+                return None
+            height, width = struct.unpack('>HH', buffer[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + segment_length
+    return None
+
+
+class _BufferReader(io.RawIOBase):
+    """
+    只读文件对象，从映射缓冲区读取数据（每个读取者有独立的读取位置）
+
+    每次读取时向 ImageStore 借用映射，映射被回收后会自动重新映射
+    """
+
+    def __init__(self, store, path):
+        super().__init__()
+        self._store = store
+        self._path = path
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        with self._store.mapped(self._path) as image:
+            buffer = image.buffer
+            n = max(0, min(len(b), len(buffer) - self._pos))
+            b[:n] = buffer[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            with self._store.mapped(self._path) as image:
+                self._pos = image.size + offset
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+class MappedImage:
+    """
+    以只读方式映射整个图片文件，尺寸解析、校验、哈希和复制共用同一块缓冲区
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self._dimensions = None
+        self._digest = None
+        # 正在使用映射的调用数；被移出缓存时仍有人使用则延后到最后一个使用者结束时关闭
+        self._users = 0
+        self._evicted = False
+        if self.size == 0:
+            self.buffer = b''
+            return
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def dimensions(self):
+        """
+        图片尺寸 (宽, 高)：优先解析文件头，非常见格式再交给PIL
+        """
+        if self._dimensions is None:
+            self._dimensions = read_dimensions(self.buffer)
+            if self._dimensions is None:
+                with PILImage.open(io.BytesIO(self.buffer)) as img:
+                    self._dimensions = img.size
+        return self._dimensions
+
+    def digest(self):
+        """
+        文件内容的SHA-1
+        """
+        if self._digest is None:
+            self._digest = hashlib.sha1(self.buffer).hexdigest()
+        return self._digest
+
+    def copy_to(self, dest_path):
+        """
+        将缓冲区写入目标文件，并与 shutil.copy2 一样保留修改时间等属性
+        """
+        with open(dest_path, 'wb') as f:
+            f.write(self.buffer)
+        shutil.copystat(self.path, dest_path)
+        return dest_path
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+
+class ImageStore:
+    """
+    按路径缓存图片映射（最近使用的 MAX_OPEN_IMAGES 个），每个文件在一次处理中只映射一次
+
+    复制到result目录的图片登记为源文件的别名，并保持映射直到工作簿保存，
+    计算尺寸、插入工作表和保存时直接使用源文件的映射。
+    打开和映射文件不持有锁，多个线程可以同时打开不同的文件
+    """
+
+    def __init__(self, max_open=MAX_OPEN_IMAGES, max_pinned=MAX_PINNED_IMAGES):
+        self.max_open = max_open
+        self.max_pinned = max_pinned
+        self._images = OrderedDict()
+        self._pinned = {}
+        self._aliases = {}
+        self._lock = threading.Lock()
+
+    def _resolve(self, path):
+        path = os.path.normpath(path)
+        return self._aliases.get(path, path)
+
+    def _lookup(self, path):
+        # 调用者持有锁
+        image = self._pinned.get(path)
+        if image is None:
+            image = self._images.get(path)
+            if image is not None:
+                self._images.move_to_end(path)
+        if image is not None:
+            image._users += 1
+        return image
+
+    def _acquire(self, path):
+        """
+        借用图片的 MappedImage（未映射时打开），使用完后调用 _release
+        """
+        path = self._resolve(path)
+        with self._lock:
+            image = self._lookup(path)
+        if image is not None:
+            return image
+
+        # 在锁外打开和映射文件，网络共享上的延迟不会阻塞其他线程
+        mapped = MappedImage(path)
+        evicted = []
+        with self._lock:
+            # 其他线程可能已经映射了同一个文件
+            image = self._lookup(path)
+            if image is None:
+                image = mapped
+                image._users += 1
+                METRICS.incr('images_mapped')
+                self._images[path] = image
+                # 超出上限时移出最久未使用的映射
+                while len(self._images) > self.max_open:
+                    _, old = self._images.popitem(last=False)
+                    old._evicted = True
+                    if old._users == 0:
+                        evicted.append(old)
+            else:
+                evicted.append(mapped)
+        for old in evicted:
+            old.close()
+        return image
+
+    def _release(self, image):
+        with self._lock:
+            image._users -= 1
+            close = image._evicted and image._users == 0
+        if close:
+            image.close()
+
+    @contextmanager
+    def mapped(self, path):
+        """
+        在 with 语句中使用图片的 MappedImage，期间映射不会被关闭
+        """
+        image = self._acquire(path)
+        try:
+            yield image
+        finally:
+            self._release(image)
+
+    def reader(self, path):
+        """
+        返回可交给PIL/openpyxl使用的只读文件对象
+        """
+        return _BufferReader(self, self._resolve(path))
+
+    def verify(self, path):
+        """
+        校验图片完整性，损坏时抛出异常
+        """
+        with PILImage.open(self.reader(path)) as img:
+            img.verify()
+
+    def copy(self, src_path, dest_path):
+        """
+        从映射复制图片，并把目标路径登记为源文件的别名
+        """
+        with self.mapped(src_path) as image:
+            image.copy_to(dest_path)
+            with self._lock:
+                self._aliases[os.path.normpath(dest_path)] = image.path
+                # 已被移出缓存的映射不再保持
+                if not image._evicted and len(self._pinned) < self.max_pinned:
+                    self._pinned[image.path] = image
+                    self._images.pop(image.path, None)
+        return dest_path
+
+    def close(self):
+        """
+        关闭所有映射（工作簿保存之后调用）
+        """
+        with self._lock:
+            for image in list(self._images.values()) + list(self._pinned.values()):
+                image.close()
+            self._images.clear()
+            self._pinned.clear()
+            self._aliases.clear()
+
+
+_image_store = None
+
+
+def get_image_store():
+    """
+    返回共享的图片映射缓存
+    """
+    global _image_store
+    if _image_store is None:
+        _image_store = ImageStore()
+    return _image_store
@@ -0,0 +1,154 @@
+import os
+import sqlite3
+import logging
+
+from PIL import Image as PILImage
+
+from run_metrics import METRICS
+from async_io import get_file_io
+
+logger = logging.getLogger(__name__)
+
+# 感知哈希缓存库（与报表放在同一个result目录中）
+HASH_CACHE_NAME = 'image_hashes.sqlite3'
+
+# dHash 尺寸：缩小为 (HASH_SIZE + 1) x HASH_SIZE 的灰度图，相邻像素比较得到 64 位哈希
+HASH_SIZE = 8
+
+# 汉明距离不超过该值的两张图片视为近似重复
+DEDUP_THRESHOLD = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dhashes (
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    dhash INTEGER NOT NULL,
+    PRIMARY KEY (name, size, mtime)
+);
+"""
+
+
+def dhash(img_path, hash_size=HASH_SIZE):
+    """
+    计算图片的差值哈希（dHash），返回 64 位整数
+    """
+    with PILImage.open(img_path) as img:
+        # JPEG按缩小比例解码，只需要很少的像素
+        img.draft('L', (hash_size * 8, hash_size * 8))
+        pixels = img.convert('L').resize((hash_size + 1, hash_size), PILImage.BILINEAR).tobytes()
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+# SQLite 的 INTEGER 为有符号64位，哈希按补码形式存取
+HASH_MASK = (1 << 64) - 1
+
+
+def _to_signed(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hamming_distance(hash1, hash2):
+    return bin(hash1 ^ hash2).count('1')
+
+
+def _is_ng_candidate(record):
+    """
+    与 filter_ng_images 相同的NG图片判断（包含NG且不包含src）
+    """
+    return 'ng' in record.lower_name and 'src' not in record.lower_name
+
+
+class ImageDeduplicator:
+    """
+    用感知哈希（dHash）合并连拍产生的近似重复NG图片
+
+    哈希按 (文件名, 大小, 修改时间) 缓存在 result/image_hashes.sqlite3 中，
+    data目录重新解压后仍然可以复用
+    """
+
+    def __init__(self, result_dir='result', threshold=DEDUP_THRESHOLD):
+        os.makedirs(result_dir, exist_ok=True)
+        self.threshold = threshold
+        self.path = os.path.join(result_dir, HASH_CACHE_NAME)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+        # 本次运行中已取得的哈希（按图片路径）
+        self._hashes = {}
+        # 已合并掉的图片路径，多个设备类型挑选同一文件夹时只计数一次
+        self._merged = set()
+
+    @staticmethod
+    def _key(record):
+        # 修改时间取整到秒，与挑选结果缓存的文件夹指纹一致
+        return record.name, record.size, int(record.mtime or 0)
+
+    def prepare(self, records):
+        """
+        为文件夹中的NG候选图片取得哈希（先查缓存，未命中的并发计算），在挑选之前调用一次
+        """
+        candidates = [record for record in records if _is_ng_candidate(record) and record.path not in self._hashes]
+        if len(candidates) < 2:
+            return
+
+        with METRICS.stage('dedup'):
+            missing = []
+            for record in candidates:
+                row = self.conn.execute("SELECT dhash FROM dhashes WHERE name = ? AND size = ? AND mtime = ?",
+                                        self._key(record)).fetchone()
+                if row is not None:
+                    self._hashes[record.path] = row[0] & HASH_MASK
+                else:
+                    missing.append(record)
+
+            computed = get_file_io().map(dhash, [record.path for record in missing])
+            rows = []
+            for record, value in zip(missing, computed):
+                if isinstance(value, Exception):
+                    logger.debug("计算感知哈希失败: %s - %s", record.name, value)
+                    continue
+                self._hashes[record.path] = value
+                rows.append(self._key(record) + (_to_signed(value),))
+                METRICS.incr('images_hashed')
+            if rows:
+                with self.conn:
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO dhashes (name, size, mtime, dhash) VALUES (?, ?, ?, ?)", rows)
+
+    def collapse(self, ng_images):
+        """
+        合并已排序NG图片中相邻的近似重复图片，每组只保留最后（最新）一张
+        """
+        kept = []
+        for record in ng_images:
+            value = self._hashes.get(record.path)
+            if kept and value is not None:
+                previous = self._hashes.get(kept[-1].path)
+                if previous is not None and hamming_distance(previous, value) <= self.threshold:
+                    if kept[-1].path not in self._merged:
+                        self._merged.add(kept[-1].path)
+                        logger.debug("合并近似重复图片: %s -> %s", kept[-1].name, record.name)
+                        METRICS.incr('images_deduplicated')
+                    kept[-1] = record
+                    continue
+            kept.append(record)
+        return kept
+
+    def close(self):
+        self.conn.close()
+
+
+def add_dedup_arguments(parser):
+    """
+    为命令行解析器添加近似重复图片合并参数
+    """
+    parser.add_argument('--dedup', action='store_true',
+                        help='挑选前用感知哈希合并连拍产生的近似重复NG图片')
+    parser.add_argument('--dedup-threshold', type=int, default=DEDUP_THRESHOLD,
+                        help=f'近似重复的汉明距离阈值（64位dHash），默认 {DEDUP_THRESHOLD}')
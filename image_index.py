@@ -0,0 +1,158 @@
+import os
+import re
+import fnmatch
+import logging
+from collections import defaultdict
+
+from run_metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# 文件名按非字母数字字符拆分为字段，例如
+# RH660-J5QHKC003GK0000UHY-Recheck-20250817043203-Station115-NG-CAP.jpg
+TOKEN_SPLIT = re.compile(r'[^0-9A-Za-z]+')
+
+# 只由字母数字组成的SN一定完整地落在某一个字段中，可以只在字段中查找子串
+ALNUM = re.compile(r'^[0-9A-Za-z]+$')
+
+# 字段子串查找使用的 n-gram 长度
+NGRAM = 3
+
+# 已建立的索引（按data目录绝对路径缓存）
+_indexes = {}
+
+
+class ImageNameIndex:
+    """
+    data目录中图片文件名的倒排索引：文件名字段 -> 图片路径（同时建立小写字段的索引）
+
+    遍历一次data目录建立。查找结果与在文件名中按子串查找SN相同：SN等于某个字段时直接命中，
+    SN只是较长字段一部分时通过字段的 n-gram 索引找到候选字段，不需要遍历全部字段
+    """
+
+    def __init__(self, data_dir='data'):
+        self.data_dir = data_dir
+        self.paths = []
+        self._tokens = defaultdict(list)
+        self._lower_tokens = defaultdict(list)
+        # 隐藏文件或位于隐藏目录中的图片（glob 的 * 和 ** 不匹配以 . 开头的名称）
+        self._hidden = set()
+        # 字段列表及其小写 n-gram -> 字段序号
+        self._token_names = []
+        self._grams = defaultdict(list)
+        # 每个SN的子串查找结果
+        self._substring_hits = {}
+        self._build()
+
+    def _build(self):
+        with METRICS.stage('index'):
+            for root, dirs, files in os.walk(self.data_dir):
+                relative = os.path.relpath(root, self.data_dir)
+                hidden_dir = any(part.startswith('.') for part in relative.split(os.sep) if part != os.curdir)
+                for file in files:
+                    if not file.lower().endswith(IMAGE_EXTENSIONS):
+                        continue
+                    index = len(self.paths)
+                    self.paths.append(os.path.join(root, file))
+                    if hidden_dir or file.startswith('.'):
+                        self._hidden.add(index)
+                    for token in set(TOKEN_SPLIT.split(file)):
+                        if token:
+                            self._tokens[token].append(index)
+                            self._lower_tokens[token.lower()].append(index)
+
+            self._token_names = list(self._tokens)
+            for token_id, token in enumerate(self._token_names):
+                lower = token.lower()
+                for gram in {lower[i:i + NGRAM] for i in range(len(lower) - NGRAM + 1)}:
+                    self._grams[gram].append(token_id)
+        logger.info("已建立图片文件名索引: %d 张图片, %d 个字段", len(self.paths), len(self._tokens))
+
+    def _longer_tokens(self, key, lower):
+        """
+        返回包含 key 且比 key 长的字段（key 比 n-gram 短时检查全部字段）
+        """
+        key_lower = key.lower()
+        if len(key) < NGRAM:
+            candidates = self._token_names
+        else:
+            postings = [self._grams.get(key_lower[i:i + NGRAM], ())
+                        for i in range(len(key_lower) - NGRAM + 1)]
+            postings.sort(key=len)
+            if not postings[0]:
+                return []
+            token_ids = set(postings[0])
+            for posting in postings[1:]:
+                token_ids.intersection_update(posting)
+                if not token_ids:
+                    return []
+            candidates = [self._token_names[token_id] for token_id in token_ids]
+        return [token for token in candidates
+                if len(token) > len(key) and key in (token.lower() if lower else token)]
+
+    def _candidates(self, tokens, key, visible_only=False):
+        """
+        返回文件名包含 key 的图片路径：包括 key 等于某个字段和只是较长字段一部分的文件；
+        key 含有非字母数字字符时会跨越多个字段，直接在文件名中查找
+        """
+        lower = tokens is self._lower_tokens
+        cache_key = (lower, key)
+        indexes = self._substring_hits.get(cache_key)
+        if indexes is None:
+            if ALNUM.match(key):
+                hits = set(tokens.get(key, ()))
+                for token in self._longer_tokens(key, lower):
+                    hits.update(self._tokens[token])
+                indexes = sorted(hits)
+            else:
+                indexes = [i for i, path in enumerate(self.paths)
+                           if key in (os.path.basename(path).lower() if lower else os.path.basename(path))]
+            self._substring_hits[cache_key] = indexes
+        return [self.paths[i] for i in indexes if not (visible_only and i in self._hidden)]
+
+    def find(self, sn, patterns):
+        """
+        返回文件名匹配任一通配符模式（与 glob 相同的规则）的图片，按模式顺序排列
+
+        模式中包含SN，只需检查文件名包含SN的图片；SN含有特殊字符时模式中的SN经过转义，
+        与SN本身不同，此时检查全部图片
+        """
+        if all(sn in pattern for pattern in patterns):
+            candidates = self._candidates(self._tokens, sn, visible_only=True)
+        else:
+            candidates = [path for i, path in enumerate(self.paths) if i not in self._hidden]
+        matched = []
+        seen = set()
+        for pattern in patterns:
+            for path in candidates:
+                if path not in seen and fnmatch.fnmatch(os.path.basename(path), pattern):
+                    matched.append(path)
+                    seen.add(path)
+        return matched
+
+    def find_ignore_case(self, sn, keyword):
+        """
+        不区分大小写：返回文件名同时包含SN和关键字的图片
+        """
+        sn_lower = sn.lower()
+        keyword = keyword.lower()
+        matched = []
+        for path in self._candidates(self._lower_tokens, sn_lower):
+            name = os.path.basename(path).lower()
+            if keyword in name and sn_lower in name:
+                matched.append(path)
+        return matched
+
+
+def get_image_index(data_dir='data'):
+    """
+    返回data目录的文件名索引（每次运行只建立一次）
+    """
+    key = os.path.abspath(data_dir)
+    index = _indexes.get(key)
+    if index is None:
+        index = ImageNameIndex(data_dir)
+        _indexes[key] = index
+    return index
@@ -0,0 +1,465 @@
+import os
+import re
+import glob
+import logging
+
+from run_metrics import METRICS
+from catalog import open_catalog, lookup_sn_folders, lookup_folder_images
+from records import ImageRecord, SelectionResult
+from selection_cache import folder_fingerprint
+from async_io import get_file_io
+from image_access import get_image_store
+
+logger = logging.getLogger(__name__)
+
+# 设备类型
+DEVICE_TYPES = ['1100', '660', '1174', '639']
+
+
+def find_sn_folders(sn, data_dir='data'):
+    """
+    在data目录中查找包含指定SN的文件夹
+    """
+    sn_str = str(sn).strip() if sn is not None else ""
+    if not sn_str:
+        return []
+
+    # 检查data_dir是否存在
+    if not os.path.exists(data_dir):
+        logger.warning("目录 %s 不存在，跳过文件夹搜索", data_dir)
+        return []
+
+    # 优先使用解压时建立的目录数据库
+    conn = open_catalog(data_dir)
+    if conn is not None:
+        with METRICS.stage('index'):
+            return lookup_sn_folders(conn, sn_str)
+
+    # 查找包含SN的文件夹
+    matched_folders = []
+    with METRICS.stage('index'):
+        for root, dirs, files in os.walk(data_dir):
+            for dir_name in dirs:
+                if sn_str in dir_name:
+                    matched_folders.append(os.path.join(root, dir_name))
+
+    return matched_folders
+
+
+def _list_folder_images(folder_path, data_dir='data'):
+    """
+    列出文件夹中的图片 [ImageRecord]（包括大小和修改时间），优先从目录数据库读取
+    """
+    conn = open_catalog(data_dir)
+    if conn is not None:
+        listed = lookup_folder_images(conn, folder_path)
+        if listed is not None:
+            return [ImageRecord(img_path, size, mtime) for img_path, size, mtime in listed]
+
+    img_paths = []
+    for ext in ['*.jpg', '*.jpeg', '*.png']:
+        img_paths.extend(glob.glob(os.path.join(folder_path, ext)))
+    # 并发获取文件大小和修改时间
+    stats = get_file_io().stat_many(img_paths)
+    return [ImageRecord(img_path, stat.st_size, stat.st_mtime)
+            for img_path, stat in zip(img_paths, stats) if stat is not None]
+
+
+def _verify_image(img_path):
+    """
+    检查是否为有效图片（读取映射缓冲区，选中的图片后续复制和插入时不再重复读取文件）
+    """
+    get_image_store().verify(img_path)
+
+
+def find_all_images_in_folder(folder_path, data_dir='data'):
+    """
+    在指定文件夹中查找所有有效图片，返回 [ImageRecord]
+    """
+    all_images = []
+    min_file_size = 10 * 1024  # 10KB最小文件大小
+
+    if not os.path.exists(folder_path):
+        return all_images
+
+    # 查找所有图片文件
+    candidates = []
+    with METRICS.stage('scan'):
+        for record in _list_folder_images(folder_path, data_dir):
+            METRICS.incr('images_scanned')
+            # 检查文件大小
+            if record.size < min_file_size:
+                logger.debug("跳过小文件: %s (大小: %.1fKB)", record.name, record.size / 1024)
+                METRICS.incr('images_skipped_small')
+                continue
+            candidates.append(record)
+
+    with METRICS.stage('verify'):
+        # 并发读取和验证，结果顺序与候选列表一致
+        results = get_file_io().map(_verify_image, [record.path for record in candidates])
+        for record, error in zip(candidates, results):
+            if isinstance(error, Exception):
+                logger.debug("跳过损坏图片: %s - %s", record.name, error)
+                METRICS.incr('images_skipped_corrupt')
+                continue
+
+            all_images.append(record)
+
+    return all_images
+
+
+def _sort_key(records):
+    """
+    返回NG图片的排序键：文件名都带有拍摄时间时按 (拍摄时间, 连拍时间, 文件名) 排序，不需要访问文件系统；
+    否则按修改时间排序（时间相同时按文件名）
+
+    解压后的修改时间可能是解压时间而不是拍摄时间，因此优先使用文件名中的时间戳
+    """
+    if all(record.timestamp is not None for record in records):
+        return lambda record: (record.timestamp, record.name)
+
+    # 列出文件夹时未取得修改时间的图片并发补齐
+    missing = [record for record in records if record.mtime is None]
+    if missing:
+        stats = get_file_io().stat_many([record.path for record in missing])
+        for record, stat in zip(missing, stats):
+            record.mtime = stat.st_mtime if stat is not None else os.path.getmtime(record.path)
+    return lambda record: (record.mtime, record.name)
+
+
+def filter_ng_images(images, device_type):
+    """
+    根据设备类型过滤NG图片，返回 (ng_images, src_images)，均为 [ImageRecord]
+    """
+    ng_images = []
+    src_images = []
+
+    for record in images:
+        img_name = record.lower_name
+
+        # 检查是否包含NG
+        if 'ng' in img_name:
+            # 检查是否包含src
+            if 'src' in img_name:
+                src_images.append(record)
+            else:
+                ng_images.append(record)
+
+    # 用集合判断是否为src图片（避免对列表逐个查找）
+    src_paths = {record.path for record in src_images}
+
+    # 根据设备类型处理
+    if device_type in ['1100', '660']:
+        # 删除包含src的NG图片
+        ng_images = [img for img in ng_images if img.path not in src_paths]
+
+        # 按文件名中的拍摄时间排序（没有时间戳时按修改时间），取最后几张
+        ng_images.sort(key=_sort_key(ng_images))
+
+    elif device_type == '1174':
+        # 删除包含src的NG图片
+        ng_images = [img for img in ng_images if img.path not in src_paths]
+
+        # 按文件名中的拍摄时间排序（没有时间戳时按修改时间），取最后几张
+        ng_images.sort(key=_sort_key(ng_images))
+
+    elif device_type == '639':
+        # 删除包含src的NG图片
+        ng_images = [img for img in ng_images if img.path not in src_paths]
+
+        # 按文件名中的拍摄时间排序（没有时间戳时按修改时间），取最后几张
+        ng_images.sort(key=_sort_key(ng_images))
+
+    return ng_images, src_images
+
+
+def filter_ok_images(images):
+    """
+    过滤OK图片
+    """
+    ok_images = []
+
+    for record in images:
+        # 检查是否包含OK
+        if 'ok' in record.lower_name:
+            ok_images.append(record)
+
+    return ok_images
+
+
+def process_1100_660(ng_images, ok_images, folder_path):
+    """
+    处理1100和660类型的图片
+    """
+    remarks = []
+    locate_image = None
+
+    if len(ng_images) == 0:
+        remarks.append("Error: 未找到NG图片")
+        return SelectionResult(ng_images, locate_image, "\n".join(remarks))
+
+    # 检查是否全是src图片
+    if len(ng_images) == 0 and len(ok_images) > 0:
+        remarks.append("Error: 只有OK图片，没有NG图片")
+        return SelectionResult(ng_images, locate_image, "\n".join(remarks))
+
+    # 如果只有一张NG图片
+    if len(ng_images) == 1:
+        ng_image = ng_images[0]
+        ng_name = ng_image.name
+
+        # 提取NG前的名称部分
+        match = re.search(r'(\d{14}-Station\d+)', ng_name)
+        if match:
+            ng_prefix = match.group(1)
+
+            # 查找对应的OK图片
+            for ok_image in ok_images:
+                ok_name = ok_image.name
+                if ng_prefix in ok_name and 'ok' in ok_image.lower_name:
+                    locate_image = ok_image
+                    break
+
+            # 如果没有找到完全匹配的OK图片，查找类似的
+            if not locate_image:
+                for ok_image in ok_images:
+                    ok_name = ok_image.name
+                    # 检查是否有类似的OK图片（例如不同的Station编号）
+                    if re.search(r'\d{14}-Station\d+-OK', ok_name, re.IGNORECASE):
+                        remarks.append(f"Failed: 未找到完全匹配的OK图片，但有类似的OK图片: {ok_image.name}")
+                        break
+
+        return SelectionResult([ng_image], locate_image, "\n".join(remarks) if remarks else "")
+
+    # 如果有多张NG图片，取最后2张
+    if len(ng_images) > 1:
+        selected_ng_images = ng_images[-2:]
+
+        # 检查两张NG图片的名称是否一致
+        ng_name1 = selected_ng_images[0].name
+        ng_name2 = selected_ng_images[1].name
+
+        match1 = re.search(r'(\d{14}-Station\d+)', ng_name1)
+        match2 = re.search(r'(\d{14}-Station\d+)', ng_name2)
+
+        if match1 and match2:
+            ng_prefix1 = match1.group(1)
+            ng_prefix2 = match2.group(1)
+
+            if ng_prefix1 != ng_prefix2:
+                remarks.append(f"Failed: 两张NG图片名称不一致: {ng_prefix1} vs {ng_prefix2}")
+            else:
+                # 查找对应的OK图片
+                for ok_image in ok_images:
+                    ok_name = ok_image.name
+                    if ng_prefix1 in ok_name and 'ok' in ok_image.lower_name:
+                        locate_image = ok_image
+                        break
+
+                # 如果没有找到完全匹配的OK图片，查找类似的
+                if not locate_image:
+                    for ok_image in ok_images:
+                        ok_name = ok_image.name
+                        # 检查是否有类似的OK图片（例如不同的Station编号）
+                        if re.search(r'\d{14}-Station\d+-OK', ok_name, re.IGNORECASE):
+                            remarks.append(
+                                f"Failed: 未找到完全匹配的OK图片，但有类似的OK图片: {ok_image.name}")
+                            break
+
+        return SelectionResult(selected_ng_images, locate_image, "\n".join(remarks) if remarks else "")
+
+    return SelectionResult(ng_images, locate_image, "\n".join(remarks) if remarks else "")
+
+
+def process_1174(ng_images, ok_images, folder_path):
+    """
+    处理1174类型的图片
+    """
+    remarks = []
+    locate_image = None
+
+    if len(ng_images) == 0:
+        remarks.append("Error: 未找到NG图片")
+        return SelectionResult(ng_images, locate_image, "\n".join(remarks))
+
+    # 如果只有一张NG图片
+    if len(ng_images) == 1:
+        ng_image = ng_images[0]
+        ng_name = ng_image.name
+
+        # 提取NG前的名称部分
+        match = re.search(r'(Pose\d+_\d{12})', ng_name)
+        if match:
+            ng_prefix = match.group(1)
+
+            # 查找对应的OK图片
+            for ok_image in ok_images:
+                ok_name = ok_image.name
+                if ng_prefix in ok_name and 'ok' in ok_image.lower_name:
+                    locate_image = ok_image
+                    break
+
+            # 如果没有找到完全匹配的OK图片，查找类似的
+            if not locate_image:
+                for ok_image in ok_images:
+                    ok_name = ok_image.name
+                    # 检查是否有类似的OK图片（例如不同的Pose编号）
+                    if re.search(r'Pose\d+_\d{12}-OK', ok_name, re.IGNORECASE):
+                        remarks.append(f"Failed: 未找到完全匹配的OK图片，但有类似的OK图片: {ok_image.name}")
+                        break
+
+        return SelectionResult([ng_image], locate_image, "\n".join(remarks) if remarks else "")
+
+    # 如果有多张NG图片，取最后2张
+    if len(ng_images) > 1:
+        selected_ng_images = ng_images[-2:]
+
+        # 检查两张NG图片的名称是否一致
+        ng_name1 = selected_ng_images[0].name
+        ng_name2 = selected_ng_images[1].name
+
+        match1 = re.search(r'(Pose\d+_\d{12})', ng_name1)
+        match2 = re.search(r'(Pose\d+_\d{12})', ng_name2)
+
+        if match1 and match2:
+            ng_prefix1 = match1.group(1)
+            ng_prefix2 = match2.group(1)
+
+            if ng_prefix1 != ng_prefix2:
+                remarks.append(f"Failed: 两张NG图片名称不一致: {ng_prefix1} vs {ng_prefix2}")
+            else:
+                # 查找对应的OK图片
+                for ok_image in ok_images:
+                    ok_name = ok_image.name
+                    if ng_prefix1 in ok_name and 'ok' in ok_image.lower_name:
+                        locate_image = ok_image
+                        break
+
+                # 如果没有找到完全匹配的OK图片，查找类似的
+                if not locate_image:
+                    for ok_image in ok_images:
+                        ok_name = ok_image.name
+                        # 检查是否有类似的OK图片（例如不同的Pose编号）
+                        if re.search(r'Pose\d+_\d{12}-OK', ok_name, re.IGNORECASE):
+                            remarks.append(
+                                f"Failed: 未找到完全匹配的OK图片，但有类似的OK图片: {ok_image.name}")
+                            break
+
+        return SelectionResult(selected_ng_images, locate_image, "\n".join(remarks) if remarks else "")
+
+    return SelectionResult(ng_images, locate_image, "\n".join(remarks) if remarks else "")
+
+
+def process_639(ng_images, ok_images, folder_path):
+    """
+    处理639类型的图片
+    """
+    remarks = []
+    locate_image = None
+
+    if len(ng_images) == 0:
+        remarks.append("Error: 未找到NG图片")
+        return SelectionResult(ng_images, locate_image, "\n".join(remarks))
+
+    # 如果有多张NG图片，取最后2张
+    if len(ng_images) > 1:
+        ng_images = ng_images[-2:]
+
+    # 如果有OK图片，选择第一张作为locate image
+    if ok_images:
+        locate_image = ok_images[0]
+
+    return SelectionResult(ng_images, locate_image, "\n".join(remarks) if remarks else "")
+
+
+def process_images_by_device_type(device_type, folder_path, data_dir='data', cache=None, dedup=None):
+    """
+    根据设备类型处理图片，返回 SelectionResult（可解包为 ng_images, locate_image, remark）
+
+    cache 为 SelectionCache 时，文件夹内容（文件名、大小、修改时间）未变化则直接复用之前的挑选结果
+
+    dedup 为 ImageDeduplicator 时，挑选前合并连拍产生的近似重复NG图片
+    """
+    return process_images_for_devices([device_type], folder_path, data_dir, cache, dedup)[device_type]
+
+
+def _cache_key(device_type, dedup):
+    # 合并近似重复图片后的挑选结果与不合并时不同，分开缓存
+    return device_type if dedup is None else f"{device_type}:dedup{dedup.threshold}"
+
+
+def process_images_for_devices(device_types, folder_path, data_dir='data', cache=None, dedup=None):
+    """
+    按多个设备类型的规则处理同一个文件夹，返回 {设备类型: SelectionResult}
+
+    文件夹只扫描和验证一次，只有各设备类型的挑选规则分别执行
+    """
+    selections = {}
+    fingerprint = None
+    if cache is not None:
+        with METRICS.stage('scan'):
+            fingerprint = folder_fingerprint(folder_path, data_dir)
+        if fingerprint is not None:
+            for device_type in device_types:
+                cached = cache.get(_cache_key(device_type, dedup), fingerprint, folder_path)
+                if cached is not None:
+                    METRICS.incr('selection_cache_hits')
+                    selections[device_type] = cached
+                else:
+                    METRICS.incr('selection_cache_misses')
+
+    pending = [device_type for device_type in device_types if device_type not in selections]
+    if not pending:
+        return selections
+
+    # 查找所有图片
+    all_images = find_all_images_in_folder(folder_path, data_dir)
+    if dedup is not None:
+        # 哈希只计算一次，各设备类型共用
+        dedup.prepare(all_images)
+
+    for device_type in pending:
+        # 检查文件夹是否为空
+        if not all_images:
+            selection = SelectionResult([], None, "Error: 文件夹为空")
+        else:
+            with METRICS.stage('select'):
+                selection = _select_images(device_type, folder_path, all_images, dedup)
+
+        if fingerprint is not None:
+            cache.put(_cache_key(device_type, dedup), fingerprint, selection)
+        selections[device_type] = selection
+    return selections
+
+
+def _select_images(device_type, folder_path, all_images, dedup=None):
+    """
+    从已验证的图片中按设备类型挑选NG图片和定位图片
+    """
+    # 过滤NG图片和OK图片
+    ng_images, src_images = filter_ng_images(all_images, device_type)
+    if dedup is not None:
+        ng_images = dedup.collapse(ng_images)
+    ok_images = filter_ok_images(all_images)
+
+    # 检查是否全是src图片
+    if len(ng_images) == 0 and len(src_images) > 0:
+        return SelectionResult([], None, "Error: 只有包含src的NG图片")
+
+    # 检查是否没有NG图片但有OK图片
+    if len(ng_images) == 0 and len(ok_images) > 0:
+        return SelectionResult([], None, "Error: 只有OK图片，没有NG图片")
+
+    # 检查是否没有NG图片也没有OK图片
+    if len(ng_images) == 0 and len(ok_images) == 0:
+        return SelectionResult([], None, "Error: 未找到包含NG或OK的图片")
+
+    # 根据设备类型调用不同的处理函数
+    if device_type in ['1100', '660']:
+        return process_1100_660(ng_images, ok_images, folder_path)
+    elif device_type == '1174':
+        return process_1174(ng_images, ok_images, folder_path)
+    elif device_type == '639':
+        return process_639(ng_images, ok_images, folder_path)
+
+    return SelectionResult([], None, "Error: 未知的设备类型")
@@ -0,0 +1,113 @@
+import sys
+import json
+import logging
+from datetime import datetime
+
+from run_metrics import METRICS
+
+
+# 日志级别名称
+LOG_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR']
+
+# 汇总输出时使用的计数器说明
+SUMMARY_LABELS = {
+    'zip_files_moved': '移动ZIP文件',
+    'zip_files_extracted': '解压ZIP文件',
+    'zip_members_extracted': '解压文件',
+    'zip_members_skipped_macosx': '跳过__MACOSX文件',
+    'zip_members_skipped_non_image': '跳过非图片文件',
+    'zip_files_removed': '删除ZIP文件',
+    'images_scanned': '扫描图片',
+    'selection_cache_hits': '挑选结果缓存命中',
+    'selection_cache_misses': '挑选结果缓存未命中',
+    'images_skipped_small': '跳过小文件',
+    'images_skipped_corrupt': '跳过损坏图片',
+    'images_hashed': '计算感知哈希',
+    'images_deduplicated': '合并近似重复图片',
+    'images_copied': '复制图片',
+    'images_mapped': '映射图片文件',
+    'images_embedded': '插入图片',
+    'thumbnails_created': '生成缩略图',
+    'report_shards': '报表分片',
+    'ocr_calls': 'OCR调用',
+    'ocr_batches': 'OCR批量调用',
+    'images_ocr_rejected': 'OCR未确认NG图片',
+    'ocr_gate_filename': '按文件名判定NG',
+    'ocr_gate_pixel': '按像素统计判定NG',
+    'ocr_gate_ocr': '需要OCR判定NG',
+    'rows_processed': '处理记录',
+    'rows_already_reported': '跳过已输出记录',
+    'rows_filtered': '按条件过滤记录',
+    'rows_resumed': '复用中断前的记录',
+    'rows_folder_missing': '未找到SN文件夹',
+    'rows_folder_ambiguous': '多个SN文件夹匹配',
+    'rows_failed': '处理失败记录',
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    将日志记录格式化为单行JSON
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(level='INFO', quiet=False, json_file=None, stream=None):
+    """
+    配置日志输出：控制台按级别输出，可选写入JSON日志文件
+
+    quiet 模式下控制台只输出警告和错误；JSON 文件始终记录 level 及以上的全部日志。
+    stream 默认为标准输出
+    """
+    level_no = getattr(logging, str(level).upper(), logging.INFO)
+
+    root = logging.getLogger()
+    # 重复调用时移除之前添加的处理器
+    for handler in list(root.handlers):
+        if getattr(handler, '_process_ng', False):
+            root.removeHandler(handler)
+            handler.close()
+
+    console = logging.StreamHandler(stream or sys.stdout)
+    console.setLevel(logging.WARNING if quiet else level_no)
+    console.setFormatter(logging.Formatter('%(message)s'))
+    console._process_ng = True
+    root.addHandler(console)
+
+    if json_file:
+        file_handler = logging.FileHandler(json_file, encoding='utf-8')
+        file_handler.setLevel(level_no)
+        file_handler.setFormatter(JsonFormatter())
+        file_handler._process_ng = True
+        root.addHandler(file_handler)
+
+    root.setLevel(level_no)
+
+
+def add_logging_arguments(parser):
+    """
+    为命令行解析器添加日志相关参数
+    """
+    parser.add_argument('--log-level', default='INFO', choices=LOG_LEVELS,
+                        help='日志级别，DEBUG 时输出逐张图片/逐个文件的明细')
+    parser.add_argument('--quiet', action='store_true', help='安静模式，控制台只输出警告和错误')
+    parser.add_argument('--log-json', default=None, help='JSON日志文件路径（每行一条记录）')
+
+
+def log_summary(logger):
+    """
+    输出汇总计数，代替逐条明细日志
+    """
+    for name, label in SUMMARY_LABELS.items():
+        if name in METRICS.counters:
+            logger.info("%s: %d", label, METRICS.counters[name])
@@ -0,0 +1,162 @@
+import os
+import csv
+import shutil
+import tempfile
+import subprocess
+import logging
+
+from run_metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# OCR参数（与原来的 pytesseract 调用保持一致）
+OCR_LANG = 'eng'
+OCR_PSM = 6
+
+# Tesseract 多页输出的页分隔符
+PAGE_SEPARATOR = '\f'
+
+
+class TesserocrBackend:
+    """
+    使用 tesserocr 常驻的识别引擎，模型只加载一次，每张图片不再启动新进程
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self, lang=OCR_LANG, psm=OCR_PSM):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self._api = tesserocr.PyTessBaseAPI(lang=lang, psm=psm)
+
+    def image_to_string(self, images):
+        """
+        识别一组图片（PIL图片或路径），返回每张图片的文本
+        """
+        texts = []
+        for image in images:
+            self._set_image(image)
+            texts.append(self._api.GetUTF8Text())
+        METRICS.incr('ocr_calls', len(images))
+        return texts
+
+    def image_to_data(self, images):
+        """
+        识别一组图片，返回每张图片的单词及置信度 {'text': [...], 'conf': [...]}
+        """
+        tesserocr = self._tesserocr
+        results = []
+        for image in images:
+            self._set_image(image)
+            self._api.Recognize()
+            words = {'text': [], 'conf': []}
+            iterator = self._api.GetIterator()
+            for word in tesserocr.iterate_level(iterator, tesserocr.RIL.WORD):
+                text = word.GetUTF8Text(tesserocr.RIL.WORD)
+                if text is None:
+                    continue
+                words['text'].append(text)
+                words['conf'].append(word.Confidence(tesserocr.RIL.WORD))
+            results.append(words)
+        METRICS.incr('ocr_calls', len(images))
+        return results
+
+    def _set_image(self, image):
+        if isinstance(image, str):
+            self._api.SetImageFile(image)
+        else:
+            self._api.SetImage(image)
+
+    def close(self):
+        self._api.End()
+
+
+class BatchTesseractBackend:
+    """
+    没有 tesserocr 时，把一组图片写入列表文件，一次 tesseract 调用识别全部图片
+
+    文本输出按页分隔符拆分，TSV输出按 page_num 分组
+    """
+
+    name = 'tesseract-batch'
+
+    def __init__(self, tesseract_cmd='tesseract', lang=OCR_LANG, psm=OCR_PSM):
+        self.tesseract_cmd = tesseract_cmd
+        self.lang = lang
+        self.psm = psm
+
+    def image_to_string(self, images):
+        """
+        识别一组图片（PIL图片或路径），返回每张图片的文本
+        """
+        if not images:
+            return []
+        output = self._run(images)
+        pages = output.split(PAGE_SEPARATOR)
+        # 每页文本后都有分隔符，最后一段为空
+        return (pages + [''] * len(images))[:len(images)]
+
+    def image_to_data(self, images):
+        """
+        识别一组图片，返回每张图片的单词及置信度 {'text': [...], 'conf': [...]}
+        """
+        if not images:
+            return []
+        output = self._run(images, 'tsv')
+        results = [{'text': [], 'conf': []} for _ in images]
+        for row in csv.DictReader(output.splitlines(), delimiter='\t', quoting=csv.QUOTE_NONE):
+            try:
+                page = int(row['page_num']) - 1
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 0 <= page < len(images):
+                results[page]['text'].append(row.get('text') or '')
+                results[page]['conf'].append(row.get('conf') or '-1')
+        return results
+
+    def _run(self, images, *configs):
+        """
+        执行一次 tesseract，输入为图片列表文件，返回标准输出文本
+        """
+        temp_dir = tempfile.mkdtemp(prefix='ocr_batch_')
+        try:
+            paths = []
+            for index, image in enumerate(images):
+                if isinstance(image, str):
+                    paths.append(os.path.abspath(image))
+                else:
+                    # 预处理后的图片先保存为PNG
+                    path = os.path.join(temp_dir, f"{index:05d}.png")
+                    image.save(path)
+                    paths.append(path)
+
+            list_path = os.path.join(temp_dir, 'images.txt')
+            with open(list_path, 'w', encoding='utf-8') as f:
+                f.write("\n".join(paths) + "\n")
+
+            command = [self.tesseract_cmd, list_path, 'stdout', '-l', self.lang, '--psm', str(self.psm)]
+            command.extend(configs)
+            completed = subprocess.run(command, capture_output=True)
+            METRICS.incr('ocr_batches')
+            METRICS.incr('ocr_calls', len(images))
+            if completed.returncode != 0:
+                raise RuntimeError(f"tesseract 执行失败: {completed.stderr.decode('utf-8', 'replace').strip()}")
+            return completed.stdout.decode('utf-8', 'replace')
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def close(self):
+        pass
+
+
+def create_ocr_backend(tesseract_cmd='tesseract'):
+    """
+    优先使用 tesserocr 常驻引擎，未安装时使用批量调用 tesseract 命令
+    """
+    try:
+        backend = TesserocrBackend()
+    except Exception as e:
+        logger.debug("tesserocr 不可用，改为批量调用 tesseract: %s", e)
+        backend = BatchTesseractBackend(tesseract_cmd)
+    logger.info("OCR后端: %s", backend.name)
+    return backend
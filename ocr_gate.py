@@ -0,0 +1,151 @@
+import os
+import logging
+
+from PIL import Image as PILImage
+
+from run_metrics import METRICS
+from catalog import parse_image_name
+
+logger = logging.getLogger(__name__)
+
+# 判定顶部结果横幅（"Glue Check Result:NG" 红字 / ":OK" 绿字）时使用的区域和阈值
+BANNER_HEIGHT_RATIO = 0.12  # 横幅位于图片顶部 12% 的区域
+BANNER_SAMPLE_SIZE = (160, 16)  # 统计前缩小到的尺寸
+BANNER_MIN_RATIO = 0.02  # 红色/绿色像素至少占横幅区域的比例
+BANNER_DOMINANCE = 4  # 主色像素数至少是另一种颜色的倍数
+
+# 各级判定的计数器名称（按判定顺序）
+GATE_TIERS = ['filename', 'pixel', 'ocr']
+
+
+def filename_verdict(img_path):
+    """
+    第一级：按图片命名规则判定
+
+    CAP图片上的结果横幅与文件名中的判定结果一致，NG-CAP 直接判定为NG，OK图片判定为非NG；
+    SRC原图或不符合命名规则的文件返回None，交给下一级判定
+    """
+    fields = parse_image_name(os.path.basename(img_path))
+    if not fields:
+        return None
+    if fields['verdict'] == 'OK':
+        return False
+    if fields['kind'] == 'CAP':
+        return True
+    return None
+
+
+def is_blank_image(img):
+    """
+    检测图片是否完全是空白或噪点（无实际内容）
+    """
+    try:
+        # 转换为灰度图
+        gray = img.convert('L')
+
+        # 计算像素值方差
+        pixels = list(gray.getdata())
+        mean = sum(pixels) / len(pixels)
+        variance = sum((p - mean) ** 2 for p in pixels) / len(pixels)
+
+        # 如果方差很小，说明图片很均匀（可能是空白）
+        if variance < 100:  # 经验值，可根据需要调整
+            return True
+
+        # 检查是否有大量相同颜色的像素
+        color_counts = {}
+        for pixel in pixels:
+            color_counts[pixel] = color_counts.get(pixel, 0) + 1
+
+        # 如果某个颜色占比超过95%，可能是空白图片
+        max_count = max(color_counts.values())
+        if max_count / len(pixels) > 0.95:
+            return True
+
+        return False
+    except Exception as e:
+        logger.warning("空白检测失败: %s", e)
+        return False
+
+
+def banner_colors(img):
+    """
+    统计顶部横幅区域中红色和绿色像素的比例 (红, 绿)
+    """
+    width, height = img.size
+    banner = img.crop((0, 0, width, max(1, int(height * BANNER_HEIGHT_RATIO))))
+    banner = banner.convert('RGB').resize(BANNER_SAMPLE_SIZE)
+    total = BANNER_SAMPLE_SIZE[0] * BANNER_SAMPLE_SIZE[1]
+    red = green = 0
+    for count, (r, g, b) in banner.getcolors(total):
+        if r > 180 and g < 80 and b < 80:
+            red += count
+        elif g > 180 and r < 100 and b < 100:
+            green += count
+    return red / total, green / total
+
+
+def pixel_verdict(img_path):
+    """
+    第二级：按缩小后的像素统计判定
+
+    空白图片判定为非NG；顶部横幅以红色为主判定为NG，以绿色为主判定为非NG；其余返回None
+    """
+    with PILImage.open(img_path) as img:
+        # JPEG按1/4尺寸解码，只需要粗略的颜色分布
+        img.draft('RGB', (img.width // 4, img.height // 4))
+        img = img.convert('RGB')
+
+    thumbnail = img.copy()
+    thumbnail.thumbnail((128, 128))
+    if is_blank_image(thumbnail):
+        return False
+
+    red, green = banner_colors(img)
+    if red >= BANNER_MIN_RATIO and red > green * BANNER_DOMINANCE:
+        return True
+    if green >= BANNER_MIN_RATIO and green > red * BANNER_DOMINANCE:
+        return False
+    return None
+
+
+def gate_image(img_path):
+    """
+    依次执行文件名和像素两级判定，返回 (判定结果, 判定级别)
+
+    判定结果为None时需要OCR，级别为 'ocr'
+    """
+    verdict = filename_verdict(img_path)
+    if verdict is not None:
+        METRICS.incr('ocr_gate_filename')
+        return verdict, 'filename'
+
+    try:
+        verdict = pixel_verdict(img_path)
+    except Exception as e:
+        logger.debug("像素统计失败: %s - %s", os.path.basename(img_path), e)
+        verdict = None
+    if verdict is not None:
+        METRICS.incr('ocr_gate_pixel')
+        return verdict, 'pixel'
+
+    METRICS.incr('ocr_gate_ocr')
+    return None, 'ocr'
+
+
+def gate_hit_rates():
+    """
+    各级判定的命中比例 {级别: 比例}
+    """
+    counts = {tier: METRICS.counters.get(f'ocr_gate_{tier}', 0) for tier in GATE_TIERS}
+    total = sum(counts.values())
+    return {tier: (count / total if total else 0.0) for tier, count in counts.items()}
+
+
+def log_gate_summary(log=logger):
+    """
+    输出各级判定的命中比例
+    """
+    rates = gate_hit_rates()
+    log.info("NG判定命中率: 文件名 %.1f%%, 像素统计 %.1f%%, OCR %.1f%%",
+             rates['filename'] * 100, rates['pixel'] * 100, rates['ocr'] * 100)
@@ -0,0 +1,195 @@
+import os
+import re
+import shutil
+import logging
+
+from PIL import Image as PILImage
+
+from run_metrics import METRICS
+from records import SelectionResult
+from ocr_gate import gate_image
+from ocr_backend import create_ocr_backend
+
+logger = logging.getLogger(__name__)
+
+# 常见的Tesseract安装位置（找不到时使用系统路径中的 tesseract 命令）
+TESSERACT_PATHS = [
+    r'C:\Program Files\Tesseract-OCR\tesseract.exe',
+    r'D:\Tesseract-OCR\tesseract.exe',
+    r'/usr/bin/tesseract',
+    r'/usr/local/bin/tesseract'
+]
+
+# OCR后端（首次需要OCR时创建，之后一直复用）
+_ocr_backend = None
+
+# 本次运行中已判定过的图片 {路径: 是否NG}
+_ng_verdicts = {}
+
+
+# 使用的tesseract命令（None表示自动查找）
+_tesseract_cmd = None
+
+
+def find_tesseract_cmd():
+    """
+    查找tesseract命令路径
+    """
+    for path in TESSERACT_PATHS:
+        if os.path.exists(path):
+            return path
+    return shutil.which('tesseract') or 'tesseract'
+
+
+def set_tesseract_cmd(cmd):
+    """
+    指定tesseract命令路径（在首次OCR之前调用）
+    """
+    global _tesseract_cmd
+    _tesseract_cmd = cmd
+
+
+def get_ocr_backend():
+    global _ocr_backend
+    if _ocr_backend is None:
+        _ocr_backend = create_ocr_backend(_tesseract_cmd or find_tesseract_cmd())
+    return _ocr_backend
+
+
+def _filename_has_ng(img_path):
+    """
+    严格检查文件名是否包含'NG'（排除ANG/ING/ONG/UNG等单词）
+    """
+    filename = os.path.basename(img_path).upper()
+    return 'NG' in filename and not any(word in filename for word in ['ANG', 'ING', 'ONG', 'UNG'])
+
+
+def _confidence(value):
+    try:
+        return max(float(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _binarize(img_path):
+    """
+    图像预处理：转换为灰度图后二值化
+    """
+    with PILImage.open(img_path) as img:
+        gray = img.convert('L')
+    threshold = 150
+    return gray.point(lambda p: p > threshold and 255)
+
+
+def filter_ng_text(img_paths):
+    """
+    分级验证图片中是否包含'NG'文字，返回确认包含NG的图片（保持原顺序）
+
+    先按文件名规则，再按像素统计（空白图片、结果横幅颜色）判定，两者都无法判断的图片
+    一起交给OCR批量识别
+    """
+    ambiguous = []
+    for img_path in img_paths:
+        if img_path in _ng_verdicts:
+            continue
+        verdict, tier = gate_image(img_path)
+        if verdict is None:
+            ambiguous.append(img_path)
+            continue
+        logger.debug("%s判定%s: %s", tier, "NG" if verdict else "非NG", os.path.basename(img_path))
+        _ng_verdicts[img_path] = verdict
+
+    if ambiguous:
+        _ng_verdicts.update(ocr_verify_images(ambiguous))
+
+    return [img_path for img_path in img_paths if _ng_verdicts[img_path]]
+
+
+def contains_ng_text(img_path):
+    """
+    验证单张图片中是否包含'NG'文字
+    """
+    return bool(filter_ng_text([img_path]))
+
+
+def ocr_verify_images(img_paths):
+    """
+    用OCR严格验证一组图片中是否包含'NG'文字，返回 {路径: 是否NG}
+
+    三种识别方法各对整组图片批量执行一次，前一种方法已确认的图片不再参与后面的识别
+    """
+    verdicts = {}
+    backend = get_ocr_backend()
+    try:
+        # 方法1: 直接OCR识别
+        pending = list(img_paths)
+        for img_path, ocr_result in zip(pending, backend.image_to_string(pending)):
+            if re.search(r'\bNG\b', ocr_result, re.IGNORECASE):
+                verdicts[img_path] = True
+
+        # 方法2: 使用OCR获取文本位置信息，专门检测"NG"区域
+        pending = [img_path for img_path in pending if img_path not in verdicts]
+        remaining = []
+        for img_path, ocr_data in zip(pending, backend.image_to_data(pending)):
+            total_text = ""
+            ng_detected = False
+            for text, conf in zip(ocr_data['text'], ocr_data['conf']):
+                text = text.strip()
+                total_text += text + " "
+
+                # 检测NG文本（检查置信度）
+                if re.search(r'\bNG\b', text, re.IGNORECASE) and _confidence(conf) > 60:
+                    ng_detected = True
+                    break
+
+            if ng_detected:
+                verdicts[img_path] = True
+                continue
+
+            # 检查总文本长度 - 如果几乎没有文字，则不是NG图片
+            clean_text = re.sub(r'\s+', '', total_text)  # 移除所有空白字符
+            if len(clean_text) < 3:  # 少于3个字符视为无文字
+                logger.debug("跳过无文字图片: %s", os.path.basename(img_path))
+                verdicts[img_path] = False
+                continue
+            remaining.append(img_path)
+
+        # 方法3: 图像预处理后再次识别
+        binaries = [_binarize(img_path) for img_path in remaining]
+        for img_path, ocr_result in zip(remaining, backend.image_to_string(binaries)):
+            if re.search(r'\bNG\b', ocr_result, re.IGNORECASE):
+                verdicts[img_path] = True
+            # 如果所有OCR方法都失败，检查文件名是否包含'NG'
+            elif _filename_has_ng(img_path):
+                logger.debug("警告: 基于文件名包含NG但未识别内容: %s", os.path.basename(img_path))
+                verdicts[img_path] = True
+            else:
+                verdicts[img_path] = False
+    except Exception as e:
+        logger.warning("OCR处理失败: %s", e)
+        # 如果OCR失败，严格检查文件名
+        for img_path in img_paths:
+            verdicts.setdefault(img_path, _filename_has_ng(img_path))
+
+    return verdicts
+
+
+def verify_selection(selection):
+    """
+    对按设备类型挑选出的NG图片做OCR验证，去掉未确认包含NG的图片并在备注中说明
+
+    只验证最终选中的图片（每个SN最多两张），返回新的 SelectionResult
+    """
+    if not selection.ng_images:
+        return selection
+
+    with METRICS.stage('ocr'):
+        verified = filter_ng_text(selection.ng_images)
+    if len(verified) == len(selection.ng_images):
+        return selection
+
+    rejected = [os.path.basename(img) for img in selection.ng_images if img not in verified]
+    METRICS.incr('images_ocr_rejected', len(rejected))
+    remarks = [selection.remark] if selection.remark else []
+    remarks.append(f"Failed: OCR未确认NG图片: {', '.join(rejected)}")
+    return SelectionResult(verified, selection.locate_image, "\n".join(remarks))
@@ -4,16 +4,33 @@ from openpyxl.utils import get_column_letter
 from openpyxl.styles import Alignment, Font, PatternFill, Border, Side
 import os
 from datetime import datetime
-import shutil
 import re
-import glob
 import sys
 import subprocess
-from PIL import Image as PILImage
-import traceback
 import argparse
-
-from extract_zip_files import start_extract_zip
+import logging
+
+from extract_zip_files import start_extract_zip, add_tree_arguments
+from run_metrics import METRICS
+from log_utils import setup_logging, add_logging_arguments, log_summary
+from profiling import StageProfiler, add_profile_argument
+from image_selection import DEVICE_TYPES, find_sn_folders, process_images_for_devices
+from report_state import ReportState, row_key
+from selection_cache import SelectionCache
+from async_io import get_file_io, configure_file_io, add_io_arguments
+from image_access import get_image_store
+from records import RowResult
+from ocr_verify import verify_selection
+from ocr_gate import log_gate_summary
+from columnar_export import COLUMNAR_FORMATS, export_rows
+from html_report import write_html_report
+from report_shards import write_sharded_workbooks, add_shard_arguments, shard_spec_from_args
+from row_filters import add_filter_arguments, row_filter_from_args
+from image_dedup import ImageDeduplicator, add_dedup_arguments
+from run_journal import RunJournal, run_key
+from catalog import open_catalog
+
+logger = logging.getLogger(__name__)
 
 
 # 检查并安装必要的依赖
@@ -25,25 +42,25 @@ def install_dependencies():
     try:
         import PIL
     except ImportError:
-        print("正在安装必要的依赖库 Pillow...")
+        logger.warning("正在安装必要的依赖库 Pillow...")
         try:
             subprocess.check_call([sys.executable, "-m", "pip", "install", "pillow"])
-            print("Pillow 安装成功！")
+            logger.warning("Pillow 安装成功！")
             installed = True
         except Exception as e:
-            print(f"安装 Pillow 失败: {str(e)}")
-            print("请手动安装: pip install pillow")
+            logger.error("安装 Pillow 失败: %s", e)
+            logger.error("请手动安装: pip install pillow")
             sys.exit(1)
 
     if installed:
-        print("所有依赖已成功安装，请重新运行脚本")
+        logger.warning("所有依赖已成功安装，请重新运行脚本")
         return True
     return True
 
 
 # 安装依赖
 if not install_dependencies():
-    print("依赖安装失败，请手动安装必要组件")
+    logger.error("依赖安装失败，请手动安装必要组件")
     sys.exit(1)
 
 # 忽略openpyxl的样式警告
@@ -55,358 +72,21 @@ warnings.filterwarnings('ignore', category=UserWarning, module='openpyxl.styles.
 IMAGE_HEIGHT = 120  # 图片高度（像素）
 IMAGE_MARGIN = 15  # 图片间距（像素）
 
-# 设备类型
-DEVICE_TYPES = ['1100', '660', '1174', '639']
-
-
-def find_sn_folders(sn, data_dir='data'):
-    """
-    在data目录中查找包含指定SN的文件夹
-    """
-    sn_str = str(sn).strip() if sn is not None else ""
-    if not sn_str:
-        return []
-
-    # 检查data_dir是否存在
-    if not os.path.exists(data_dir):
-        print(f"目录 {data_dir} 不存在，跳过文件夹搜索")
-        return []
-
-    # 查找包含SN的文件夹
-    matched_folders = []
-    for root, dirs, files in os.walk(data_dir):
-        for dir_name in dirs:
-            if sn_str in dir_name:
-                matched_folders.append(os.path.join(root, dir_name))
-
-    return matched_folders
-
-
-def find_all_images_in_folder(folder_path):
-    """
-    在指定文件夹中查找所有图片
-    """
-    all_images = []
-    min_file_size = 10 * 1024  # 10KB最小文件大小
-
-    if not os.path.exists(folder_path):
-        return all_images
-
-    # 查找所有图片文件
-    for ext in ['*.jpg', '*.jpeg', '*.png']:
-        for img_path in glob.glob(os.path.join(folder_path, ext)):
-            # 检查文件大小
-            if os.path.getsize(img_path) < min_file_size:
-                print(f"跳过小文件: {os.path.basename(img_path)} (大小: {os.path.getsize(img_path) / 1024:.1f}KB)")
-                continue
-
-            # 检查是否为有效图片
-            try:
-                with PILImage.open(img_path) as img:
-                    img.verify()  # 验证图片完整性
-            except Exception as e:
-                print(f"跳过损坏图片: {os.path.basename(img_path)} - {str(e)}")
-                continue
-
-            all_images.append(img_path)
-
-    return all_images
-
-
-def filter_ng_images(images, device_type):
-    """
-    根据设备类型过滤NG图片
-    """
-    ng_images = []
-    src_images = []
-
-    for img_path in images:
-        img_name = os.path.basename(img_path).lower()
-
-        # 检查是否包含NG
-        if 'ng' in img_name:
-            # 检查是否包含src
-            if 'src' in img_name:
-                src_images.append(img_path)
-            else:
-                ng_images.append(img_path)
-
-    # 根据设备类型处理
-    if device_type in ['1100', '660']:
-        # 删除包含src的NG图片
-        ng_images = [img for img in ng_images if img not in src_images]
-
-        # 按修改时间排序，取最后几张
-        ng_images.sort(key=lambda x: os.path.getmtime(x))
-
-    elif device_type == '1174':
-        # 删除包含src的NG图片
-        ng_images = [img for img in ng_images if img not in src_images]
-
-        # 按修改时间排序，取最后几张
-        ng_images.sort(key=lambda x: os.path.getmtime(x))
-
-    elif device_type == '639':
-        # 删除包含src的NG图片
-        ng_images = [img for img in ng_images if img not in src_images]
-
-        # 按修改时间排序，取最后几张
-        ng_images.sort(key=lambda x: os.path.getmtime(x))
-
-    return ng_images, src_images
-
-
-def filter_ok_images(images):
-    """
-    过滤OK图片
-    """
-    ok_images = []
-
-    for img_path in images:
-        img_name = os.path.basename(img_path).lower()
-
-        # 检查是否包含OK
-        if 'ok' in img_name:
-            ok_images.append(img_path)
-
-    return ok_images
-
-
-def process_1100_660(ng_images, ok_images, folder_path):
-    """
-    处理1100和660类型的图片
-    """
-    remarks = []
-    locate_image = None
-
-    if len(ng_images) == 0:
-        remarks.append("Error: 未找到NG图片")
-        return ng_images, locate_image, "\n".join(remarks)
-
-    # 检查是否全是src图片
-    if len(ng_images) == 0 and len(ok_images) > 0:
-        remarks.append("Error: 只有OK图片，没有NG图片")
-        return ng_images, locate_image, "\n".join(remarks)
-
-    # 如果只有一张NG图片
-    if len(ng_images) == 1:
-        ng_image = ng_images[0]
-        ng_name = os.path.basename(ng_image)
-
-        # 提取NG前的名称部分
-        match = re.search(r'(\d{14}-Station\d+)', ng_name)
-        if match:
-            ng_prefix = match.group(1)
-
-            # 查找对应的OK图片
-            for ok_image in ok_images:
-                ok_name = os.path.basename(ok_image)
-                if ng_prefix in ok_name and 'ok' in ok_name.lower():
-                    locate_image = ok_image
-                    break
-
-            # 如果没有找到完全匹配的OK图片，查找类似的
-            if not locate_image:
-                for ok_image in ok_images:
-                    ok_name = os.path.basename(ok_image)
-                    # 检查是否有类似的OK图片（例如不同的Station编号）
-                    if re.search(r'\d{14}-Station\d+-OK', ok_name, re.IGNORECASE):
-                        remarks.append(f"Failed: 未找到完全匹配的OK图片，但有类似的OK图片: {os.path.basename(ok_image)}")
-                        break
-
-        return [ng_image], locate_image, "\n".join(remarks) if remarks else ""
-
-    # 如果有多张NG图片，取最后2张
-    if len(ng_images) > 1:
-        selected_ng_images = ng_images[-2:]
-
-        # 检查两张NG图片的名称是否一致
-        ng_name1 = os.path.basename(selected_ng_images[0])
-        ng_name2 = os.path.basename(selected_ng_images[1])
-
-        match1 = re.search(r'(\d{14}-Station\d+)', ng_name1)
-        match2 = re.search(r'(\d{14}-Station\d+)', ng_name2)
-
-        if match1 and match2:
-            ng_prefix1 = match1.group(1)
-            ng_prefix2 = match2.group(1)
-
-            if ng_prefix1 != ng_prefix2:
-                remarks.append(f"Failed: 两张NG图片名称不一致: {ng_prefix1} vs {ng_prefix2}")
-            else:
-                # 查找对应的OK图片
-                for ok_image in ok_images:
-                    ok_name = os.path.basename(ok_image)
-                    if ng_prefix1 in ok_name and 'ok' in ok_name.lower():
-                        locate_image = ok_image
-                        break
-
-                # 如果没有找到完全匹配的OK图片，查找类似的
-                if not locate_image:
-                    for ok_image in ok_images:
-                        ok_name = os.path.basename(ok_image)
-                        # 检查是否有类似的OK图片（例如不同的Station编号）
-                        if re.search(r'\d{14}-Station\d+-OK', ok_name, re.IGNORECASE):
-                            remarks.append(
-                                f"Failed: 未找到完全匹配的OK图片，但有类似的OK图片: {os.path.basename(ok_image)}")
-                            break
-
-        return selected_ng_images, locate_image, "\n".join(remarks) if remarks else ""
-
-    return ng_images, locate_image, "\n".join(remarks) if remarks else ""
-
-
-def process_1174(ng_images, ok_images, folder_path):
-    """
-    处理1174类型的图片
-    """
-    remarks = []
-    locate_image = None
-
-    if len(ng_images) == 0:
-        remarks.append("Error: 未找到NG图片")
-        return ng_images, locate_image, "\n".join(remarks)
-
-    # 如果只有一张NG图片
-    if len(ng_images) == 1:
-        ng_image = ng_images[0]
-        ng_name = os.path.basename(ng_image)
-
-        # 提取NG前的名称部分
-        match = re.search(r'(Pose\d+_\d{12})', ng_name)
-        if match:
-            ng_prefix = match.group(1)
-
-            # 查找对应的OK图片
-            for ok_image in ok_images:
-                ok_name = os.path.basename(ok_image)
-                if ng_prefix in ok_name and 'ok' in ok_name.lower():
-                    locate_image = ok_image
-                    break
-
-            # 如果没有找到完全匹配的OK图片，查找类似的
-            if not locate_image:
-                for ok_image in ok_images:
-                    ok_name = os.path.basename(ok_image)
-                    # 检查是否有类似的OK图片（例如不同的Pose编号）
-                    if re.search(r'Pose\d+_\d{12}-OK', ok_name, re.IGNORECASE):
-                        remarks.append(f"Failed: 未找到完全匹配的OK图片，但有类似的OK图片: {os.path.basename(ok_image)}")
-                        break
-
-        return [ng_image], locate_image, "\n".join(remarks) if remarks else ""
-
-    # 如果有多张NG图片，取最后2张
-    if len(ng_images) > 1:
-        selected_ng_images = ng_images[-2:]
-
-        # 检查两张NG图片的名称是否一致
-        ng_name1 = os.path.basename(selected_ng_images[0])
-        ng_name2 = os.path.basename(selected_ng_images[1])
-
-        match1 = re.search(r'(Pose\d+_\d{12})', ng_name1)
-        match2 = re.search(r'(Pose\d+_\d{12})', ng_name2)
-
-        if match1 and match2:
-            ng_prefix1 = match1.group(1)
-            ng_prefix2 = match2.group(1)
-
-            if ng_prefix1 != ng_prefix2:
-                remarks.append(f"Failed: 两张NG图片名称不一致: {ng_prefix1} vs {ng_prefix2}")
-            else:
-                # 查找对应的OK图片
-                for ok_image in ok_images:
-                    ok_name = os.path.basename(ok_image)
-                    if ng_prefix1 in ok_name and 'ok' in ok_name.lower():
-                        locate_image = ok_image
-                        break
-
-                # 如果没有找到完全匹配的OK图片，查找类似的
-                if not locate_image:
-                    for ok_image in ok_images:
-                        ok_name = os.path.basename(ok_image)
-                        # 检查是否有类似的OK图片（例如不同的Pose编号）
-                        if re.search(r'Pose\d+_\d{12}-OK', ok_name, re.IGNORECASE):
-                            remarks.append(
-                                f"Failed: 未找到完全匹配的OK图片，但有类似的OK图片: {os.path.basename(ok_image)}")
-                            break
-
-        return selected_ng_images, locate_image, "\n".join(remarks) if remarks else ""
-
-    return ng_images, locate_image, "\n".join(remarks) if remarks else ""
-
-
-def process_639(ng_images, ok_images, folder_path):
-    """
-    处理639类型的图片
-    """
-    remarks = []
-    locate_image = None
-
-    if len(ng_images) == 0:
-        remarks.append("Error: 未找到NG图片")
-        return ng_images, locate_image, "\n".join(remarks)
-
-    # 如果有多张NG图片，取最后2张
-    if len(ng_images) > 1:
-        ng_images = ng_images[-2:]
-
-    # 如果有OK图片，选择第一张作为locate image
-    if ok_images:
-        locate_image = ok_images[0]
-
-    return ng_images, locate_image, "\n".join(remarks) if remarks else ""
-
-
-def process_images_by_device_type(device_type, folder_path):
-    """
-    根据设备类型处理图片
-    """
-    # 查找所有图片
-    all_images = find_all_images_in_folder(folder_path)
-
-    # 检查文件夹是否为空
-    if not all_images:
-        return [], None, "Error: 文件夹为空"
-
-    # 过滤NG图片和OK图片
-    ng_images, src_images = filter_ng_images(all_images, device_type)
-    ok_images = filter_ok_images(all_images)
-
-    # 检查是否全是src图片
-    if len(ng_images) == 0 and len(src_images) > 0:
-        return [], None, "Error: 只有包含src的NG图片"
-
-    # 检查是否没有NG图片但有OK图片
-    if len(ng_images) == 0 and len(ok_images) > 0:
-        return [], None, "Error: 只有OK图片，没有NG图片"
-
-    # 检查是否没有NG图片也没有OK图片
-    if len(ng_images) == 0 and len(ok_images) == 0:
-        return [], None, "Error: 未找到包含NG或OK的图片"
-
-    # 根据设备类型调用不同的处理函数
-    if device_type in ['1100', '660']:
-        return process_1100_660(ng_images, ok_images, folder_path)
-    elif device_type == '1174':
-        return process_1174(ng_images, ok_images, folder_path)
-    elif device_type == '639':
-        return process_639(ng_images, ok_images, folder_path)
-
-    return [], None, "Error: 未知的设备类型"
-
 
 def calculate_image_size(img_path, target_height):
     """
     计算调整后的图片大小（保持宽高比）
     """
     try:
-        with PILImage.open(img_path) as img:
-            # 保持宽高比调整大小
-            width_ratio = target_height / img.height
-            new_width = int(img.width * width_ratio)
+        with METRICS.stage('thumbnail'):
+            # 从映射的文件头读取尺寸，保持宽高比调整大小
+            with get_image_store().mapped(img_path) as image:
+                width, height = image.dimensions
+            width_ratio = target_height / height
+            new_width = int(width * width_ratio)
             return new_width, target_height
     except Exception as e:
-        print(f"计算图片大小失败: {str(e)}")
+        logger.warning("计算图片大小失败: %s", e)
         return 100, 100  # 默认大小
 
 
@@ -430,7 +110,7 @@ def insert_images_horizontally(worksheet, row_idx, start_col, image_paths):
             if height > max_img_height:
                 max_img_height = height
         except Exception as e:
-            print(f"计算图片尺寸失败: {str(e)}")
+            logger.warning("计算图片尺寸失败: %s", e)
             continue
 
     # 设置行高（关键修改：使用精确计算方式）
@@ -439,7 +119,7 @@ def insert_images_horizontally(worksheet, row_idx, start_col, image_paths):
         # 精确计算公式：行高 = (图片高度 + 上边距) / 1.33
         exact_row_height = (max_img_height + IMAGE_MARGIN) / 1.33
         worksheet.row_dimensions[row_idx].height = exact_row_height
-        print(f"精确设置行 {row_idx} 高度: {exact_row_height:.2f} (像素高度: {max_img_height}+{IMAGE_MARGIN})")
+        logger.debug("精确设置行 %d 高度: %.2f (像素高度: %d+%d)", row_idx, exact_row_height, max_img_height, IMAGE_MARGIN)
 
     # 插入图片
     for idx, (img_path, (width, height)) in enumerate(zip(image_paths, img_sizes)):
@@ -447,17 +127,19 @@ def insert_images_horizontally(worksheet, row_idx, start_col, image_paths):
             current_col = start_col + idx
             col_widths[current_col] = width
 
-            img = Image(img_path)
-            img.width = width
-            img.height = height
+            with METRICS.stage('embed'):
+                img = Image(get_image_store().reader(img_path))
+                img.width = width
+                img.height = height
 
-            # 关键修改：使用单元格锚定方式（消除额外空白）
-            cell_anchor = f"{get_column_letter(current_col)}{row_idx}"
-            img.anchor = cell_anchor
-            worksheet.add_image(img)
+                # 关键修改：使用单元格锚定方式（消除额外空白）
+                cell_anchor = f"{get_column_letter(current_col)}{row_idx}"
+                img.anchor = cell_anchor
+                worksheet.add_image(img)
             images_added.append(img)
+            METRICS.incr('images_embedded')
         except Exception as e:
-            print(f"插入图片失败: {str(e)}")
+            logger.warning("插入图片失败: %s", e)
 
     return col_widths, images_added
 
@@ -474,7 +156,7 @@ def apply_image_dimensions(worksheet, col_widths):
         col_width = max(15, width_px * PIXELS_TO_EXCEL_UNITS)
         col_letter = get_column_letter(col_idx)
         worksheet.column_dimensions[col_letter].width = col_width
-        print(f"设置列 {col_letter} 宽度为: {col_width} (基于图片宽度: {width_px} 像素)")
+        logger.debug("设置列 %s 宽度为: %s (基于图片宽度: %s 像素)", col_letter, col_width, width_px)
 
 
 def format_excel(worksheet):
@@ -553,7 +235,245 @@ def format_excel(worksheet):
     worksheet.freeze_panes = 'A2'
 
 
-def extract_columns(device_type, input_file):
+def _copied_images_exist(result):
+    """
+    检查之前复制到结果目录的图片是否仍然存在
+    """
+    paths = result.ng_images + ([result.locate_image] if result.locate_image else [])
+    return all(os.path.exists(path) for path in paths)
+
+
+def _is_complete(result):
+    """
+    行结果中没有错误（例如未找到文件夹），增量模式只登记这样的记录，出错的记录下次运行重新处理
+    """
+    return not any(line.startswith("Error:") for line in result.remark.split("\n"))
+
+
+def process_row_for_devices(results, images_dir, selection_cache=None, ocr_verify=False, dedup=None):
+    """
+    按多个设备类型的规则处理同一行记录，results 为 {设备类型: RowResult}
+
+    SN文件夹查找、图片扫描验证和复制只执行一次，各设备类型只分别执行挑选规则
+    """
+    sn_value = next(iter(results.values())).sn
+
+    # 查找SN对应的文件夹
+    sn_folders = find_sn_folders(sn_value)
+
+    if len(sn_folders) > 1:
+        # 多个文件夹匹配，记录错误
+        folder_names = ", ".join([os.path.basename(f) for f in sn_folders])
+        for result in results.values():
+            result.add_remark(f"Error: 多个文件夹匹配 - {folder_names}")
+        logger.debug("为SN %s 找到多个匹配文件夹: %s", sn_value, folder_names)
+        METRICS.incr('rows_folder_ambiguous', len(results))
+        return
+
+    if not sn_folders:
+        # 没有找到匹配的文件夹
+        for result in results.values():
+            result.add_remark("Error: 未找到包含SN的文件夹")
+        logger.debug("为SN %s 未找到匹配文件夹", sn_value)
+        METRICS.incr('rows_folder_missing', len(results))
+        return
+
+    # 找到一个文件夹，在其中处理图片
+    folder = sn_folders[0]
+    logger.debug("为SN %s 找到匹配文件夹: %s", sn_value, os.path.basename(folder))
+
+    # 根据设备类型处理图片（多个设备类型共用一次扫描和验证）
+    selections = process_images_for_devices(list(results), folder, cache=selection_cache, dedup=dedup)
+    if ocr_verify:
+        selections = {device_type: verify_selection(selection) for device_type, selection in selections.items()}
+
+    # 复制图片到结果目录
+    with METRICS.stage('copy'):
+        # 所有设备类型选中的NG图片和定位图片一起并发复制，相同的图片只复制一次
+        sources = []
+        for selection in selections.values():
+            sources.extend(selection.ng_images)
+            if selection.locate_image:
+                sources.append(selection.locate_image)
+        sources = list(dict.fromkeys(sources))
+        pairs = [(img_path, os.path.join(images_dir, os.path.basename(img_path))) for img_path in sources]
+        copied = dict(zip(sources, get_file_io().copy_many(pairs, copier=get_image_store().copy)))
+
+        for img_path, dest_path in copied.items():
+            if isinstance(dest_path, Exception):
+                logger.warning("复制图片失败: %s", dest_path)
+            else:
+                METRICS.incr('images_copied')
+
+    for device_type, result in results.items():
+        selection = selections[device_type]
+        result.folder = folder
+        result.ng_images.extend(copied[img_path] for img_path in selection.ng_images
+                                if not isinstance(copied[img_path], Exception))
+        locate_image = selection.locate_image
+        if locate_image and not isinstance(copied[locate_image], Exception):
+            result.locate_image = copied[locate_image]
+
+        # 添加处理备注
+        result.add_remark(selection.remark)
+
+
+def _merge_col_widths(all_col_widths, col_widths):
+    """
+    更新全局列宽记录（取最大值）
+    """
+    for col_idx, width in col_widths.items():
+        if col_idx not in all_col_widths or width > all_col_widths[col_idx]:
+            all_col_widths[col_idx] = width
+
+
+def build_workbook(row_results):
+    """
+    根据行结果生成不良明细汇总工作簿（插入图片并格式化）
+    """
+    new_wb = Workbook()
+    new_sheet = new_wb.active
+    new_sheet.title = "不良明细汇总"
+
+    # 添加新标题（按指定顺序）
+    new_headers = [
+        'SN',
+        'QPL-Station Name',
+        'Gantry',
+        'Time(end)',
+        'Locate picture',
+        'NG picture',
+        'NG picture1',
+        'Remark'
+    ]
+
+    # 写入新标题
+    for col_idx, header in enumerate(new_headers, start=1):
+        new_sheet.cell(row=1, column=col_idx, value=header)
+
+    # 存储所有列的最大宽度
+    all_col_widths = {}
+
+    # 数据从第2行开始
+    for row_idx, result in enumerate(row_results, start=2):
+        try:
+            # 写入基础数据
+            new_sheet.cell(row=row_idx, column=1, value=result.sn)
+            new_sheet.cell(row=row_idx, column=2, value=result.station)
+            new_sheet.cell(row=row_idx, column=3, value=None)  # Gantry
+            new_sheet.cell(row=row_idx, column=4, value=result.time_end)
+            new_sheet.cell(row=row_idx, column=5, value=None)  # Locate picture
+
+            # 插入NG图片（最多两张）到NG picture和NG picture1列
+            for col_idx, img_path in zip((6, 7), result.ng_images[:2]):
+                col_widths, _ = insert_images_horizontally(new_sheet, row_idx, col_idx, [img_path])
+                _merge_col_widths(all_col_widths, col_widths)
+
+            # 插入定位图片到Locate picture列
+            if result.locate_image:
+                col_widths, _ = insert_images_horizontally(new_sheet, row_idx, 5, [result.locate_image])
+                _merge_col_widths(all_col_widths, col_widths)
+
+            if result.remark:
+                new_sheet.cell(row=row_idx, column=8, value=result.remark)
+        except Exception as e:
+            logger.exception("警告: 写入第 %d 行时出错 - %s", row_idx, e)
+
+    with METRICS.stage('format'):
+        # 应用图片尺寸到列宽
+        if all_col_widths:
+            apply_image_dimensions(new_sheet, all_col_widths)
+
+        # 格式化Excel表格
+        if new_sheet.max_row > 1:  # 确保有数据行
+            format_excel(new_sheet)
+
+    return new_wb
+
+
+def write_xlsx(row_results, path):
+    """
+    生成并保存xlsx报表
+    """
+    new_wb = build_workbook(row_results)
+    with METRICS.stage('save'):
+        new_wb.save(path)
+    return path
+
+
+# 报表支持的输出格式
+OUTPUT_FORMATS = ['xlsx', 'html'] + list(COLUMNAR_FORMATS)
+
+
+def parse_output_formats(text):
+    """
+    解析逗号分隔的输出格式，例如 "xlsx,csv"
+    """
+    formats = [item.strip().lower() for item in text.split(',') if item.strip()]
+    unknown = [fmt for fmt in formats if fmt not in OUTPUT_FORMATS]
+    if unknown or not formats:
+        raise argparse.ArgumentTypeError(f"不支持的输出格式: {text}（可选: {', '.join(OUTPUT_FORMATS)}）")
+    return list(dict.fromkeys(formats))
+
+
+def write_reports(row_results, output_base, output_formats=('xlsx',), shard_spec=None):
+    """
+    按指定格式输出报表（xlsx、HTML及列式格式），返回已写出的文件路径列表
+
+    shard_spec 启用时xlsx报表分片并行生成，另外输出分片索引工作簿
+    """
+    output_files = []
+    for fmt in output_formats:
+        if fmt == 'xlsx' and shard_spec is not None and shard_spec.enabled:
+            output_files.extend(write_sharded_workbooks(row_results, output_base, shard_spec, write_xlsx))
+        elif fmt == 'xlsx':
+            output_files.append(write_xlsx(row_results, output_base + '.xlsx'))
+        elif fmt == 'html':
+            output_files.append(write_html_report(row_results, output_base))
+        else:
+            path = export_rows(row_results, output_base, fmt)
+            if path:
+                output_files.append(path)
+    if not output_files:
+        raise ValueError(f"没有成功输出任何格式的报表: {', '.join(output_formats)}")
+    return output_files
+
+
+def extract_columns(device_type, input_file, incremental=False, use_cache=True, ocr_verify=False,
+                    output_formats=('xlsx',), shard_spec=None, row_filter=None, dedup_threshold=None):
+    """
+    生成不良明细汇总报表，返回输出文件路径（多种格式时返回第一个）
+
+    incremental 为 True 时只处理之前未输出过的 (SN, Station, Time End) 记录，
+    结果写入 _delta 文件；没有新记录时不生成文件并返回 None
+
+    use_cache 为 True 时复用之前运行中相同文件夹内容的挑选结果（result/selection_cache.sqlite3）
+
+    ocr_verify 为 True 时对挑选出的NG图片做OCR验证（需要安装Tesseract）
+
+    output_formats 为输出格式列表: xlsx、html、csv、parquet、arrow（后两者需要安装pyarrow）
+
+    shard_spec 为 ShardSpec 时按行数/图片数据量/站位将xlsx报表分片，在多个进程中并行生成
+
+    row_filter 为 RowFilter 时只处理满足条件（Time End 窗口、Station Name、SN名单）的源表记录
+
+    dedup_threshold 不为None时，挑选前用感知哈希合并汉明距离不超过该值的近似重复NG图片
+    """
+    output_files = extract_columns_for_devices([device_type], input_file, incremental, use_cache, ocr_verify,
+                                              output_formats, shard_spec, row_filter, dedup_threshold)
+    return output_files[device_type]
+
+
+def extract_columns_for_devices(device_types, input_file, incremental=False, use_cache=True, ocr_verify=False,
+                                output_formats=('xlsx',), shard_spec=None, row_filter=None, dedup_threshold=None,
+                                journal=None):
+    """
+    一次处理为多个设备类型生成报表，返回 {设备类型: 输出文件路径}（参数含义同 extract_columns）
+
+    源工作表只读取一次，每个SN的文件夹查找、图片扫描验证和复制在所有设备类型之间共用
+
+    journal 为 RunJournal 时边处理边记录行结果；继续中断的运行时直接复用已完成的行
+    """
     # 创建result目录（如果不存在）
     result_dir = "result"
     os.makedirs(result_dir, exist_ok=True)
@@ -562,14 +482,14 @@ def extract_columns(device_type, input_file):
     images_dir = os.path.join(result_dir, "images")
     os.makedirs(images_dir, exist_ok=True)
 
-    print(f"使用文件: {input_file}")
+    logger.info("使用文件: %s", input_file)
 
     # 检查文件是否存在
     if not os.path.exists(input_file):
         raise FileNotFoundError(f"输入文件不存在: {input_file}")
 
-    # 加载工作簿
-    wb = load_workbook(input_file, data_only=True)
+    # 以只读方式加载工作簿，逐行流式读取源表
+    wb = load_workbook(input_file, data_only=True, read_only=True)
 
     # 查找包含"不良明细"的工作表
     target_sheet = None
@@ -582,19 +502,22 @@ def extract_columns(device_type, input_file):
         available_sheets = "\n".join(wb.sheetnames)
         raise ValueError(f"未找到包含'不良明细'的工作表。可用工作表有：\n{available_sheets}")
 
-    print(f"找到目标工作表: {target_sheet}")
+    logger.info("找到目标工作表: %s", target_sheet)
 
     # 获取目标工作表
     sheet = wb[target_sheet]
+    # 导出的明细表记录的尺寸常常不正确（如 A1:A1），只读模式下按实际内容读取
+    sheet.reset_dimensions()
 
-    # 查找列索引
+    # 查找列索引（列位置从0开始）
     header_row = 1  # 假设标题在第一行
+    header_values = next(sheet.iter_rows(min_row=header_row, max_row=header_row, values_only=True), ())
     col_index = {}
     required_columns = ['SN', 'Station Name', 'Time End']
 
-    for cell in sheet[header_row]:
-        if cell.value in required_columns:
-            col_index[cell.value] = cell.column_letter
+    for position, value in enumerate(header_values):
+        if value in required_columns:
+            col_index[value] = position
 
     # 检查是否找到所有列
     missing_cols = [col for col in required_columns if col not in col_index]
@@ -602,193 +525,230 @@ def extract_columns(device_type, input_file):
     if missing_cols:
         # 尝试大小写不敏感匹配
         col_index = {}
-        for cell in sheet[header_row]:
-            cell_value = str(cell.value).lower() if cell.value else ""
+        for position, value in enumerate(header_values):
+            cell_value = str(value).lower() if value else ""
             for req_col in required_columns:
                 if req_col.lower() == cell_value:
-                    col_index[req_col] = cell.column_letter
+                    col_index[req_col] = position
 
         # 再次检查
         missing_cols = [col for col in required_columns if col not in col_index]
 
         if missing_cols:
-            available_cols = [cell.value for cell in sheet[header_row] if cell.value]
+            available_cols = [str(value) for value in header_values if value]
+            wb.close()
             raise ValueError(f"以下列在目标工作表中不存在: {', '.join(missing_cols)}\n"
                              f"可用列: {', '.join(filter(None, available_cols))}")
 
-    # 创建新工作簿
-    new_wb = Workbook()
-    new_sheet = new_wb.active
-    new_sheet.title = "不良明细汇总"
-
-    # 添加新标题（按指定顺序）
-    new_headers = [
-        'SN',
-        'QPL-Station Name',
-        'Gantry',
-        'Time(end)',
-        'Locate picture',
-        'NG picture',
-        'NG picture1',
-        'Remark'
-    ]
-
-    # 写入新标题
-    for col_idx, header in enumerate(new_headers, start=1):
-        new_sheet.cell(row=1, column=col_idx, value=header)
-
-    # 存储所有列的最大宽度
-    all_col_widths = {}
-
-    # 复制数据
-    row_idx = 2  # 数据从第2行开始
-    for src_row in range(header_row + 1, sheet.max_row + 1):
+    # 增量模式：读取各设备类型已输出过的记录
+    report_state = None
+    emitted_keys = {device_type: set() for device_type in device_types}
+    if incremental:
+        report_state = ReportState(result_dir)
+        for device_type in device_types:
+            emitted_keys[device_type] = report_state.emitted_keys(device_type)
+            logger.info("增量模式: 设备类型 %s 已输出过 %d 条记录", device_type, len(emitted_keys[device_type]))
+    new_keys = {device_type: [] for device_type in device_types}
+    selection_cache = SelectionCache(result_dir) if use_cache else None
+    dedup = ImageDeduplicator(result_dir, dedup_threshold) if dedup_threshold is not None else None
+
+    if row_filter is not None and row_filter.enabled:
+        logger.info("源表过滤条件: %s", row_filter.describe())
+    else:
+        row_filter = None
+
+    # 继续中断的运行时，之前已完成的行结果
+    completed = {device_type: journal.completed_rows(device_type) for device_type in device_types} \
+        if journal is not None else {}
+
+    # 逐行查找文件夹、挑选并复制图片（生成报表之前全部完成）
+    row_results = {device_type: [] for device_type in device_types}
+    sn_col, station_col, time_col = col_index['SN'], col_index['Station Name'], col_index['Time End']
+    width = max(sn_col, station_col, time_col) + 1
+    for src_row, values in enumerate(sheet.iter_rows(min_row=header_row + 1, values_only=True),
+                                     start=header_row + 1):
         # 获取所需列的值
-        sn_value = sheet[f"{col_index['SN']}{src_row}"].value
-        station_value = sheet[f"{col_index['Station Name']}{src_row}"].value
-        time_value = sheet[f"{col_index['Time End']}{src_row}"].value
+        if len(values) < width:
+            values = tuple(values) + (None,) * (width - len(values))
+        sn_value = values[sn_col]
+        station_value = values[station_col]
+        time_value = values[time_col]
 
         # 跳过空行
         if not any([sn_value, station_value, time_value]):
             continue
 
-        try:
-            # 写入基础数据
-            new_sheet.cell(row=row_idx, column=1, value=sn_value)
-            new_sheet.cell(row=row_idx, column=2, value=station_value)
-            new_sheet.cell(row=row_idx, column=3, value=None)  # Gantry
-            new_sheet.cell(row=row_idx, column=4, value=time_value)
-            new_sheet.cell(row=row_idx, column=5, value=None)  # Locate picture
+        # 不满足过滤条件的行在任何文件夹查找和图片处理之前跳过
+        if row_filter is not None and not row_filter.matches(sn_value, station_value, time_value):
+            METRICS.incr('rows_filtered')
+            continue
 
-            # 初始化Remark列
-            remark = ""
-
-            # 查找SN对应的文件夹
-            sn_folders = find_sn_folders(sn_value)
-
-            if len(sn_folders) > 1:
-                # 多个文件夹匹配，记录错误
-                folder_names = ", ".join([os.path.basename(f) for f in sn_folders])
-                remark = f"Error: 多个文件夹匹配 - {folder_names}"
-                new_sheet.cell(row=row_idx, column=8, value=remark)
-                print(f"为SN {sn_value} 找到多个匹配文件夹: {folder_names}")
-            elif len(sn_folders) == 1:
-                # 找到一个文件夹，在其中处理图片
-                folder_path = sn_folders[0]
-                print(f"为SN {sn_value} 找到匹配文件夹: {os.path.basename(folder_path)}")
-
-                # 根据设备类型处理图片
-                ng_images, locate_image, process_remark = process_images_by_device_type(device_type, folder_path)
-
-                # 复制图片到结果目录
-                copied_ng_images = []
-                for img_path in ng_images:
-                    try:
-                        img_name = os.path.basename(img_path)
-                        dest_path = os.path.join(images_dir, img_name)
-                        shutil.copy2(img_path, dest_path)
-                        copied_ng_images.append(dest_path)
-                    except Exception as e:
-                        print(f"复制NG图片失败: {str(e)}")
-
-                copied_locate_image = None
-                if locate_image:
-                    try:
-                        img_name = os.path.basename(locate_image)
-                        dest_path = os.path.join(images_dir, img_name)
-                        shutil.copy2(locate_image, dest_path)
-                        copied_locate_image = dest_path
-                    except Exception as e:
-                        print(f"复制定位图片失败: {str(e)}")
-
-                # 插入图片到工作表
-                if copied_ng_images:
-                    # 最多显示两张图片
-                    max_images = min(2, len(copied_ng_images))
-                    images_to_insert = copied_ng_images[:max_images]
-
-                    # 插入第一张图片到NG picture列
-                    if len(images_to_insert) >= 1:
-                        col_widths1, _ = insert_images_horizontally(new_sheet, row_idx, 6, [images_to_insert[0]])
-                        # 更新全局列宽记录
-                        for col_idx, width in col_widths1.items():
-                            if col_idx not in all_col_widths or width > all_col_widths[col_idx]:
-                                all_col_widths[col_idx] = width
-
-                    # 插入第二张图片到NG picture1列
-                    if len(images_to_insert) >= 2:
-                        col_widths2, _ = insert_images_horizontally(new_sheet, row_idx, 7, [images_to_insert[1]])
-                        # 更新全局列宽记录
-                        for col_idx, width in col_widths2.items():
-                            if col_idx not in all_col_widths or width > all_col_widths[col_idx]:
-                                all_col_widths[col_idx] = width
-
-                # 插入定位图片到Locate picture列
-                if copied_locate_image:
-                    col_widths_loc, _ = insert_images_horizontally(new_sheet, row_idx, 5, [copied_locate_image])
-                    # 更新全局列宽记录
-                    for col_idx, width in col_widths_loc.items():
-                        if col_idx not in all_col_widths or width > all_col_widths[col_idx]:
-                            all_col_widths[col_idx] = width
-
-                # 添加处理备注
-                if process_remark:
-                    if remark:
-                        remark += "\n" + process_remark
-                    else:
-                        remark = process_remark
-                    new_sheet.cell(row=row_idx, column=8, value=remark)
-            else:
-                # 没有找到匹配的文件夹
-                remark = "Error: 未找到包含SN的文件夹"
-                new_sheet.cell(row=row_idx, column=8, value=remark)
-                print(f"为SN {sn_value} 未找到匹配文件夹")
+        # 增量模式下跳过已输出过的记录（在任何图片处理之前判断）
+        key = row_key(sn_value, station_value, time_value)
+        results = {}
+        for device_type in device_types:
+            if key in emitted_keys[device_type]:
+                METRICS.incr('rows_already_reported')
+                continue
+            results[device_type] = RowResult(sn_value, station_value, time_value)
+        if not results:
+            continue
+
+        # 复用中断前已完成的行（源表行内容相同且复制的图片仍然存在）
+        previous = {device_type: completed[device_type].get(src_row) for device_type in results} \
+            if completed else {}
+        if previous and all(result is not None and
+                            row_key(result.sn, result.station, result.time_end) == key and
+                            _copied_images_exist(result) for result in previous.values()):
+            METRICS.incr('rows_resumed', len(previous))
+            for device_type, result in previous.items():
+                row_results[device_type].append(result)
+                if _is_complete(result):
+                    new_keys[device_type].append(key)
+            continue
 
-            # 移动到下一行
-            row_idx += 1
+        try:
+            process_row_for_devices(results, images_dir, selection_cache, ocr_verify, dedup)
+            if journal is not None:
+                journal.record(src_row, results)
+            failed = False
         except Exception as e:
-            print(f"警告: 处理行 {src_row} 时出错 - {str(e)}")
-            traceback.print_exc()
-            row_idx += 1
+            logger.exception("警告: 处理行 %s 时出错 - %s", src_row, e)
+            METRICS.incr('rows_failed', len(results))
+            failed = True
+        for device_type, result in results.items():
+            row_results[device_type].append(result)
+            if not failed and _is_complete(result):
+                new_keys[device_type].append(key)
+
+    wb.close()
+    if journal is not None:
+        journal.checkpoint()
+    if selection_cache is not None:
+        selection_cache.close()
+    if dedup is not None:
+        dedup.close()
+
+    # 保存报表到result目录
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    suffix = "_delta" if incremental else ""
+    output_files = {}
+    for device_type in device_types:
+        device_results = row_results[device_type]
+        if incremental and not device_results:
+            logger.info("设备类型 %s 没有新的记录，不生成增量文件", device_type)
+            output_files[device_type] = None
+            continue
 
-    # 应用图片尺寸到列宽
-    if all_col_widths:
-        apply_image_dimensions(new_sheet, all_col_widths)
+        output_base = os.path.join(result_dir, f"不良明细汇总_{device_type}_{timestamp}{suffix}")
+        written = write_reports(device_results, output_base, output_formats, shard_spec)
+        METRICS.incr('rows_processed', len(device_results))
 
-    # 格式化Excel表格
-    if new_sheet.max_row > 1:  # 确保有数据行
-        format_excel(new_sheet)
+        # 保存成功后再登记，保存失败时下次运行会重新处理这些记录
+        if report_state is not None:
+            report_state.record(device_type, new_keys[device_type], os.path.basename(written[0]))
 
-    # 保存新工作簿到result目录
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_file = os.path.join(result_dir, f"不良明细汇总_{device_type}_{timestamp}.xlsx")
-    new_wb.save(output_file)
+        logger.info("成功创建新文件: %s", ", ".join(written))
+        logger.info("处理了 %d 条记录", len(device_results))
+        output_files[device_type] = written[0]
 
-    print(f"成功创建新文件: {output_file}")
-    print(f"处理了 {row_idx - 2} 条记录")
-    print(f"源工作表: {target_sheet}")
+    # 工作簿保存时读取了图片数据，之后才能关闭映射
+    get_image_store().close()
+    if report_state is not None:
+        report_state.close()
+
+    logger.info("源工作表: %s", target_sheet)
+    return output_files
+
+
+def parse_device_types(text):
+    """
+    解析设备类型参数：单个设备类型、逗号分隔的多个设备类型或 all
+    """
+    if text.strip().lower() == 'all':
+        return list(DEVICE_TYPES)
+    device_types = [item.strip() for item in text.split(',') if item.strip()]
+    unknown = [device_type for device_type in device_types if device_type not in DEVICE_TYPES]
+    if unknown or not device_types:
+        raise argparse.ArgumentTypeError(f"不支持的设备类型: {text}（可选: {', '.join(DEVICE_TYPES)} 或 all）")
+    return list(dict.fromkeys(device_types))
 
 
 if __name__ == "__main__":
     # 解析命令行参数
     parser = argparse.ArgumentParser(description='处理不良明细数据')
-    parser.add_argument('device_type', choices=DEVICE_TYPES, help='设备类型: 1100, 660, 1174, 639')
+    parser.add_argument('device_type', type=parse_device_types,
+                        help='设备类型: 1100, 660, 1174, 639；多个设备类型用逗号分隔，all 表示全部（一次扫描共用）')
     parser.add_argument('input_file', help='输入Excel文件路径')
+    parser.add_argument('--metrics-file', default=None,
+                        help='运行指标输出路径（不含扩展名），默认 result/metrics_<设备类型>')
+    parser.add_argument('--incremental', action='store_true',
+                        help='增量模式：只处理之前未输出过的记录，结果写入 _delta 文件')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='不使用挑选结果缓存，重新挑选所有SN文件夹的图片')
+    parser.add_argument('--ocr-verify', action='store_true',
+                        help='对挑选出的NG图片做OCR验证（需要安装Tesseract）')
+    parser.add_argument('--output-format', type=parse_output_formats, default=['xlsx'],
+                        help='输出格式，逗号分隔: xlsx,html,csv,parquet,arrow（默认xlsx；parquet/arrow需要pyarrow）')
+    add_filter_arguments(parser)
+    add_dedup_arguments(parser)
+    parser.add_argument('--resume', action='store_true',
+                        help='继续上次中断的运行（相同输入文件和选项）：跳过解压，复用已完成的行结果和已复制的图片')
+    add_shard_arguments(parser)
+    add_tree_arguments(parser)
+    add_io_arguments(parser)
+    add_logging_arguments(parser)
+    add_profile_argument(parser)
     args = parser.parse_args()
-
+    setup_logging(args.log_level, args.quiet, args.log_json)
+    configure_file_io(args.io_workers, args.io_latency)
+    profiler = StageProfiler(enabled=args.profile)
+    # 各阶段（METRICS.stage）同时做性能分析
+    METRICS.set_profiler(profiler)
+
+    METRICS.set_label('device_type', ",".join(args.device_type))
+    journal = None
     try:
-        start_extract_zip()
+        row_filter = row_filter_from_args(args)
+        dedup_threshold = args.dedup_threshold if args.dedup else None
+        # 运行日志：影响行结果的选项相同时才能继续中断的运行
+        key = run_key(args.device_type, args.input_file, incremental=args.incremental, ocr_verify=args.ocr_verify,
+                      dedup_threshold=dedup_threshold, row_filter=row_filter.describe())
+        journal = RunJournal("result", key, resume=args.resume)
+
+        if journal.extracted and open_catalog("data") is not None:
+            logger.info("继续中断的运行，使用已解压的data目录")
+        else:
+            with profiler.stage('extract'):
+                start_extract_zip(show_tree=args.tree or args.tree_detail, tree_detail=args.tree_detail)
+            journal.mark_extracted()
         # 确保data目录存在
         if not os.path.exists("data"):
-            print("警告: data目录不存在，将跳过图片搜索")
+            logger.warning("警告: data目录不存在，将跳过图片搜索")
             os.makedirs("data", exist_ok=True)
 
-        extract_columns(args.device_type, args.input_file)
+        with profiler.stage('report'):
+            extract_columns_for_devices(args.device_type, args.input_file, incremental=args.incremental,
+                                        use_cache=not args.no_cache, ocr_verify=args.ocr_verify,
+                                        output_formats=args.output_format, shard_spec=shard_spec_from_args(args),
+                                        row_filter=row_filter, dedup_threshold=dedup_threshold, journal=journal)
+        journal.finish()
     except Exception as e:
-        print(f"发生错误: {str(e)}")
-        traceback.print_exc()
-        print("请确保:")
-        print("1. 原始Excel文件存在且路径正确")
-        print("2. 文件没有被其他程序占用")
-        print("3. 包含'不良明细'的工作表存在")
-        print("4. 工作表中包含SN, Station Name, Time End三列")
+        logger.exception("发生错误: %s", e)
+        logger.error("请确保:")
+        logger.error("1. 原始Excel文件存在且路径正确")
+        logger.error("2. 文件没有被其他程序占用")
+        logger.error("3. 包含'不良明细'的工作表存在")
+        logger.error("4. 工作表中包含SN, Station Name, Time End三列")
+        METRICS.incr('run_failed')
+    finally:
+        if journal is not None:
+            journal.close()
+        profiler.write_summary()
+        # 写出运行指标（JSON + Prometheus textfile），供监控采集
+        metrics_base = args.metrics_file or os.path.join("result", f"metrics_{'_'.join(args.device_type)}")
+        json_path, prom_path = METRICS.write(metrics_base)
+        log_summary(logger)
+        if args.ocr_verify:
+            log_gate_summary(logger)
+        logger.info("运行指标已写入: %s, %s", json_path, prom_path)
@@ -6,15 +6,24 @@ import os
 from datetime import datetime
 import shutil
 import re
-import glob
 import sys
 import subprocess
 from PIL import Image as PILImage
 import pytesseract
-from pytesseract import Output
-import traceback
+import argparse
+import logging
 
 from extract_zip_files import start_extract_zip
+from run_metrics import METRICS
+from log_utils import setup_logging, add_logging_arguments, log_summary
+from profiling import StageProfiler, add_profile_argument
+from ocr_gate import log_gate_summary
+from ocr_verify import filter_ng_text, set_tesseract_cmd, verify_selection
+from image_selection import DEVICE_TYPES, find_sn_folders, process_images_by_device_type
+from image_index import get_image_index
+from records import SelectionResult
+
+logger = logging.getLogger(__name__)
 
 
 # 检查并安装必要的依赖
@@ -26,29 +35,29 @@ def install_dependencies():
     try:
         import pytesseract
     except ImportError:
-        print("正在安装必要的依赖库 pytesseract...")
+        logger.warning("正在安装必要的依赖库 pytesseract...")
         try:
             subprocess.check_call([sys.executable, "-m", "pip", "install", "pytesseract"])
-            print("pytesseract 安装成功！")
+            logger.warning("pytesseract 安装成功！")
             import pytesseract
             installed = True
         except Exception as e:
-            print(f"安装 pytesseract 失败: {str(e)}")
-            print("请手动安装: pip install pytesseract")
+            logger.error("安装 pytesseract 失败: %s", e)
+            logger.error("请手动安装: pip install pytesseract")
             sys.exit(1)
 
     # 检查并安装Pillow
     try:
         import PIL
     except ImportError:
-        print("正在安装必要的依赖库 Pillow...")
+        logger.warning("正在安装必要的依赖库 Pillow...")
         try:
             subprocess.check_call([sys.executable, "-m", "pip", "install", "pillow"])
-            print("Pillow 安装成功！")
+            logger.warning("Pillow 安装成功！")
             installed = True
         except Exception as e:
-            print(f"安装 Pillow 失败: {str(e)}")
-            print("请手动安装: pip install pillow")
+            logger.error("安装 Pillow 失败: %s", e)
+            logger.error("请手动安装: pip install pillow")
             sys.exit(1)
 
     # 检查Tesseract OCR引擎
@@ -64,34 +73,37 @@ def install_dependencies():
         for path in possible_paths:
             if os.path.exists(path):
                 pytesseract.pytesseract.tesseract_cmd = path
-                print(f"找到Tesseract: {path}")
+                logger.info("找到Tesseract: %s", path)
                 break
         else:
             # 如果自动查找失败，尝试环境变量路径
             try:
                 pytesseract.get_tesseract_version()
             except EnvironmentError:
-                print("未找到Tesseract OCR引擎，请按以下步骤安装:")
-                print("1. Windows: 下载安装包 https://github.com/UB-Mannheim/tesseract/wiki")
-                print("2. macOS: brew install tesseract")
-                print("3. Linux: sudo apt install tesseract-ocr")
-                print("安装后请确保tesseract命令在系统路径中")
+                logger.error("未找到Tesseract OCR引擎，请按以下步骤安装:")
+                logger.error("1. Windows: 下载安装包 https://github.com/UB-Mannheim/tesseract/wiki")
+                logger.error("2. macOS: brew install tesseract")
+                logger.error("3. Linux: sudo apt install tesseract-ocr")
+                logger.error("安装后请确保tesseract命令在系统路径中")
                 return False
     except Exception as e:
-        print(f"Tesseract检查失败: {str(e)}")
+        logger.error("Tesseract检查失败: %s", e)
         return False
 
     if installed:
-        print("所有依赖已成功安装，请重新运行脚本")
+        logger.warning("所有依赖已成功安装，请重新运行脚本")
         return True
     return True
 
 
 # 安装依赖
 if not install_dependencies():
-    print("依赖安装失败，请手动安装必要组件")
+    logger.error("依赖安装失败，请手动安装必要组件")
     sys.exit(1)
 
+# OCR验证使用与pytesseract相同的tesseract命令
+set_tesseract_cmd(pytesseract.pytesseract.tesseract_cmd)
+
 # 忽略openpyxl的样式警告
 import warnings
 
@@ -102,80 +114,6 @@ IMAGE_HEIGHT = 120  # 图片高度（像素）
 IMAGE_MARGIN = 15  # 图片间距（像素）
 
 
-def contains_ng_text(img_path):
-    """
-    严格验证图片中是否包含'NG'文字，排除无文字图片
-    """
-    try:
-        # 打开图片
-        img = PILImage.open(img_path)
-
-        # 方法0: 检查图片是否完全是空白或噪点（无实际内容）
-        if is_blank_image(img):
-            print(f"跳过空白图片: {os.path.basename(img_path)}")
-            return False
-
-        # 方法1: 直接OCR识别
-        ocr_result = pytesseract.image_to_string(img, lang='eng', config='--psm 6')
-        if re.search(r'\bNG\b', ocr_result, re.IGNORECASE):
-            return True
-
-        # 方法2: 使用OCR获取文本位置信息，专门检测"NG"区域
-        ocr_data = pytesseract.image_to_data(img, output_type=Output.DICT, lang='eng', config='--psm 6')
-        total_text = ""
-        ng_detected = False
-
-        for i, text in enumerate(ocr_data['text']):
-            text = text.strip()
-            total_text += text + " "
-
-            # 检查置信度
-            conf = float(ocr_data['conf'][i]) if ocr_data['conf'][i] != '-1' else 0
-
-            # 检测NG文本
-            if re.search(r'\bNG\b', text, re.IGNORECASE) and conf > 60:
-                ng_detected = True
-                break
-
-        if ng_detected:
-            return True
-
-        # 检查总文本长度 - 如果几乎没有文字，则不是NG图片
-        clean_text = re.sub(r'\s+', '', total_text)  # 移除所有空白字符
-        if len(clean_text) < 3:  # 少于3个字符视为无文字
-            print(f"跳过无文字图片: {os.path.basename(img_path)}")
-            return False
-
-        # 方法3: 图像预处理后再次识别
-        # 转换为灰度图
-        gray = img.convert('L')
-        # 二值化处理
-        threshold = 150
-        binary = gray.point(lambda p: p > threshold and 255)
-        # 再次OCR识别
-        ocr_result = pytesseract.image_to_string(binary, lang='eng', config='--psm 6')
-        if re.search(r'\bNG\b', ocr_result, re.IGNORECASE):
-            return True
-
-        # 如果所有OCR方法都失败，检查文件名是否包含'NG'
-        filename = os.path.basename(img_path).upper()
-        if 'NG' in filename and not any(word in filename for word in ['ANG', 'ING', 'ONG', 'UNG']):
-            print(f"警告: 基于文件名包含NG但未识别内容: {filename}")
-            return True
-
-        # 最终检查：如果没有任何文字，排除图片
-        if len(clean_text) == 0:
-            print(f"跳过无内容图片: {os.path.basename(img_path)}")
-            return False
-
-        return False
-    except Exception as e:
-        print(f"OCR处理失败: {str(e)}")
-        # 如果OCR失败，严格检查文件名
-        filename = os.path.basename(img_path).upper()
-        return 'NG' in filename and not any(word in filename for word in ['ANG', 'ING', 'ONG', 'UNG'])
-
-
 def find_ng_images(sn, data_dir='data'):
     """
     在data目录中查找包含指定SN和"NG"的图片，增加多重过滤
@@ -189,7 +127,7 @@ def find_ng_images(sn, data_dir='data'):
 
     # 检查data_dir是否存在
     if not os.path.exists(data_dir):
-        print(f"目录 {data_dir} 不存在，跳过图片搜索")
+        logger.warning("目录 %s 不存在，跳过图片搜索", data_dir)
         return matched_images
 
     # 构建搜索模式
@@ -199,101 +137,76 @@ def find_ng_images(sn, data_dir='data'):
         f"*{re.escape(sn_str)}*NG*.png"
     ]
 
-    # 递归搜索所有匹配的图片
-    for pattern in patterns:
-        for img_path in glob.glob(os.path.join(data_dir, "**", pattern), recursive=True):
+    # 在文件名索引中查找匹配的图片（整个data目录只遍历一次）
+    index = get_image_index(data_dir)
+    with METRICS.stage('scan'):
+        found = index.find(sn_str, patterns)
+    for img_path in found:
+        METRICS.incr('images_scanned')
+        # 检查文件大小
+        file_size = os.path.getsize(img_path)
+        if file_size < min_file_size:
+            logger.debug("跳过小文件: %s (大小: %.1fKB)", os.path.basename(img_path), file_size / 1024)
+            METRICS.incr('images_skipped_small')
+            continue
+
+        # 检查是否为有效图片
+        try:
+            with METRICS.stage('verify'), PILImage.open(img_path) as img:
+                img.verify()  # 验证图片完整性
+        except Exception as e:
+            logger.debug("跳过损坏图片: %s - %s", os.path.basename(img_path), e)
+            METRICS.incr('images_skipped_corrupt')
+            continue
+
+        matched_images.append(img_path)
+
+    # 添加不区分大小写的匹配
+    if not matched_images:
+        with METRICS.stage('scan'):
+            found = index.find_ignore_case(sn_str, "ng")
+        for img_path in found:
+            file = os.path.basename(img_path)
+            METRICS.incr('images_scanned')
             # 检查文件大小
-            if os.path.getsize(img_path) < min_file_size:
-                print(f"跳过小文件: {os.path.basename(img_path)} (大小: {os.path.getsize(img_path) / 1024:.1f}KB)")
+            file_size = os.path.getsize(img_path)
+            if file_size < min_file_size:
+                logger.debug("跳过小文件: %s (大小: %.1fKB)", file, file_size / 1024)
+                METRICS.incr('images_skipped_small')
                 continue
-
             # 检查是否为有效图片
             try:
-                with PILImage.open(img_path) as img:
+                with METRICS.stage('verify'), PILImage.open(img_path) as img:
                     img.verify()  # 验证图片完整性
             except Exception as e:
-                print(f"跳过损坏图片: {os.path.basename(img_path)} - {str(e)}")
+                logger.debug("跳过损坏图片: %s - %s", file, e)
+                METRICS.incr('images_skipped_corrupt')
                 continue
-
             matched_images.append(img_path)
 
-    # 添加不区分大小写的匹配
-    if not matched_images:
-        for root, dirs, files in os.walk(data_dir):
-            for file in files:
-                if file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                    file_lower = file.lower()
-                    if "ng" in file_lower and sn_str.lower() in file_lower:
-                        img_path = os.path.join(root, file)
-                        # 检查文件大小
-                        if os.path.getsize(img_path) < min_file_size:
-                            print(f"跳过小文件: {file} (大小: {os.path.getsize(img_path) / 1024:.1f}KB)")
-                            continue
-                        # 检查是否为有效图片
-                        try:
-                            with PILImage.open(img_path) as img:
-                                img.verify()  # 验证图片完整性
-                        except Exception as e:
-                            print(f"跳过损坏图片: {file} - {str(e)}")
-                            continue
-                        matched_images.append(img_path)
-
-    # 使用严格验证检查图片是否确实包含NG
-    verified_images = []
+    # 使用严格验证检查图片是否确实包含NG（需要OCR的图片批量识别）
+    with METRICS.stage('select'):
+        verified_images = filter_ng_text(matched_images)
+    verified_set = set(verified_images)
     for img_path in matched_images:
-        if contains_ng_text(img_path):
-            verified_images.append(img_path)
-        else:
-            print(f"跳过图片（未检测到NG）: {os.path.basename(img_path)}")
+        if img_path not in verified_set:
+            logger.debug("跳过图片（未检测到NG）: %s", os.path.basename(img_path))
 
     return verified_images
 
 
-def is_blank_image(img):
-    """
-    检测图片是否完全是空白或噪点（无实际内容）
-    """
-    try:
-        # 转换为灰度图
-        gray = img.convert('L')
-
-        # 计算像素值方差
-        pixels = list(gray.getdata())
-        mean = sum(pixels) / len(pixels)
-        variance = sum((p - mean) ** 2 for p in pixels) / len(pixels)
-
-        # 如果方差很小，说明图片很均匀（可能是空白）
-        if variance < 100:  # 经验值，可根据需要调整
-            return True
-
-        # 检查是否有大量相同颜色的像素
-        color_counts = {}
-        for pixel in pixels:
-            color_counts[pixel] = color_counts.get(pixel, 0) + 1
-
-        # 如果某个颜色占比超过95%，可能是空白图片
-        max_count = max(color_counts.values())
-        if max_count / len(pixels) > 0.95:
-            return True
-
-        return False
-    except Exception as e:
-        print(f"空白检测失败: {str(e)}")
-        return False
-
-
 def calculate_image_size(img_path, target_height):
     """
     计算调整后的图片大小（保持宽高比）
     """
     try:
-        with PILImage.open(img_path) as img:
+        with METRICS.stage('thumbnail'), PILImage.open(img_path) as img:
             # 保持宽高比调整大小
             width_ratio = target_height / img.height
             new_width = int(img.width * width_ratio)
             return new_width, target_height
     except Exception as e:
-        print(f"计算图片大小失败: {str(e)}")
+        logger.warning("计算图片大小失败: %s", e)
         return 100, 100  # 默认大小
 
 
@@ -318,7 +231,7 @@ def insert_images_horizontally(worksheet, row_idx, start_col, image_paths):
             if height > max_img_height:
                 max_img_height = height
         except Exception as e:
-            print(f"计算图片尺寸失败: {str(e)}")
+            logger.warning("计算图片尺寸失败: %s", e)
             continue
 
     # 设置行高（关键修改：使用精确计算方式）
@@ -327,7 +240,7 @@ def insert_images_horizontally(worksheet, row_idx, start_col, image_paths):
         # 精确计算公式：行高 = (图片高度 + 上边距) / 1.33
         exact_row_height = (max_img_height + IMAGE_MARGIN) / 1.33
         worksheet.row_dimensions[row_idx].height = exact_row_height
-        print(f"精确设置行 {row_idx} 高度: {exact_row_height:.2f} (像素高度: {max_img_height}+{IMAGE_MARGIN})")
+        logger.debug("精确设置行 %d 高度: %.2f (像素高度: %d+%d)", row_idx, exact_row_height, max_img_height, IMAGE_MARGIN)
 
     # 插入图片
     for idx, (img_path, (width, height)) in enumerate(zip(image_paths, img_sizes)):
@@ -335,19 +248,21 @@ def insert_images_horizontally(worksheet, row_idx, start_col, image_paths):
             current_col = start_col + idx
             col_widths[current_col] = width
 
-            img = Image(img_path)
-            img.width = width
-            img.height = height
+            with METRICS.stage('embed'):
+                img = Image(img_path)
+                img.width = width
+                img.height = height
 
-            # 关键修改：使用单元格锚定方式（消除额外空白）
-            cell_anchor = f"{get_column_letter(current_col)}{row_idx}"
-            img.anchor = cell_anchor
-            worksheet.add_image(img)
+                # 关键修改：使用单元格锚定方式（消除额外空白）
+                cell_anchor = f"{get_column_letter(current_col)}{row_idx}"
+                img.anchor = cell_anchor
+                worksheet.add_image(img)
             images_added.append(img)
+            METRICS.incr('images_embedded')
 
             x_offset += width + IMAGE_MARGIN
         except Exception as e:
-            print(f"插入图片失败: {str(e)}")
+            logger.warning("插入图片失败: %s", e)
 
     return col_widths, images_added
 
@@ -364,7 +279,7 @@ def apply_image_dimensions(worksheet, col_widths):
         col_width = max(15, width_px * PIXELS_TO_EXCEL_UNITS)
         col_letter = get_column_letter(col_idx)
         worksheet.column_dimensions[col_letter].width = col_width
-        print(f"设置列 {col_letter} 宽度为: {col_width} (基于图片宽度: {width_px} 像素)")
+        logger.debug("设置列 %s 宽度为: %s (基于图片宽度: %s 像素)", col_letter, col_width, width_px)
 
 
 def format_excel(worksheet):
@@ -447,7 +362,32 @@ def format_excel(worksheet):
         worksheet.freeze_panes = 'A2'
 
 
-def extract_columns(argv):
+def select_ng_candidates(device_type, sn):
+    """
+    按设备类型规则在SN文件夹中挑选NG图片和定位图片，返回 SelectionResult
+
+    找不到文件夹或匹配到多个文件夹时与 process_NG.py 一样在备注中记录错误
+    """
+    sn_folders = find_sn_folders(sn)
+    if len(sn_folders) > 1:
+        folder_names = ", ".join([os.path.basename(f) for f in sn_folders])
+        logger.debug("为SN %s 找到多个匹配文件夹: %s", sn, folder_names)
+        METRICS.incr('rows_folder_ambiguous')
+        return SelectionResult([], None, f"Error: 多个文件夹匹配 - {folder_names}")
+    if not sn_folders:
+        logger.debug("为SN %s 未找到匹配文件夹", sn)
+        METRICS.incr('rows_folder_missing')
+        return SelectionResult([], None, "Error: 未找到包含SN的文件夹")
+    return process_images_by_device_type(device_type, sn_folders[0])
+
+
+def extract_columns(argv, device_type=None):
+    """
+    生成不良明细汇总报表
+
+    指定 device_type 时先按设备类型规则挑选图片，只对选中的NG图片（最多两张）做OCR验证；
+    否则在整个data目录中搜索SN的NG图片并逐一验证
+    """
     # 创建result目录（如果不存在）
     result_dir = "result"
     os.makedirs(result_dir, exist_ok=True)
@@ -463,7 +403,7 @@ def extract_columns(argv):
 
     # 按修改时间排序，获取最新的文件
     input_file = argv[1]
-    print(f"使用文件: {input_file}")
+    logger.info("使用文件: %s", input_file)
 
     # 加载工作簿
     wb = load_workbook(input_file, data_only=True)
@@ -479,7 +419,7 @@ def extract_columns(argv):
         available_sheets = "\n".join(wb.sheetnames)
         raise ValueError(f"未找到包含'不良明细'的工作表。可用工作表有：\n{available_sheets}")
 
-    print(f"找到目标工作表: {target_sheet}")
+    logger.info("找到目标工作表: %s", target_sheet)
 
     # 获取目标工作表
     sheet = wb[target_sheet]
@@ -527,6 +467,9 @@ def extract_columns(argv):
         'locate picture',
         'NG picture'
     ]
+    # 按设备类型挑选时最多两张NG图片，与 process_NG.py 的报表一样增加备注列
+    if device_type:
+        new_headers += ['NG picture1', 'Remark']
 
     # 写入新标题
     for col_idx, header in enumerate(new_headers, start=1):
@@ -557,30 +500,37 @@ def extract_columns(argv):
 
             # 查找并验证NG图片
             ng_images = []
+            locate_image = None
             if sn_value:
-                ng_images = find_ng_images(sn_value)
+                if device_type:
+                    # 只对选中的NG图片做OCR验证，未确认的图片和找不到文件夹等错误写入备注
+                    ng_images, locate_image, remark = verify_selection(select_ng_candidates(device_type, sn_value))
+                    if remark:
+                        new_sheet.cell(row=row_idx, column=8, value=remark)
+                else:
+                    ng_images = find_ng_images(sn_value)
 
                 if ng_images:
-                    print(f"为SN {sn_value} 找到 {len(ng_images)} 张可能有的NG图片")
+                    logger.debug("为SN %s 找到 %d 张可能有的NG图片", sn_value, len(ng_images))
 
-                    # 二次验证：确保图片确实包含NG
-                    verified_images = []
-                    for img_path in ng_images:
-                        if contains_ng_text(img_path):
-                            verified_images.append(img_path)
+                    # 二次验证：确保图片确实包含NG（已判定过的图片直接使用之前的结果）
+                    with METRICS.stage('select'):
+                        verified_images = filter_ng_text(ng_images)
 
-                    print(f"经过二次验证，{len(verified_images)} 张图片确认包含NG")
+                    logger.debug("经过二次验证，%d 张图片确认包含NG", len(verified_images))
 
                     # 复制有效的NG图片到结果目录
                     copied_images = []
-                    for img_path in verified_images:
-                        try:
-                            img_name = os.path.basename(img_path)
-                            dest_path = os.path.join(images_dir, img_name)
-                            shutil.copy2(img_path, dest_path)
-                            copied_images.append(dest_path)
-                        except Exception as e:
-                            print(f"复制图片失败: {str(e)}")
+                    with METRICS.stage('copy'):
+                        for img_path in verified_images:
+                            try:
+                                img_name = os.path.basename(img_path)
+                                dest_path = os.path.join(images_dir, img_name)
+                                shutil.copy2(img_path, dest_path)
+                                copied_images.append(dest_path)
+                                METRICS.incr('images_copied')
+                            except Exception as e:
+                                logger.warning("复制图片失败: %s", e)
 
                     # 插入图片到工作表（水平排列）
                     if copied_images:
@@ -592,47 +542,88 @@ def extract_columns(argv):
                             if col_idx not in all_col_widths or width > all_col_widths[col_idx]:
                                 all_col_widths[col_idx] = width
 
+                # 按设备类型挑选时插入定位图片
+                if locate_image:
+                    try:
+                        with METRICS.stage('copy'):
+                            dest_path = os.path.join(images_dir, os.path.basename(locate_image))
+                            shutil.copy2(locate_image, dest_path)
+                        METRICS.incr('images_copied')
+                        col_widths, _ = insert_images_horizontally(new_sheet, row_idx, 5, [dest_path])
+                        for col_idx, width in col_widths.items():
+                            if col_idx not in all_col_widths or width > all_col_widths[col_idx]:
+                                all_col_widths[col_idx] = width
+                    except Exception as e:
+                        logger.warning("复制定位图片失败: %s", e)
+
             # 移动到下一行
             row_idx += 1
         except Exception as e:
-            print(f"警告: 处理行 {src_row} 时出错 - {str(e)}")
-            traceback.print_exc()
+            logger.exception("警告: 处理行 %s 时出错 - %s", src_row, e)
+            METRICS.incr('rows_failed')
             row_idx += 1
 
-    # 应用图片尺寸到列宽
-    if all_col_widths:
-        apply_image_dimensions(new_sheet, all_col_widths)
+    with METRICS.stage('format'):
+        # 应用图片尺寸到列宽
+        if all_col_widths:
+            apply_image_dimensions(new_sheet, all_col_widths)
 
-    # 格式化Excel表格（包含行高优化）
-    if new_sheet.max_row > 1:  # 确保有数据行
-        format_excel(new_sheet)
+        # 格式化Excel表格（包含行高优化）
+        if new_sheet.max_row > 1:  # 确保有数据行
+            format_excel(new_sheet)
+        if device_type:
+            new_sheet.column_dimensions['H'].width = 40  # Remark
 
     # 保存新工作簿到result目录
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_file = os.path.join(result_dir, f"不良明细汇总_{timestamp}.xlsx")
-    new_wb.save(output_file)
+    with METRICS.stage('save'):
+        new_wb.save(output_file)
+    METRICS.incr('rows_processed', row_idx - 2)
 
-    print(f"成功创建新文件: {output_file}")
-    print(f"处理了 {row_idx - 2} 条记录")
-    print(f"源工作表: {target_sheet}")
+    logger.info("成功创建新文件: %s", output_file)
+    logger.info("处理了 %d 条记录", row_idx - 2)
+    logger.info("源工作表: %s", target_sheet)
 
 
 if __name__ == "__main__":
+    # 解析命令行参数
+    parser = argparse.ArgumentParser(description='处理不良明细数据（OCR识别NG图片）')
+    parser.add_argument('input_file', help='输入Excel文件路径')
+    parser.add_argument('--device-type', choices=DEVICE_TYPES, default=None,
+                        help='按设备类型规则挑选图片，只对选中的NG图片做OCR验证')
+    add_logging_arguments(parser)
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    setup_logging(args.log_level, args.quiet, args.log_json)
+    profiler = StageProfiler(enabled=args.profile)
+    # 各阶段（METRICS.stage）同时做性能分析
+    METRICS.set_profiler(profiler)
+
     try:
-        start_extract_zip()
+        with profiler.stage('extract'):
+            start_extract_zip()
         # 确保data目录存在
         if not os.path.exists("data"):
-            print("警告: data目录不存在，将跳过图片搜索")
+            logger.warning("警告: data目录不存在，将跳过图片搜索")
             os.makedirs("data", exist_ok=True)
 
-        extract_columns(sys.argv)
+        with profiler.stage('report'):
+            extract_columns([sys.argv[0], args.input_file], device_type=args.device_type)
     except Exception as e:
-        print(f"发生错误: {str(e)}")
-        traceback.print_exc()
-        print("请确保:")
-        print("1. 原始Excel文件存在且路径正确")
-        print("2. 文件没有被其他程序占用")
-        print("3. 包含'不良明细'的工作表存在")
-        print("4. 工作表中包含SN, Station Name, Time End三列")
-        print("5. Tesseract OCR已正确安装")
+        logger.exception("发生错误: %s", e)
+        logger.error("请确保:")
+        logger.error("1. 原始Excel文件存在且路径正确")
+        logger.error("2. 文件没有被其他程序占用")
+        logger.error("3. 包含'不良明细'的工作表存在")
+        logger.error("4. 工作表中包含SN, Station Name, Time End三列")
+        logger.error("5. Tesseract OCR已正确安装")
+        METRICS.incr('run_failed')
+    finally:
+        profiler.write_summary()
+        # 写出运行指标（JSON + Prometheus textfile），供监控采集
+        json_path, prom_path = METRICS.write(os.path.join("result", "metrics_ocr"))
+        log_summary(logger)
+        log_gate_summary(logger)
+        logger.info("运行指标已写入: %s, %s", json_path, prom_path)
 
@@ -6,28 +6,33 @@ import os
 from datetime import datetime
 import shutil
 import re
-import glob
 import math
 import sys
 import subprocess
 from PIL import Image as PILImage
+import argparse
+import logging
 
 from extract_zip_files import start_extract_zip
+from image_index import get_image_index
+from log_utils import setup_logging, add_logging_arguments
+
+logger = logging.getLogger(__name__)
 
 
 # 检查并安装必要的依赖
 def install_dependencies():
     try:
-        import PILImage
+        import PIL
     except ImportError:
-        print("正在安装必要的依赖库 Pillow...")
+        # 导入时日志尚未配置，使用警告级别保证提示能输出到控制台
+        logger.warning("正在安装必要的依赖库 Pillow...")
         try:
             subprocess.check_call([sys.executable, "-m", "pip", "install", "pillow"])
-            print("Pillow 安装成功！")
-            from PIL import Image as PILImage
+            logger.warning("Pillow 安装成功！")
         except Exception as e:
-            print(f"安装 Pillow 失败: {str(e)}")
-            print("请手动安装: pip install pillow")
+            logger.error("安装 Pillow 失败: %s", e)
+            logger.error("请手动安装: pip install pillow")
             sys.exit(1)
 
 
@@ -64,17 +69,13 @@ def find_ng_images(sn, data_dir='data'):
         f"*{re.escape(sn_str)}*NG*.png"
     ]
 
-    # 递归搜索所有匹配的图片
-    for pattern in patterns:
-        matched_images.extend(glob.glob(os.path.join(data_dir, "**", pattern), recursive=True))
+    # 在文件名索引中查找匹配的图片（整个data目录只遍历一次）
+    index = get_image_index(data_dir)
+    matched_images.extend(index.find(sn_str, patterns))
 
     # 添加不区分大小写的匹配
     if not matched_images:
-        for root, dirs, files in os.walk(data_dir):
-            for file in files:
-                if file.lower().endswith(
-                        ('.jpg', '.jpeg', '.png')) and "ng" in file.lower() and sn_str.lower() in file.lower():
-                    matched_images.append(os.path.join(root, file))
+        matched_images.extend(index.find_ignore_case(sn_str, "ng"))
 
     return list(set(matched_images))  # 去重
 
@@ -90,7 +91,7 @@ def calculate_image_size(img_path, target_height):
             new_width = int(img.width * width_ratio)
             return new_width, target_height
     except Exception as e:
-        print(f"计算图片大小失败: {str(e)}")
+        logger.warning("计算图片大小失败: %s", e)
         return 100, 100  # 默认大小
 
 
@@ -133,7 +134,7 @@ def insert_images_horizontally(worksheet, row_idx, start_col, image_paths):
             x_offset += img_width + IMAGE_MARGIN
 
         except Exception as e:
-            print(f"插入图片 {img_path} 时出错: {str(e)}")
+            logger.warning("插入图片 %s 时出错: %s", img_path, e)
 
     return col_widths
 
@@ -232,7 +233,7 @@ def extract_columns(argv):
         available_sheets = "\n".join(wb.sheetnames)
         raise ValueError(f"未找到包含'不良明细'的工作表。可用工作表有：\n{available_sheets}")
 
-    print(f"找到目标工作表: {target_sheet}")
+    logger.info("找到目标工作表: %s", target_sheet)
 
     # 获取目标工作表
     sheet = wb[target_sheet]
@@ -314,7 +315,7 @@ def extract_columns(argv):
                 ng_images = find_ng_images(sn_value)
 
                 if ng_images:
-                    print(f"为SN {sn_value} 找到 {len(ng_images)} 张NG图片")
+                    logger.debug("为SN %s 找到 %d 张NG图片", sn_value, len(ng_images))
 
                     # 复制图片到结果目录
                     copied_images = []
@@ -325,7 +326,7 @@ def extract_columns(argv):
                             shutil.copy2(img_path, dest_path)
                             copied_images.append(dest_path)
                         except Exception as e:
-                            print(f"复制图片失败: {str(e)}")
+                            logger.warning("复制图片失败: %s", e)
 
                     # 插入图片到工作表（水平排列）
                     if copied_images:
@@ -340,7 +341,7 @@ def extract_columns(argv):
             # 移动到下一行
             row_idx += 1
         except Exception as e:
-            print(f"警告: 处理行 {src_row} 时出错 - {str(e)}")
+            logger.warning("警告: 处理行 %s 时出错 - %s", src_row, e)
             row_idx += 1
 
     # 应用图片尺寸到列宽
@@ -356,26 +357,30 @@ def extract_columns(argv):
     output_file = os.path.join(result_dir, f"不良明细汇总_{timestamp}.xlsx")
     new_wb.save(output_file)
 
-    print(f"成功创建新文件: {output_file}")
-    print(f"处理了 {row_idx - 2} 条记录")
-    print(f"源工作表: {target_sheet}")
+    logger.info("成功创建新文件: %s", output_file)
+    logger.info("处理了 %d 条记录", row_idx - 2)
+    logger.info("源工作表: %s", target_sheet)
 
 
 if __name__ == "__main__":
+    # 解析命令行参数
+    parser = argparse.ArgumentParser(description='处理不良明细数据（不识别图片文字）')
+    parser.add_argument('input_file', help='输入Excel文件路径')
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging(args.log_level, args.quiet, args.log_json)
+
     try:
         start_extract_zip()
         # 确保data目录存在
         if not os.path.exists("data"):
-            print("警告: data目录不存在，将跳过图片搜索")
+            logger.warning("警告: data目录不存在，将跳过图片搜索")
 
-        extract_columns(sys.argv)
+        extract_columns([sys.argv[0], args.input_file])
     except Exception as e:
-        print(f"发生错误: {str(e)}")
-        import traceback
-
-        traceback.print_exc()
-        print("请确保:")
-        print("1. 原始Excel文件存在且路径正确")
-        print("2. 文件没有被其他程序占用")
-        print("3. 包含'不良明细'的工作表存在")
-        print("4. 工作表中包含SN, Station Name, Time End三列")
+        logger.exception("发生错误: %s", e)
+        logger.error("请确保:")
+        logger.error("1. 原始Excel文件存在且路径正确")
+        logger.error("2. 文件没有被其他程序占用")
+        logger.error("3. 包含'不良明细'的工作表存在")
+        logger.error("4. 工作表中包含SN, Station Name, Time End三列")
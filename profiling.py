@@ -0,0 +1,163 @@
+import io
+import os
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# 摘要中列出的函数/内存分配条目数
+TOP_N = 20
+
+# 阶段内存峰值超过之前峰值的倍数时才重新记录内存快照
+SNAPSHOT_GROWTH = 1.1
+
+
+class StageProfiler:
+    """
+    按流水线阶段采集 cProfile 统计与 tracemalloc 内存峰值
+
+    登记到 METRICS 后，每个 METRICS.stage(...) 代码块都会按阶段名累计到同一个 cProfile 统计中
+    （逐行执行的 scan/select/copy/embed 等阶段分别统计）。阶段嵌套时函数统计只计入最内层的阶段，
+    耗时包含嵌套的阶段。只分析主线程，I/O 线程池中的代码不计入。
+    未启用时 stage() 不做任何事情，对正常运行没有开销
+    """
+
+    def __init__(self, enabled=False, result_dir='result', top_n=TOP_N):
+        self.enabled = enabled
+        self.top_n = top_n
+        self.output_dir = None
+        # 阶段名 -> 统计（按第一次进入的顺序）
+        self.stages = {}
+        self._profiles = {}
+        # 当前嵌套的阶段 [阶段名, 内存峰值]
+        self._stack = []
+        self._started_tracing = False
+        if enabled:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            self.output_dir = os.path.join(result_dir, f"profile_{timestamp}")
+            os.makedirs(self.output_dir, exist_ok=True)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        对代码块进行性能分析，同名阶段的多次执行累计在一起，结果保存为 <阶段名>.prof
+        """
+        if (not self.enabled or threading.current_thread() is not threading.main_thread()
+                or any(entry[0] == name for entry in self._stack)):
+            yield
+            return
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self._stack:
+            # 暂停外层阶段的统计，外层的内存峰值先记下来
+            outer = self._stack[-1]
+            self._profiles[outer[0]].disable()
+            outer[1] = max(outer[1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+        profile = self._profiles.get(name)
+        if profile is None:
+            profile = self._profiles[name] = cProfile.Profile()
+            self.stages[name] = {'name': name, 'seconds': 0.0, 'calls': 0, 'memory_peak': 0, 'snapshot': None}
+        entry = [name, 0]
+        self._stack.append(entry)
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - start
+            peak = max(entry[1], tracemalloc.get_traced_memory()[1])
+            self._stack.pop()
+
+            stats = self.stages[name]
+            stats['seconds'] += elapsed
+            stats['calls'] += 1
+            # 内存峰值明显升高时才做快照（分配位置在写出摘要时统计），避免每次执行都做快照
+            if peak > stats['memory_peak'] * SNAPSHOT_GROWTH:
+                stats['snapshot'] = tracemalloc.take_snapshot()
+            stats['memory_peak'] = max(stats['memory_peak'], peak)
+
+            if self._stack:
+                outer = self._stack[-1]
+                outer[1] = max(outer[1], peak)
+                tracemalloc.reset_peak()
+                self._profiles[outer[0]].enable()
+
+    def _top_functions(self, profiler):
+        """
+        按累计耗时排序的前N个函数
+        """
+        buffer = io.StringIO()
+        stats = pstats.Stats(profiler, stream=buffer)
+        stats.strip_dirs().sort_stats('cumulative').print_stats(self.top_n)
+        return buffer.getvalue()
+
+    def _top_allocations(self, snapshot):
+        """
+        按占用内存排序的前N个分配位置
+        """
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+        lines = []
+        for stat in snapshot.statistics('lineno')[:self.top_n]:
+            frame = stat.traceback[0]
+            lines.append(f"{stat.size / 1024:>10.1f} KB  {stat.count:>8} 块  "
+                         f"{os.path.basename(frame.filename)}:{frame.lineno}")
+        return "\n".join(lines)
+
+    def write_summary(self):
+        """
+        写出各阶段的简要摘要 summary.txt，返回文件路径
+        """
+        if not self.enabled:
+            return None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+        for name, profile in self._profiles.items():
+            prof_path = os.path.join(self.output_dir, f"{name}.prof")
+            profile.dump_stats(prof_path)
+            self.stages[name]['prof_path'] = prof_path
+            self.stages[name]['functions'] = self._top_functions(profile)
+            snapshot = self.stages[name].pop('snapshot')
+            self.stages[name]['allocations'] = self._top_allocations(snapshot) if snapshot is not None else ""
+
+        summary_path = os.path.join(self.output_dir, "summary.txt")
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write("阶段耗时与内存峰值（耗时包含嵌套的阶段）\n")
+            f.write("=" * 60 + "\n")
+            for stage in self.stages.values():
+                f.write(f"{stage['name']:<12} {stage['seconds']:>9.3f} 秒  {stage['calls']:>7} 次  "
+                        f"峰值内存 {stage['memory_peak'] / 1024 / 1024:>8.1f} MB\n")
+
+            for stage in self.stages.values():
+                f.write(f"\n\n[{stage['name']}] 累计耗时前 {self.top_n} 的函数（{os.path.basename(stage['prof_path'])}）\n")
+                f.write("-" * 60 + "\n")
+                f.write(stage['functions'])
+                f.write(f"\n[{stage['name']}] 出现内存峰值时占用前 {self.top_n} 的位置\n")
+                f.write("-" * 60 + "\n")
+                f.write(stage['allocations'] + "\n")
+
+        logger.info("性能分析结果已写入: %s", self.output_dir)
+        return summary_path
+
+
+def add_profile_argument(parser):
+    """
+    为命令行解析器添加 --profile 参数
+    """
+    parser.add_argument('--profile', action='store_true',
+                        help='按阶段采集cProfile与内存峰值，结果写入 result/profile_<时间戳>/')
@@ -0,0 +1,105 @@
+import os
+import sys
+import csv
+import json
+import argparse
+import logging
+
+from image_selection import DEVICE_TYPES, find_sn_folders, process_images_by_device_type
+from selection_cache import SelectionCache
+from catalog import open_catalog, build_catalog_from_disk
+from log_utils import setup_logging, add_logging_arguments
+from row_filters import read_sn_file
+
+logger = logging.getLogger(__name__)
+
+# CSV输出列
+CSV_COLUMNS = ['SN', 'Folder', 'Locate picture', 'NG picture', 'NG picture1', 'Remark']
+
+
+def query_sn_images(device_type, sns, data_dir='data', cache=None):
+    """
+    按设备类型规则查询每个SN的NG图片和定位图片（不生成工作簿）
+
+    cache 为 SelectionCache 时复用之前的挑选结果
+    返回 [{'sn', 'folder', 'locate_image', 'ng_images', 'remark'}]
+    """
+    # 确保data目录已建立索引
+    if os.path.exists(data_dir) and open_catalog(data_dir) is None:
+        logger.info("data目录尚未建立索引，正在建立...")
+        build_catalog_from_disk(data_dir)
+
+    results = []
+    for sn in sns:
+        sn = str(sn).strip()
+        if not sn:
+            continue
+
+        entry = {'sn': sn, 'folder': None, 'locate_image': None, 'ng_images': [], 'remark': ""}
+        sn_folders = find_sn_folders(sn, data_dir)
+
+        if len(sn_folders) > 1:
+            folder_names = ", ".join([os.path.basename(f) for f in sn_folders])
+            entry['remark'] = f"Error: 多个文件夹匹配 - {folder_names}"
+        elif len(sn_folders) == 1:
+            entry['folder'] = sn_folders[0]
+            ng_images, locate_image, remark = process_images_by_device_type(
+                device_type, sn_folders[0], data_dir, cache)
+            entry['ng_images'] = list(ng_images)[:2]
+            entry['locate_image'] = locate_image
+            entry['remark'] = remark
+        else:
+            entry['remark'] = "Error: 未找到包含SN的文件夹"
+
+        results.append(entry)
+    return results
+
+
+def write_json(results, stream):
+    json.dump(results, stream, ensure_ascii=False, indent=2)
+    stream.write("\n")
+
+
+def write_csv(results, stream):
+    writer = csv.writer(stream)
+    writer.writerow(CSV_COLUMNS)
+    for entry in results:
+        ng_images = entry['ng_images'] + [None, None]
+        writer.writerow([entry['sn'], entry['folder'], entry['locate_image'],
+                         ng_images[0], ng_images[1], entry['remark']])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='查询SN对应的NG图片和定位图片（不生成Excel）')
+    parser.add_argument('device_type', choices=DEVICE_TYPES, help='设备类型: 1100, 660, 1174, 639')
+    parser.add_argument('sns', nargs='*', help='要查询的SN')
+    parser.add_argument('--sn-file', default=None, help='SN列表文件（每行一个SN）')
+    parser.add_argument('--data-dir', default='data', help='已解压的data目录')
+    parser.add_argument('--format', choices=['json', 'csv'], default='json', help='输出格式')
+    parser.add_argument('--output', default=None, help='输出文件路径，默认输出到控制台')
+    parser.add_argument('--no-cache', action='store_true', help='不使用挑选结果缓存')
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    # 查询结果可能写到标准输出，日志输出到标准错误
+    setup_logging(args.log_level, args.quiet, args.log_json, stream=sys.stderr)
+
+    sn_list = list(args.sns)
+    if args.sn_file:
+        sn_list.extend(read_sn_file(args.sn_file))
+    if not sn_list:
+        parser.error("请指定要查询的SN或 --sn-file")
+
+    selection_cache = None if args.no_cache else SelectionCache()
+    try:
+        query_results = query_sn_images(args.device_type, sn_list, args.data_dir, selection_cache)
+    finally:
+        if selection_cache is not None:
+            selection_cache.close()
+
+    writer = write_csv if args.format == 'csv' else write_json
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8', newline='') as f:
+            writer(query_results, f)
+        logger.info("查询结果已写入: %s", args.output)
+    else:
+        writer(query_results, sys.stdout)
@@ -0,0 +1,87 @@
+import os
+import re
+
+# 文件名中的拍摄时间（14位，如 -20250817043203-）和连拍时间（17位，如 _20250817043235174_）
+CAPTURE_TS_PATTERN = re.compile(r'-(\d{14})-')
+BURST_TS_PATTERN = re.compile(r'_(\d{17})_')
+
+
+def parse_name_timestamp(name):
+    """
+    从文件名解析 (拍摄时间, 连拍时间)，没有拍摄时间时返回None；没有连拍时间的为连拍第一张，排在最前
+    """
+    capture = CAPTURE_TS_PATTERN.search(name)
+    if capture is None:
+        return None
+    burst = BURST_TS_PATTERN.search(name)
+    return capture.group(1), burst.group(1) if burst else ""
+
+
+class ImageRecord:
+    """
+    文件夹中的一张图片：路径、文件名、大小、修改时间和文件名中的时间戳
+
+    使用 __slots__，一个文件夹有数千张复判图片时也只占用很少的内存
+    """
+
+    __slots__ = ('path', 'name', 'lower_name', 'size', 'mtime', 'timestamp')
+
+    def __init__(self, path, size=None, mtime=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.lower_name = self.name.lower()
+        self.size = size
+        self.mtime = mtime
+        # 扫描时解析一次，排序时不再访问文件系统
+        self.timestamp = parse_name_timestamp(self.name)
+
+    def __fspath__(self):
+        return self.path
+
+    def __repr__(self):
+        return f"ImageRecord({self.path!r})"
+
+
+class SelectionResult:
+    """
+    一个SN文件夹的挑选结果：NG图片路径列表、定位图片路径和备注
+
+    可以按 ng_images, locate_image, remark = result 的方式解包
+    """
+
+    __slots__ = ('ng_images', 'locate_image', 'remark')
+
+    def __init__(self, ng_images=(), locate_image=None, remark=""):
+        self.ng_images = [os.fspath(img) for img in ng_images]
+        self.locate_image = os.fspath(locate_image) if locate_image is not None else None
+        self.remark = remark
+
+    def __iter__(self):
+        return iter((self.ng_images, self.locate_image, self.remark))
+
+    def __repr__(self):
+        return f"SelectionResult({self.ng_images!r}, {self.locate_image!r}, {self.remark!r})"
+
+
+class RowResult:
+    """
+    报表中一行的处理结果（复制到result目录后的图片路径）
+    """
+
+    __slots__ = ('sn', 'station', 'time_end', 'folder', 'ng_images', 'locate_image', 'remark')
+
+    def __init__(self, sn, station, time_end):
+        self.sn = sn
+        self.station = station
+        self.time_end = time_end
+        self.folder = None
+        self.ng_images = []
+        self.locate_image = None
+        self.remark = ""
+
+    def add_remark(self, remark):
+        """
+        追加备注（多条备注按行分隔）
+        """
+        if remark:
+            self.remark = self.remark + "\n" + remark if self.remark else remark
@@ -0,0 +1,173 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from openpyxl import Workbook
+from openpyxl.styles import Font
+
+from run_metrics import METRICS
+from image_access import get_image_store
+
+logger = logging.getLogger(__name__)
+
+# 分片工作簿默认的并行进程数
+SHARD_WORKERS = os.cpu_count() or 1
+
+
+class ShardSpec:
+    """
+    报表分片规则：每个分片的最大行数、最大图片数据量（MB）、是否按站位分片
+
+    多个规则可以同时使用，任一条件达到上限即开始新的分片
+    """
+
+    __slots__ = ('max_rows', 'max_image_mb', 'by_station', 'workers')
+
+    def __init__(self, max_rows=None, max_image_mb=None, by_station=False, workers=SHARD_WORKERS):
+        self.max_rows = max_rows
+        self.max_image_mb = max_image_mb
+        self.by_station = by_station
+        self.workers = max(1, workers)
+
+    @property
+    def enabled(self):
+        return bool(self.max_rows or self.max_image_mb or self.by_station)
+
+
+def estimate_image_bytes(result):
+    """
+    估算一行嵌入工作簿的图片数据量（复制后的图片文件大小之和）
+    """
+    total = 0
+    for path in result.ng_images[:2] + ([result.locate_image] if result.locate_image else []):
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            continue
+    return total
+
+
+def plan_shards(row_results, spec):
+    """
+    按分片规则切分行结果，返回 [(分片名称, 行结果列表)]，保持原有行顺序
+    """
+    if spec.by_station:
+        groups = {}
+        for result in row_results:
+            groups.setdefault(str(result.station or "NoStation"), []).append(result)
+        groups = list(groups.items())
+    else:
+        groups = [("", list(row_results))]
+
+    max_bytes = spec.max_image_mb * 1024 * 1024 if spec.max_image_mb else None
+    shards = []
+    for group_name, results in groups:
+        parts = []
+        current = []
+        current_bytes = 0
+        for result in results:
+            row_bytes = estimate_image_bytes(result) if max_bytes else 0
+            full = (spec.max_rows and len(current) >= spec.max_rows) or \
+                   (max_bytes and current and current_bytes + row_bytes > max_bytes)
+            if full:
+                parts.append(current)
+                current = []
+                current_bytes = 0
+            current.append(result)
+            current_bytes += row_bytes
+        if current or not parts:
+            parts.append(current)
+
+        for index, part in enumerate(parts, start=1):
+            name = "_".join(filter(None, [_safe_name(group_name), f"part{index:03d}"]))
+            shards.append((name, part))
+    return shards
+
+
+def _safe_name(text):
+    """
+    站位名称转换为可用于文件名的字符串
+    """
+    return "".join(ch if ch.isalnum() or ch in '-_' else '_' for ch in text)
+
+
+def _build_shard(writer, results, path):
+    """
+    在工作进程中生成并保存一个分片，返回 (文件路径, 该进程的运行指标)
+    """
+    METRICS.reset()
+    writer(results, path)
+    get_image_store().close()
+    return path, METRICS.to_dict()
+
+
+def write_index_workbook(shards, shard_paths, index_path):
+    """
+    生成分片索引工作簿：每个分片一行，包含文件链接、行数和SN范围
+    """
+    wb = Workbook()
+    sheet = wb.active
+    sheet.title = "分片索引"
+    sheet.append(['Shard', 'File', 'Rows', 'First SN', 'Last SN'])
+    for cell in sheet[1]:
+        cell.font = Font(bold=True)
+
+    index_dir = os.path.dirname(os.path.abspath(index_path))
+    for (name, results), path in zip(shards, shard_paths):
+        first_sn = results[0].sn if results else None
+        last_sn = results[-1].sn if results else None
+        sheet.append([name, os.path.basename(path), len(results), first_sn, last_sn])
+        link_cell = sheet.cell(row=sheet.max_row, column=2)
+        link_cell.hyperlink = os.path.relpath(path, index_dir).replace(os.sep, '/')
+        link_cell.font = Font(color="0563C1", underline="single")
+
+    for column, width in zip('ABCDE', (30, 60, 8, 24, 24)):
+        sheet.column_dimensions[column].width = width
+    wb.save(index_path)
+    return index_path
+
+
+def write_sharded_workbooks(row_results, output_base, spec, writer):
+    """
+    按分片规则生成多个工作簿，每个分片在独立的进程中生成并保存
+
+    writer(行结果, 路径) 为单个工作簿的生成函数（需要能被子进程导入）
+    返回 [索引工作簿路径, 分片路径...]
+    """
+    shards = plan_shards(row_results, spec)
+    shard_paths = [f"{output_base}_{name}.xlsx" for name, _ in shards]
+    logger.info("报表分为 %d 个分片，使用 %d 个进程生成", len(shards), min(spec.workers, len(shards)))
+
+    if spec.workers == 1 or len(shards) == 1:
+        for (_, results), path in zip(shards, shard_paths):
+            writer(results, path)
+    else:
+        with ProcessPoolExecutor(max_workers=min(spec.workers, len(shards))) as executor:
+            futures = [executor.submit(_build_shard, writer, results, path)
+                       for (_, results), path in zip(shards, shard_paths)]
+            for future in futures:
+                path, metrics = future.result()
+                # 各进程的阶段耗时累加（为各进程耗时之和，不是墙钟时间）
+                METRICS.merge(metrics)
+                logger.debug("分片已保存: %s", path)
+    METRICS.incr('report_shards', len(shards))
+
+    index_path = write_index_workbook(shards, shard_paths, output_base + "_index.xlsx")
+    logger.info("分片索引已写入: %s", index_path)
+    return [index_path] + shard_paths
+
+
+def add_shard_arguments(parser):
+    """
+    为命令行解析器添加报表分片参数
+    """
+    parser.add_argument('--shard-rows', type=int, default=None, help='xlsx报表分片：每个分片的最大行数')
+    parser.add_argument('--shard-mb', type=float, default=None,
+                        help='xlsx报表分片：每个分片嵌入图片的估算数据量上限（MB）')
+    parser.add_argument('--shard-by-station', action='store_true', help='xlsx报表分片：按站位分别生成工作簿')
+    parser.add_argument('--shard-workers', type=int, default=SHARD_WORKERS,
+                        help=f'并行生成分片的进程数，默认 {SHARD_WORKERS}')
+
+
+def shard_spec_from_args(args):
+    return ShardSpec(args.shard_rows, args.shard_mb, args.shard_by_station, args.shard_workers)
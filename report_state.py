@@ -0,0 +1,66 @@
+import os
+import sqlite3
+from datetime import datetime
+
+# 已输出记录的状态库（与报表放在同一个result目录中）
+STATE_NAME = 'report_state.sqlite3'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS emitted_rows (
+    device_type TEXT NOT NULL,
+    sn TEXT NOT NULL,
+    station TEXT NOT NULL,
+    time_end TEXT NOT NULL,
+    report_file TEXT NOT NULL,
+    emitted_at TEXT NOT NULL,
+    PRIMARY KEY (device_type, sn, station, time_end)
+);
+"""
+
+
+def row_key(sn_value, station_value, time_value):
+    """
+    生成记录的唯一键 (SN, Station, Time End)，统一数字、日期和字符串的表示
+    """
+    def normalize(value):
+        if value is None:
+            return ""
+        if isinstance(value, datetime):
+            return value.strftime("%Y-%m-%d %H:%M:%S")
+        return str(value).strip()
+
+    return normalize(sn_value), normalize(station_value), normalize(time_value)
+
+
+class ReportState:
+    """
+    记录每种设备类型已经输出过的 (SN, Station, Time End) 记录，用于增量生成报表
+    """
+
+    def __init__(self, result_dir='result'):
+        os.makedirs(result_dir, exist_ok=True)
+        self.path = os.path.join(result_dir, STATE_NAME)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+
+    def emitted_keys(self, device_type):
+        """
+        返回该设备类型已输出记录的键集合
+        """
+        rows = self.conn.execute("SELECT sn, station, time_end FROM emitted_rows WHERE device_type = ?",
+                                 (device_type,))
+        return {tuple(row) for row in rows}
+
+    def record(self, device_type, keys, report_file):
+        """
+        报表保存成功后登记本次输出的记录
+        """
+        emitted_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO emitted_rows (device_type, sn, station, time_end, report_file, emitted_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(device_type, sn, station, time_end, report_file, emitted_at) for sn, station, time_end in keys])
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,141 @@
+import fnmatch
+import argparse
+from datetime import datetime
+
+# Time End 支持的时间格式（源表中可能是日期单元格或文本）
+DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d")
+TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M") + DATE_FORMATS
+
+
+def parse_time(value):
+    """
+    将日期单元格或文本转换为 datetime，无法解析时返回None
+    """
+    if isinstance(value, datetime):
+        return value
+    if value is None:
+        return None
+    text = str(value).strip()
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def read_sn_file(path):
+    """
+    读取SN列表文件（每行一个SN，记事本保存的文件开头可能带有BOM）
+    """
+    with open(path, encoding='utf-8-sig') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+class RowFilter:
+    """
+    源工作表行过滤条件：Time End 时间窗口、Station Name 通配符、SN 白名单和黑名单
+
+    在读取源表时逐行判断，不满足条件的行不做任何文件夹查找和图片处理
+    """
+
+    __slots__ = ('time_from', 'time_to', 'station_patterns', 'sn_allow', 'sn_deny')
+
+    def __init__(self, time_from=None, time_to=None, station_patterns=None, sn_allow=None, sn_deny=None):
+        self.time_from = time_from
+        self.time_to = time_to
+        # 站位名称不区分大小写
+        self.station_patterns = [pattern.upper() for pattern in station_patterns or []]
+        # 白名单为空（例如SN列表文件为空）时不处理任何行，None 表示没有白名单
+        self.sn_allow = {str(sn).strip() for sn in sn_allow} if sn_allow is not None else None
+        self.sn_deny = {str(sn).strip() for sn in sn_deny} if sn_deny else set()
+
+    @property
+    def enabled(self):
+        return bool(self.time_from or self.time_to or self.station_patterns or
+                    self.sn_allow is not None or self.sn_deny)
+
+    def matches(self, sn_value, station_value, time_value):
+        """
+        判断一行是否满足所有过滤条件（先判断最便宜的SN集合）
+        """
+        sn = str(sn_value).strip() if sn_value is not None else ""
+        if sn in self.sn_deny:
+            return False
+        if self.sn_allow is not None and sn not in self.sn_allow:
+            return False
+
+        if self.station_patterns:
+            station = str(station_value).strip().upper() if station_value is not None else ""
+            if not any(fnmatch.fnmatchcase(station, pattern) for pattern in self.station_patterns):
+                return False
+
+        if self.time_from or self.time_to:
+            time_end = parse_time(time_value)
+            if time_end is None:
+                return False
+            if self.time_from and time_end < self.time_from:
+                return False
+            if self.time_to and time_end > self.time_to:
+                return False
+        return True
+
+    def describe(self):
+        """
+        过滤条件的文字说明（用于日志）
+        """
+        parts = []
+        if self.time_from or self.time_to:
+            parts.append(f"Time End {self.time_from or '-'} ~ {self.time_to or '-'}")
+        if self.station_patterns:
+            parts.append(f"Station Name {'|'.join(self.station_patterns)}")
+        if self.sn_allow is not None:
+            parts.append(f"SN白名单 {len(self.sn_allow)} 个")
+        if self.sn_deny:
+            parts.append(f"SN黑名单 {len(self.sn_deny)} 个")
+        return ", ".join(parts)
+
+
+def _time_argument(text):
+    value = parse_time(text)
+    if value is None:
+        raise argparse.ArgumentTypeError(f"无法解析的时间: {text}（例如 2025-08-17 08:00）")
+    return value
+
+
+def _time_to_argument(text):
+    """
+    结束时间只给出日期时包含当天全天
+    """
+    value = _time_argument(text)
+    for fmt in DATE_FORMATS:
+        try:
+            datetime.strptime(text.strip(), fmt)
+        except ValueError:
+            continue
+        return value.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return value
+
+
+def add_filter_arguments(parser):
+    """
+    为命令行解析器添加源表行过滤参数
+    """
+    parser.add_argument('--time-from', type=_time_argument, default=None,
+                        help='只处理 Time End 不早于该时间的记录，例如 "2025-08-17 08:00"')
+    parser.add_argument('--time-to', type=_time_to_argument, default=None,
+                        help='只处理 Time End 不晚于该时间的记录（只给出日期时包含当天全天）')
+    parser.add_argument('--station', action='append', default=None,
+                        help='只处理 Station Name 匹配通配符的记录（不区分大小写，可多次指定），例如 "*STATION11?"')
+    parser.add_argument('--sn', action='append', default=None, help='只处理指定的SN（可多次指定）')
+    parser.add_argument('--sn-file', default=None, help='只处理SN列表文件中的SN（每行一个SN）')
+    parser.add_argument('--exclude-sn', action='append', default=None, help='跳过指定的SN（可多次指定）')
+    parser.add_argument('--exclude-sn-file', default=None, help='跳过SN列表文件中的SN（每行一个SN）')
+
+
+def row_filter_from_args(args):
+    sn_allow = None
+    if args.sn or args.sn_file:
+        sn_allow = list(args.sn or []) + (read_sn_file(args.sn_file) if args.sn_file else [])
+    sn_deny = list(args.exclude_sn or []) + (read_sn_file(args.exclude_sn_file) if args.exclude_sn_file else [])
+    return RowFilter(args.time_from, args.time_to, args.station, sn_allow, sn_deny)
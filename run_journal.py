@@ -0,0 +1,182 @@
+import os
+import json
+import hashlib
+import sqlite3
+import logging
+from datetime import datetime
+
+from records import RowResult
+
+logger = logging.getLogger(__name__)
+
+# 运行日志库（与报表放在同一个result目录中）
+JOURNAL_NAME = 'run_journal.sqlite3'
+
+# 每处理多少行提交一次检查点
+CHECKPOINT_ROWS = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    run_key TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    extracted INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS row_results (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    device_type TEXT NOT NULL,
+    src_row INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (run_id, device_type, src_row)
+);
+"""
+
+
+def run_key(device_types, input_file, **options):
+    """
+    根据设备类型、输入文件（路径、大小、修改时间）和影响结果的选项生成运行标识
+
+    只有标识相同的运行才能继续，输入文件或选项变化后会重新开始
+    """
+    stat = os.stat(input_file)
+    identity = {
+        'device_types': list(device_types),
+        'input_file': os.path.abspath(input_file),
+        'size': stat.st_size,
+        'mtime': int(stat.st_mtime),
+        'options': options,
+    }
+    return hashlib.sha1(json.dumps(identity, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _encode_value(value):
+    # 日期单元格需要原样恢复，否则报表中的时间格式会变化
+    if isinstance(value, datetime):
+        return {'datetime': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'datetime' in value:
+        return datetime.fromisoformat(value['datetime'])
+    return value
+
+
+def encode_row_result(result):
+    return json.dumps({
+        'sn': _encode_value(result.sn),
+        'station': _encode_value(result.station),
+        'time_end': _encode_value(result.time_end),
+        'folder': result.folder,
+        'ng_images': result.ng_images,
+        'locate_image': result.locate_image,
+        'remark': result.remark,
+    }, ensure_ascii=False)
+
+
+def decode_row_result(text):
+    data = json.loads(text)
+    result = RowResult(_decode_value(data['sn']), _decode_value(data['station']), _decode_value(data['time_end']))
+    result.folder = data['folder']
+    result.ng_images = list(data['ng_images'])
+    result.locate_image = data['locate_image']
+    result.remark = data['remark']
+    return result
+
+
+class RunJournal:
+    """
+    报表运行日志：边处理边记录已完成的行结果（包括已复制到result目录的图片），
+    运行中断后使用 --resume 可以跳过解压和已完成的行，直接复用之前的结果
+    """
+
+    def __init__(self, result_dir, key, resume=False):
+        os.makedirs(result_dir, exist_ok=True)
+        self.path = os.path.join(result_dir, JOURNAL_NAME)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+        self.resumed = False
+        self.extracted = False
+        self._pending = []
+
+        row = None
+        if resume:
+            row = self.conn.execute(
+                "SELECT id, extracted FROM runs WHERE run_key = ? AND completed = 0 ORDER BY id DESC LIMIT 1",
+                (key,)).fetchone()
+            if row is None:
+                logger.info("没有可以继续的中断运行，重新开始")
+
+        if row is not None:
+            self.run_id, extracted = row
+            self.resumed = True
+            self.extracted = bool(extracted)
+            count = self.conn.execute("SELECT COUNT(*) FROM row_results WHERE run_id = ?",
+                                      (self.run_id,)).fetchone()[0]
+            logger.info("继续中断的运行: 已完成 %d 条行结果%s", count, "，跳过解压" if self.extracted else "")
+        else:
+            with self.conn:
+                # 同一运行标识的旧的未完成记录不再需要
+                self._delete_runs("run_key = ? AND completed = 0", (key,))
+                cursor = self.conn.execute("INSERT INTO runs (run_key, started_at) VALUES (?, ?)",
+                                           (key, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            self.run_id = cursor.lastrowid
+
+    def _delete_runs(self, where, params):
+        run_ids = [row[0] for row in self.conn.execute(f"SELECT id FROM runs WHERE {where}", params)]
+        for run_id in run_ids:
+            self.conn.execute("DELETE FROM row_results WHERE run_id = ?", (run_id,))
+            self.conn.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+
+    def mark_extracted(self):
+        """
+        记录解压和建立目录已完成
+        """
+        with self.conn:
+            self.conn.execute("UPDATE runs SET extracted = 1 WHERE id = ?", (self.run_id,))
+        self.extracted = True
+
+    def completed_rows(self, device_type):
+        """
+        返回该设备类型之前已完成的行结果 {源表行号: RowResult}
+        """
+        if not self.resumed:
+            return {}
+        rows = self.conn.execute("SELECT src_row, result FROM row_results WHERE run_id = ? AND device_type = ?",
+                                 (self.run_id, device_type))
+        return {src_row: decode_row_result(text) for src_row, text in rows}
+
+    def record(self, src_row, results):
+        """
+        记录一行的处理结果 {设备类型: RowResult}，每 CHECKPOINT_ROWS 行提交一次
+        """
+        for device_type, result in results.items():
+            self._pending.append((self.run_id, device_type, src_row, encode_row_result(result)))
+        if len(self._pending) >= CHECKPOINT_ROWS * len(results):
+            self.checkpoint()
+
+    def checkpoint(self):
+        """
+        提交尚未写入的行结果
+        """
+        if not self._pending:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO row_results (run_id, device_type, src_row, result) VALUES (?, ?, ?, ?)",
+                self._pending)
+        self._pending = []
+
+    def finish(self):
+        """
+        所有报表保存成功后调用：删除本次运行的行结果，之后不能再继续
+        """
+        self._pending = []
+        with self.conn:
+            self.conn.execute("DELETE FROM row_results WHERE run_id = ?", (self.run_id,))
+            self.conn.execute("UPDATE runs SET completed = 1 WHERE id = ?", (self.run_id,))
+
+    def close(self):
+        self.checkpoint()
+        self.conn.close()
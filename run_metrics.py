@@ -0,0 +1,182 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+
+
+# 流水线各阶段名称（按执行顺序）
+STAGES = ['extract', 'index', 'scan', 'verify', 'dedup', 'select', 'ocr', 'copy', 'thumbnail', 'embed', 'format', 'save', 'export']
+
+# Prometheus 指标名前缀
+METRIC_PREFIX = 'process_ng'
+
+
+class RunMetrics:
+    """
+    记录一次运行的各阶段耗时与计数器
+    """
+
+    def __init__(self):
+        # 启用 --profile 时的 StageProfiler，每个阶段同时做性能分析
+        self.profiler = None
+        self.reset()
+
+    def reset(self):
+        """
+        清空所有计时与计数
+        """
+        self.started_at = time.time()
+        self.stage_seconds = {}
+        self.stage_calls = {}
+        self.counters = {}
+        self.labels = {}
+
+    @contextmanager
+    def stage(self, name):
+        """
+        统计代码块耗时，累加到指定阶段
+        """
+        if self.profiler is not None:
+            with self.profiler.stage(name), self._timed(name):
+                yield
+        else:
+            with self._timed(name):
+                yield
+
+    @contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + elapsed
+            self.stage_calls[name] = self.stage_calls.get(name, 0) + 1
+
+    def incr(self, name, value=1):
+        """
+        计数器加值
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, data):
+        """
+        合并其他进程的运行指标（to_dict() 的结果），阶段耗时与计数器累加
+        """
+        for name, stage in data.get('stages', {}).items():
+            if stage['calls']:
+                self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + stage['seconds']
+                self.stage_calls[name] = self.stage_calls.get(name, 0) + stage['calls']
+        for name, value in data.get('counters', {}).items():
+            self.incr(name, value)
+
+    def set_profiler(self, profiler):
+        """
+        登记性能分析器，之后每个阶段同时做性能分析（未启用的分析器不登记）
+        """
+        self.profiler = profiler if profiler is not None and profiler.enabled else None
+
+    def set_label(self, name, value):
+        """
+        设置附加标签（如设备类型、输入文件）
+        """
+        self.labels[name] = str(value)
+
+    def to_dict(self):
+        """
+        转换为可序列化的字典
+        """
+        stages = {}
+        for name in STAGES + sorted(set(self.stage_seconds) - set(STAGES)):
+            stages[name] = {
+                'seconds': round(self.stage_seconds.get(name, 0.0), 6),
+                'calls': self.stage_calls.get(name, 0),
+            }
+        return {
+            'started_at': _datetime_str(self.started_at),
+            'wall_seconds': round(time.time() - self.started_at, 6),
+            'labels': dict(self.labels),
+            'stages': stages,
+            'counters': dict(sorted(self.counters.items())),
+        }
+
+    def to_prometheus(self):
+        """
+        生成 Prometheus textfile 格式文本
+        """
+        data = self.to_dict()
+        label_str = ",".join(f'{k}="{_escape_label(v)}"' for k, v in sorted(data['labels'].items()))
+
+        def fmt(metric, value, extra=""):
+            labels = ",".join(filter(None, [label_str, extra]))
+            return f"{metric}{{{labels}}} {value}" if labels else f"{metric} {value}"
+
+        lines = [
+            f"# HELP {METRIC_PREFIX}_stage_seconds 各阶段累计耗时（秒）",
+            f"# TYPE {METRIC_PREFIX}_stage_seconds gauge",
+        ]
+        for name, stage in data['stages'].items():
+            lines.append(fmt(f"{METRIC_PREFIX}_stage_seconds", stage['seconds'], f'stage="{name}"'))
+
+        lines.append(f"# HELP {METRIC_PREFIX}_stage_calls 各阶段执行次数")
+        lines.append(f"# TYPE {METRIC_PREFIX}_stage_calls gauge")
+        for name, stage in data['stages'].items():
+            lines.append(fmt(f"{METRIC_PREFIX}_stage_calls", stage['calls'], f'stage="{name}"'))
+
+        # textfile 每次运行整体覆盖，计数会回到较小的值，按 gauge 导出
+        for name, value in data['counters'].items():
+            metric = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(fmt(metric, value))
+
+        lines.append(f"# TYPE {METRIC_PREFIX}_wall_seconds gauge")
+        lines.append(fmt(f"{METRIC_PREFIX}_wall_seconds", data['wall_seconds']))
+        lines.append(f"# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge")
+        lines.append(fmt(f"{METRIC_PREFIX}_last_run_timestamp_seconds", int(self.started_at)))
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_base):
+        """
+        写出 JSON 与 Prometheus textfile 两种格式，返回写出的文件路径
+        """
+        directory = os.path.dirname(output_base)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        json_path = output_base + ".json"
+        prom_path = output_base + ".prom"
+
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+        # 先写临时文件再替换，避免监控采集到写了一半的文件
+        tmp_path = prom_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, prom_path)
+
+        return json_path, prom_path
+
+    def summary_lines(self):
+        """
+        生成简短的文字摘要
+        """
+        lines = []
+        for name in STAGES:
+            if name in self.stage_seconds:
+                lines.append(f"{name:<10} {self.stage_seconds[name]:>9.3f} 秒  ({self.stage_calls[name]} 次)")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:<24} {value}")
+        return lines
+
+
+def _datetime_str(ts):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# 全局指标对象，各模块共用
+METRICS = RunMetrics()
@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+import sqlite3
+from datetime import datetime
+
+from catalog import IMAGE_EXTENSIONS, open_catalog, lookup_folder_listing
+from records import SelectionResult
+
+# 挑选结果缓存库（与报表放在同一个result目录中，data目录重建后仍然保留）
+CACHE_NAME = 'selection_cache.sqlite3'
+
+# 挑选规则变化时递增，使旧的缓存结果全部失效
+CACHE_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS selections (
+    device_type TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (device_type, fingerprint)
+);
+"""
+
+
+def folder_listing(folder_path, data_dir='data'):
+    """
+    返回文件夹中图片的 [(文件名, 大小, 修改时间)]，优先从目录数据库读取
+    """
+    conn = open_catalog(data_dir)
+    if conn is not None:
+        listed = lookup_folder_listing(conn, folder_path)
+        if listed is not None:
+            return listed
+
+    listed = []
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                stat = entry.stat()
+                listed.append((entry.name, stat.st_size, stat.st_mtime))
+    return sorted(listed)
+
+
+def folder_fingerprint(folder_path, data_dir='data'):
+    """
+    根据文件夹中图片的文件名、大小和修改时间计算指纹，文件夹不存在时返回None
+    """
+    if not os.path.isdir(folder_path):
+        return None
+    digest = hashlib.sha1(f"v{CACHE_VERSION}".encode())
+    for name, size, mtime in folder_listing(folder_path, data_dir):
+        # 修改时间取整到秒，避免不同文件系统的精度差异
+        digest.update(f"\0{name}\0{size}\0{int(mtime)}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class SelectionCache:
+    """
+    按 (设备类型, 文件夹指纹) 缓存每个SN文件夹的挑选结果
+
+    结果中只保存文件名，读取时再拼接当前的文件夹路径，因此重新解压到其他位置后仍然可以命中
+    """
+
+    def __init__(self, result_dir='result'):
+        os.makedirs(result_dir, exist_ok=True)
+        self.path = os.path.join(result_dir, CACHE_NAME)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+        # 本次运行内的结果，同一文件夹重复出现时不再查询数据库
+        self._memory = {}
+
+    def get(self, device_type, fingerprint, folder_path):
+        """
+        返回缓存的 SelectionResult，未命中时返回None
+        """
+        key = (device_type, fingerprint)
+        result = self._memory.get(key)
+        if result is None:
+            row = self.conn.execute("SELECT result FROM selections WHERE device_type = ? AND fingerprint = ?",
+                                    key).fetchone()
+            if row is None:
+                return None
+            result = json.loads(row[0])
+            self._memory[key] = result
+
+        ng_images = [os.path.join(folder_path, name) for name in result['ng_images']]
+        locate_image = os.path.join(folder_path, result['locate_image']) if result['locate_image'] else None
+        return SelectionResult(ng_images, locate_image, result['remark'])
+
+    def put(self, device_type, fingerprint, selection):
+        """
+        保存挑选结果 SelectionResult
+        """
+        ng_images, locate_image, remark = selection
+        result = {
+            'ng_images': [os.path.basename(path) for path in ng_images],
+            'locate_image': os.path.basename(locate_image) if locate_image else None,
+            'remark': remark,
+        }
+        key = (device_type, fingerprint)
+        self._memory[key] = result
+        created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO selections (device_type, fingerprint, result, created_at) VALUES (?, ?, ?, ?)",
+                (device_type, fingerprint, json.dumps(result, ensure_ascii=False), created_at))
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,168 @@
+import os
+import io
+import random
+import string
+import zipfile
+import argparse
+from datetime import datetime, timedelta
+
+from openpyxl import Workbook
+from PIL import Image as PILImage
+
+
+# 生成的图片尺寸（像素）
+IMAGE_SIZE = (320, 240)
+
+# 机型与站位
+MODEL = 'RH660'
+LINE_ID = 'A03-4FT-02A'
+STATIONS = [111, 112, 114, 115]
+
+
+def random_sn(rng):
+    """
+    生成与产线格式一致的SN，例如 J5QHKC003GK0000UHY
+    """
+    chars = string.ascii_uppercase + string.digits
+    return 'J5QH' + ''.join(rng.choice(chars) for _ in range(7)) + '0000UH' + rng.choice('YZ')
+
+
+def _make_jpeg(rng, size, quality):
+    """
+    生成带噪点的JPEG图片字节（噪点保证压缩后仍大于10KB）
+    """
+    width, height = size
+    img = PILImage.frombytes('RGB', size, rng.randbytes(width * height * 3))
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def _image_name(sn, phase, ts14, station, verdict, kind, burst_ts=None, rng=None):
+    """
+    按产线命名规则生成图片文件名
+    """
+    name = f"{MODEL}-{sn}-{phase}-{ts14}-Station{station}-{verdict}-{kind}"
+    if burst_ts:
+        name += f"_{burst_ts}_{rng.getrandbits(32):08x}"
+    return name + ".jpg"
+
+
+def _sn_images(rng, sn, ts, images_per_sn, templates, small_ratio, corrupt_ratio):
+    """
+    生成一个SN的全部图片，返回 [(文件名, 字节)]
+    """
+    ts14 = ts.strftime("%Y%m%d%H%M%S")
+    ng_station = rng.choice(STATIONS)
+    ok_images = []
+
+    # Original 阶段：每个站位一张 OK 图
+    for station in STATIONS:
+        ok_images.append((_image_name(sn, 'Original', ts14, station, 'OK', 'CAP'), rng.choice(templates)))
+
+    # Recheck 阶段：OK 站位的 CAP/SRC
+    for station in STATIONS:
+        if station == ng_station:
+            continue
+        ok_images.append((_image_name(sn, 'Recheck', ts14, station, 'OK', 'CAP'), rng.choice(templates)))
+        ok_images.append((_image_name(sn, 'Recheck', ts14, station, 'OK', 'SRC'), rng.choice(templates)))
+
+    # Recheck 阶段：NG 站位的连拍 CAP/SRC（至少一组）
+    ng_count = max(2, images_per_sn - len(ok_images))
+    ng_images = []
+    burst = 0
+    while len(ng_images) < ng_count:
+        burst_time = ts + timedelta(seconds=30 + burst * 2, milliseconds=rng.randint(0, 999))
+        burst_ts = burst_time.strftime("%Y%m%d%H%M%S%f")[:17]
+        for kind in ('CAP', 'SRC'):
+            name = _image_name(sn, 'Recheck', ts14, ng_station, 'NG', kind,
+                               burst_ts if burst else None, rng)
+            ng_images.append((name, rng.choice(templates)))
+        burst += 1
+
+    images = ok_images[:max(0, images_per_sn - ng_count)] + ng_images[:ng_count]
+
+    # 按比例替换为小文件或损坏文件
+    result = []
+    for name, data in images:
+        roll = rng.random()
+        if roll < small_ratio:
+            data = templates[0][:2048]  # 截断为小于10KB的文件
+        elif roll < small_ratio + corrupt_ratio:
+            data = rng.randbytes(20 * 1024)  # 无法识别的图片
+        result.append((name, data))
+    return result
+
+
+def generate_batch(output_dir, n_sns, images_per_sn, nested_ratio=0.3, macosx=True,
+                   small_ratio=0.05, corrupt_ratio=0.02, seed=0):
+    """
+    生成一批合成产线数据：output_dir/zip 下的ZIP文件及匹配的不良明细工作簿
+
+    返回 (工作簿路径, SN列表)
+    """
+    rng = random.Random(seed)
+    zip_dir = os.path.join(output_dir, 'zip')
+    os.makedirs(zip_dir, exist_ok=True)
+
+    # 预先生成少量图片模板，重复使用以加快生成速度
+    templates = [_make_jpeg(rng, IMAGE_SIZE, 90) for _ in range(4)]
+
+    base_time = datetime(2025, 8, 17, 4, 0, 0)
+    rows = []
+    sns = []
+    for index in range(n_sns):
+        sn = random_sn(rng)
+        sns.append(sn)
+        ts = base_time + timedelta(minutes=7 * index, seconds=rng.randint(0, 59))
+        ts14 = ts.strftime("%Y%m%d%H%M%S")
+        archive_stem = f"{sn}_B788_GTBN_{LINE_ID}_{MODEL}_{rng.randint(1, 2)}_{ts14}"
+        images = _sn_images(rng, sn, ts, images_per_sn, templates, small_ratio, corrupt_ratio)
+
+        with zipfile.ZipFile(os.path.join(zip_dir, archive_stem + '.zip'), 'w', zipfile.ZIP_STORED) as zf:
+            if rng.random() < nested_ratio:
+                # 嵌套ZIP：一半图片放入内层压缩包
+                half = len(images) // 2
+                inner = io.BytesIO()
+                with zipfile.ZipFile(inner, 'w', zipfile.ZIP_STORED) as inner_zf:
+                    for name, data in images[half:]:
+                        inner_zf.writestr(name, data)
+                zf.writestr("Recheck_part2.zip", inner.getvalue())
+                images = images[:half]
+            for name, data in images:
+                zf.writestr(name, data)
+                if macosx:
+                    zf.writestr(f"__MACOSX/._{name}", b'\x00\x05\x16\x07' + bytes(60))
+
+        station = rng.choice(STATIONS)
+        rows.append((index + 1, sn, f"GTBN_{LINE_ID}_1_STATION{station}", ts.strftime("%Y-%m-%d %H:%M:%S")))
+
+    # 不良明细工作簿（与产线导出的Detail文件结构一致）
+    wb = Workbook()
+    sheet = wb.active
+    sheet.title = '不良明细_SYNTHETIC'
+    sheet.append(['Item', 'SN', 'Station Name', 'Time End', 'Error Code'])
+    for item, sn, station_name, time_end in rows:
+        sheet.append([item, sn, station_name, time_end, 'Glue Dispense NG=1'])
+    wb.create_sheet('不良TOP_SYNTHETIC')
+    workbook_path = os.path.join(output_dir, 'synthetic_Detail.xlsx')
+    wb.save(workbook_path)
+
+    return workbook_path, sns
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='生成合成产线数据（ZIP + 不良明细工作簿）')
+    parser.add_argument('output_dir', help='输出目录')
+    parser.add_argument('--sns', type=int, default=50, help='SN数量')
+    parser.add_argument('--images', type=int, default=20, help='每个SN的图片数量')
+    parser.add_argument('--nested-ratio', type=float, default=0.3, help='包含嵌套ZIP的比例')
+    parser.add_argument('--small-ratio', type=float, default=0.05, help='小于10KB文件的比例')
+    parser.add_argument('--corrupt-ratio', type=float, default=0.02, help='损坏图片的比例')
+    parser.add_argument('--no-macosx', action='store_true', help='不生成__MACOSX干扰文件')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    args = parser.parse_args()
+
+    path, generated = generate_batch(args.output_dir, args.sns, args.images, args.nested_ratio,
+                                     not args.no_macosx, args.small_ratio, args.corrupt_ratio, args.seed)
+    print(f"已生成 {len(generated)} 个SN的数据: {path}")